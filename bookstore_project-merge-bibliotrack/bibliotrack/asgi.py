@@ -16,8 +16,15 @@ import chat.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bibliotrack.settings')
 
+http_application = get_asgi_application()
+
+# Load the models named in settings.MODEL_WARMUP now, so no request pays for it
+from books.model_registry import warm_up_from_settings  # noqa: E402
+
+warm_up_from_settings()
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": http_application,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             chat.routing.websocket_urlpatterns
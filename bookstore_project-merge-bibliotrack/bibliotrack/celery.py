@@ -0,0 +1,15 @@
+"""
+Celery application for the background tasks in recommendations/tasks.py.
+
+    celery -A bibliotrack worker -Q recs
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bibliotrack.settings")
+
+app = Celery("bibliotrack")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -94,6 +95,22 @@ CACHES = {
     }
 }
 
+# Background tasks (recommendations/tasks.py) run on Celery workers listening on
+# the "recs" queue. Eager mode (tasks run inside the request that queues them,
+# without retries) is the default only with DEBUG and no CELERY_BROKER_URL, which
+# is what the tests rely on; elsewhere it must be asked for with
+# CELERY_TASK_ALWAYS_EAGER. recommendations.tasks logs at startup when tasks
+# won't reach workers outside DEBUG.
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "memory://")
+CELERY_TASK_ALWAYS_EAGER = os.environ.get(
+    "CELERY_TASK_ALWAYS_EAGER", str(DEBUG and CELERY_BROKER_URL == "memory://")
+).lower() in ("1", "true", "yes")
+CELERY_TASK_DEFAULT_QUEUE = "default"
+CELERY_TASK_SERIALIZER = "json"
+CELERY_ACCEPT_CONTENT = ["json"]
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -158,3 +175,18 @@ RAZORPAY_KEY_SECRET = "your_razorpay_key_secret"
 # Media files
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+
+# Semantic search embedding snapshot (written by `manage.py build_semantic_snapshot`)
+SEMANTIC_SNAPSHOT_DIR = BASE_DIR / "var" / "semantic_snapshot"
+
+# Popularity leaderboards (recommendations/leaderboard.py): interaction weights decay with
+# the given half-life; the top list_size ids of each list are cached for list_timeout seconds
+LEADERBOARD = {
+    "half_life_days": float(os.environ.get("LEADERBOARD_HALF_LIFE_DAYS", 7)),
+    "list_size": 50,
+    "list_timeout": int(os.environ.get("LEADERBOARD_LIST_TIMEOUT", 300)),
+}
+
+# Models loaded at worker start by books.model_registry.warm_up_from_settings()
+# (comma-separated names, e.g. "all-MiniLM-L6-v2,resnet50"); others load on first use
+MODEL_WARMUP = [name for name in os.environ.get("MODEL_WARMUP", "").split(",") if name]
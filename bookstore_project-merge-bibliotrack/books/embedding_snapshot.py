@@ -0,0 +1,165 @@
+"""
+On-disk snapshot of catalog embeddings, shared by every worker process.
+
+`python manage.py build_semantic_snapshot` encodes the catalog once and writes
+a versioned directory:
+
+    <SEMANTIC_SNAPSHOT_DIR>/<version>/embeddings.npy   float32, L2-normalized rows
+    <SEMANTIC_SNAPSHOT_DIR>/<version>/ids.npy          int64 Book ids, row-aligned
+    <SEMANTIC_SNAPSHOT_DIR>/<version>/meta.json        model name, dim, count, created_at
+    <SEMANTIC_SNAPSHOT_DIR>/CURRENT                    name of the active version
+
+Workers open the matrix with np.load(mmap_mode='r'), so all of them share a
+single page-cached copy instead of re-encoding the catalog at import time.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+from django.conf import settings
+
+from .model_registry import SENTENCE_MODEL_NAME as MODEL_NAME
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = 'CURRENT'
+
+
+def get_snapshot_dir():
+    return os.fspath(getattr(settings, 'SEMANTIC_SNAPSHOT_DIR', os.path.join(settings.BASE_DIR, 'var', 'semantic_snapshot')))
+
+
+def book_text(book):
+    """Text representation that gets embedded for a book."""
+    return f"{book.title} {book.author} {book.description} {book.genre}"
+
+
+def normalize_rows(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def write_snapshot(ids, embeddings, model_name=MODEL_NAME, directory=None, keep=2):
+    """
+    Write a new snapshot version and atomically make it current.
+
+    Older versions beyond `keep` are removed; workers that still have one
+    mapped keep reading it until they reload (unlinked files stay valid).
+
+    Returns:
+        str: the new version name
+    """
+    directory = directory or get_snapshot_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    ids = np.asarray(ids, dtype=np.int64)
+    embeddings = normalize_rows(embeddings).reshape(len(ids), -1)
+    version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=directory)
+    try:
+        np.save(os.path.join(staging, 'embeddings.npy'), embeddings)
+        np.save(os.path.join(staging, 'ids.npy'), ids)
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump({
+                'version': version,
+                'model': model_name,
+                'dim': int(embeddings.shape[1]),
+                'count': int(len(ids)),
+                'created_at': datetime.now(timezone.utc).isoformat(),
+            }, f)
+        os.rename(staging, os.path.join(directory, version))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(directory, f'.{CURRENT_FILE}.tmp')
+    with open(pointer, 'w') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+
+    _prune(directory, keep)
+    logger.info(f"Wrote semantic embedding snapshot {version} with {len(ids)} vectors")
+    return version
+
+
+def _prune(directory, keep):
+    versions = sorted(
+        name for name in os.listdir(directory)
+        if not name.startswith('.') and os.path.isdir(os.path.join(directory, name))
+    )
+    for name in versions[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def current_version(directory=None):
+    """Name of the active snapshot version, or None if no snapshot exists."""
+    try:
+        with open(os.path.join(directory or get_snapshot_dir(), CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class EmbeddingSnapshot:
+    """A loaded snapshot: memory-mapped embedding matrix plus row-aligned ids."""
+
+    def __init__(self, version, embeddings, ids, meta):
+        self.version = version
+        self.embeddings = embeddings
+        self.ids = ids
+        self.meta = meta
+        self._row_index = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows_for(self, book_ids):
+        """Row of each book id in the matrix (-1 for ids not in this snapshot)."""
+        if self._row_index is None:
+            self._row_index = {int(book_id): row for row, book_id in enumerate(self.ids)}
+        return np.array([self._row_index.get(int(book_id), -1) for book_id in book_ids], dtype=np.int64)
+
+    def search(self, query_embedding, limit=20):
+        """
+        Return (book_id, score) pairs for the rows most similar to the query.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if not len(self) or norm == 0 or query.shape[0] != self.embeddings.shape[1]:
+            return []
+        scores = self.embeddings @ (query / norm)
+        k = min(limit, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(self.ids[i]), float(scores[i])) for i in top]
+
+
+def load_snapshot(directory=None):
+    """Memory-map the current snapshot, or return None if there isn't a usable one."""
+    directory = directory or get_snapshot_dir()
+    version = current_version(directory)
+    if version is None:
+        return None
+    path = os.path.join(directory, version)
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        embeddings = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r')
+        ids = np.load(os.path.join(path, 'ids.npy'))
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to load semantic embedding snapshot {version}: {e}")
+        return None
+    if len(ids) != embeddings.shape[0]:
+        logger.error(f"Semantic embedding snapshot {version} is inconsistent; ignoring it")
+        return None
+    return EmbeddingSnapshot(version, embeddings, ids, meta)
@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from books.models import Book
+from books.embedding_snapshot import MODEL_NAME, book_text, get_snapshot_dir, write_snapshot
+from books.model_registry import get_sentence_transformer
+
+
+class Command(BaseCommand):
+    help = 'Encode the catalog once and write a memory-mappable embedding snapshot for the semantic search workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=256,
+            help='Number of books encoded per batch (default: 256)',
+        )
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=2,
+            help='Number of snapshot versions to keep on disk (default: 2)',
+        )
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Snapshot directory (default: settings.SEMANTIC_SNAPSHOT_DIR)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        model = get_sentence_transformer()
+        if model is None:
+            raise CommandError(f'Could not load the {MODEL_NAME} model')
+
+        ids, chunks, texts = [], [], []
+        books = Book.objects.only('id', 'title', 'author', 'description', 'genre').order_by('id')
+        for book in books.iterator(chunk_size=2000):
+            ids.append(book.id)
+            texts.append(book_text(book))
+            if len(texts) >= batch_size:
+                chunks.append(model.encode(texts, batch_size=batch_size, show_progress_bar=False))
+                texts = []
+        if texts:
+            chunks.append(model.encode(texts, batch_size=batch_size, show_progress_bar=False))
+
+        if not ids:
+            raise CommandError('No books to encode; snapshot not written')
+
+        version = write_snapshot(
+            ids,
+            np.vstack(chunks),
+            model_name=MODEL_NAME,
+            directory=options['output'] or get_snapshot_dir(),
+            keep=options['keep'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Wrote snapshot {version} with {len(ids)} books in {elapsed:.1f}s'
+            )
+        )
@@ -0,0 +1,74 @@
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# "import time:       412 |       1630 |     django.db.models"
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+# Runs in a fresh interpreter so nothing is already in sys.modules
+PROBE = (
+    'import importlib, sys, django\n'
+    'django.setup()\n'
+    'for name in sys.argv[1:]:\n'
+    '    importlib.import_module(name)\n'
+)
+
+
+class Command(BaseCommand):
+    help = 'Report a per-module import-time breakdown of a cold worker start (aggregated python -X importtime)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*', help='Modules to import after django.setup() (default: settings.ROOT_URLCONF, which pulls in every view)')
+        parser.add_argument('--top', type=int, default=25, help='Number of rows to show (default: 25)')
+        parser.add_argument('--by', choices=['package', 'module'], default='package', help='Aggregate self time per top-level package or list single modules (default: package)')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+        started = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE, *(options['modules'] or [settings.ROOT_URLCONF])],
+            capture_output=True, text=True, env=env, cwd=os.getcwd(),
+        )
+        elapsed = time.perf_counter() - started
+
+        rows = []
+        other = []
+        for line in proc.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                rows.append((match.group(4), int(match.group(1)), int(match.group(2))))
+            elif not line.startswith('import time:'):
+                other.append(line)
+        if proc.returncode != 0:
+            raise CommandError('Import failed:\n' + '\n'.join(other[-20:]))
+
+        total_self = sum(self_us for _, self_us, _ in rows)
+        if options['by'] == 'package':
+            totals = defaultdict(lambda: [0, 0])
+            for name, self_us, _ in rows:
+                entry = totals[name.split('.')[0]]
+                entry[0] += self_us
+                entry[1] += 1
+            ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+            self.stdout.write(f'{"package":<40} {"self ms":>10} {"share":>7} {"modules":>8}')
+            for name, (self_us, count) in ranked[:options['top']]:
+                share = self_us / total_self if total_self else 0.0
+                self.stdout.write(f'{name:<40} {self_us / 1000:>10.1f} {share:>7.1%} {count:>8}')
+        else:
+            ranked = sorted(rows, key=lambda row: row[1], reverse=True)
+            self.stdout.write(f'{"module":<50} {"self ms":>10} {"cumulative ms":>14}')
+            for name, self_us, cumulative_us in ranked[:options['top']]:
+                self.stdout.write(f'{name:<50} {self_us / 1000:>10.1f} {cumulative_us / 1000:>14.1f}')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{len(rows)} modules imported in {total_self / 1e6:.2f}s of import time '
+                f'({elapsed:.2f}s wall clock for the cold interpreter)'
+            )
+        )
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-17 03:20
+
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    """FTS5 table and triggers on SQLite, a tsvector column and GIN index on PostgreSQL."""
+    from books import text_search
+
+    text_search.install(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from books import text_search
+
+    text_search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
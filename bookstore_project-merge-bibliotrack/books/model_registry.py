@@ -0,0 +1,164 @@
+"""
+Process-wide registry of heavy ML models.
+
+Every model is a lazy, thread-safe singleton keyed by name: the first caller
+loads it (others wait on a per-model lock), later callers get the same
+instance. Nothing is loaded at import time. Worker processes can pay the
+load cost up front with warm_up(), which wsgi.py/asgi.py call for the names
+listed in settings.MODEL_WARMUP.
+
+memory_report() lists what is loaded, how long each load took and how much
+memory it accounts for (parameter bytes, plus the RSS growth seen while loading).
+"""
+
+import os
+import threading
+import time
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_MODEL_NAME = 'all-MiniLM-L6-v2'
+RESNET_MODEL_NAME = 'resnet50'
+
+# Seconds before a failed load is retried (avoids re-trying a missing package on every request)
+RETRY_AFTER_FAILURE = 60
+
+
+def _current_rss():
+    """Resident set size of this process in bytes, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaders = {}
+        self._models = {}
+        self._stats = {}
+        self._model_locks = {}
+        self._failed_at = {}
+
+    def register(self, name, loader, size_of=None):
+        """Register a zero-argument loader (and optional parameter-size function) under name."""
+        with self._lock:
+            self._loaders[name] = (loader, size_of)
+            self._model_locks.setdefault(name, threading.Lock())
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def get(self, name):
+        """Return the model registered under name, loading it on first use; None if it can't be loaded."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self._loaders:
+            raise KeyError(f"No model registered under {name!r}")
+
+        with self._model_locks[name]:
+            model = self._models.get(name)
+            if model is not None:
+                return model
+            failed_at = self._failed_at.get(name)
+            if failed_at is not None and time.monotonic() - failed_at < RETRY_AFTER_FAILURE:
+                return None
+
+            loader, size_of = self._loaders[name]
+            rss_before = _current_rss()
+            started = time.perf_counter()
+            try:
+                model = loader()
+            except Exception as e:
+                self._failed_at[name] = time.monotonic()
+                logger.error(f"Failed to load model {name}: {e}")
+                return None
+            load_seconds = time.perf_counter() - started
+            rss_after = _current_rss()
+
+            param_bytes = None
+            if size_of is not None:
+                try:
+                    param_bytes = int(size_of(model))
+                except Exception:
+                    param_bytes = None
+            self._stats[name] = {
+                'load_seconds': load_seconds,
+                'param_bytes': param_bytes,
+                'rss_delta_bytes': rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+            }
+            self._failed_at.pop(name, None)
+            self._models[name] = model
+            logger.info(f"Loaded model {name} in {load_seconds:.2f}s")
+            return model
+
+    def warm_up(self, names=None):
+        """Load the given models (default: every registered one) now instead of on first request."""
+        for name in names if names is not None else list(self._loaders):
+            if name not in self._loaders:
+                logger.warning(f"Cannot warm up unknown model {name!r}")
+                continue
+            self.get(name)
+        for line in self.memory_report():
+            logger.info(f"Model registry: {line}")
+
+    def unload(self, name):
+        """Drop a loaded model so the next get() reloads it."""
+        with self._model_locks.get(name, self._lock):
+            self._models.pop(name, None)
+            self._stats.pop(name, None)
+
+    def memory_report(self):
+        """One dict per registered model: name, loaded, load_seconds, param_bytes, rss_delta_bytes."""
+        return [
+            {'name': name, 'loaded': name in self._models, **self._stats.get(name, {})}
+            for name in self._loaders
+        ]
+
+
+def _load_sentence_transformer():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(SENTENCE_MODEL_NAME)
+
+
+def _torch_param_bytes(model):
+    return sum(p.numel() * p.element_size() for p in model.parameters())
+
+
+def _load_resnet50():
+    import tensorflow as tf
+    from tensorflow.keras.applications import ResNet50
+    # ResNet50 without the top classification layer
+    base_model = ResNet50(weights='imagenet', include_top=False, pooling='avg')
+    return tf.keras.Model(inputs=base_model.input, outputs=base_model.output)
+
+
+def _keras_param_bytes(model):
+    return sum(int(w.numpy().nbytes) for w in model.weights)
+
+
+registry = ModelRegistry()
+registry.register(SENTENCE_MODEL_NAME, _load_sentence_transformer, size_of=_torch_param_bytes)
+registry.register(RESNET_MODEL_NAME, _load_resnet50, size_of=_keras_param_bytes)
+
+
+def get_model(name):
+    return registry.get(name)
+
+
+def get_sentence_transformer():
+    """The shared all-MiniLM-L6-v2 SentenceTransformer (None if unavailable)."""
+    return registry.get(SENTENCE_MODEL_NAME)
+
+
+def warm_up_from_settings():
+    """Worker-start hook: load the models named in settings.MODEL_WARMUP."""
+    names = getattr(settings, 'MODEL_WARMUP', [])
+    if names:
+        registry.warm_up(names)
@@ -1,60 +1,76 @@
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from django.db.models import Q
 from .models import Book
+from . import text_search
+from .model_registry import get_sentence_transformer
+from .embedding_snapshot import (
+    MODEL_NAME, EmbeddingSnapshot, book_text, current_version, load_snapshot, normalize_rows,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
 class SemanticSearchEngine:
     def __init__(self):
-        self.model = None
-        self.book_embeddings = {}
-        self.books_data = []
-        self._load_model()
+        self.snapshot = None
+        self._embeddings_loaded = False
+
+    @property
+    def model(self):
+        """The shared Sentence-BERT model (loaded on first use by the model registry)"""
+        return get_sentence_transformer()
+
+    def _load_embeddings(self):
+        """Map the shared on-disk snapshot, or encode the catalog in-process if there is none"""
+        self._embeddings_loaded = True
+        snapshot = load_snapshot()
+        if snapshot is not None:
+            self.snapshot = snapshot
+            logger.info(f"Loaded semantic embedding snapshot {snapshot.version} ({len(snapshot)} books)")
+            return
+        logger.warning("No semantic embedding snapshot found; run 'manage.py build_semantic_snapshot'")
         self._precompute_embeddings()
 
-    def _load_model(self):
-        """Load the Sentence-BERT model"""
-        try:
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
-            logger.info("Sentence-BERT model loaded successfully for semantic search")
-        except Exception as e:
-            logger.error(f"Failed to load Sentence-BERT model: {e}")
-            self.model = None
-
     def _precompute_embeddings(self):
-        """Precompute embeddings for all books"""
+        """Precompute embeddings for all books (used when no snapshot is available)"""
         if not self.model:
             return
 
         try:
-            books = Book.objects.all()
-            self.books_data = list(books)
+            books = list(Book.objects.only('id', 'title', 'author', 'description', 'genre'))
 
-            if not self.books_data:
+            if not books:
                 logger.warning("No books found for semantic search")
                 return
 
-            # Create text representations for each book
-            book_texts = []
-            for book in self.books_data:
-                text = f"{book.title} {book.author} {book.description} {book.genre}"
-                book_texts.append(text)
+            embeddings = self.model.encode([book_text(book) for book in books], show_progress_bar=False)
+            ids = np.array([book.id for book in books], dtype=np.int64)
+            self.snapshot = EmbeddingSnapshot(None, normalize_rows(embeddings), ids, {'model': MODEL_NAME})
 
-            # Compute embeddings
-            embeddings = self.model.encode(book_texts, show_progress_bar=False)
-            self.book_embeddings = dict(zip([b.id for b in self.books_data], embeddings))
-
-            logger.info(f"Precomputed embeddings for {len(self.books_data)} books")
+            logger.info(f"Precomputed embeddings for {len(books)} books")
 
         except Exception as e:
             logger.error(f"Error precomputing embeddings: {e}")
 
+    def _reload_if_stale(self):
+        """Pick up a snapshot written by build_semantic_snapshot since this worker loaded"""
+        version = current_version()
+        if version is not None and (self.snapshot is None or self.snapshot.version != version):
+            snapshot = load_snapshot()
+            if snapshot is not None:
+                self.snapshot = snapshot
+
+    def get_snapshot(self):
+        """The current catalog embedding snapshot (loaded on first use), or None"""
+        if not self._embeddings_loaded:
+            # Deferred from __init__ so importing this module stays cheap
+            self._load_embeddings()
+        self._reload_if_stale()
+        return self.snapshot
+
     def search(self, query, limit=20):
         """Perform semantic search for the given query"""
-        if not self.model or not self.book_embeddings:
+        snapshot = self.get_snapshot()
+        if not self.model or snapshot is None or not len(snapshot):
             # Fallback to basic text search
             return self._fallback_search(query, limit)
 
@@ -62,18 +78,13 @@ class SemanticSearchEngine:
             # Encode the query
             query_embedding = self.model.encode([query])[0]
 
-            # Calculate similarities
-            similarities = {}
-            for book_id, book_embedding in self.book_embeddings.items():
-                similarity = cosine_similarity([query_embedding], [book_embedding])[0][0]
-                similarities[book_id] = similarity
-
-            # Sort by similarity and get top results
-            sorted_results = sorted(similarities.items(), key=lambda x: x[1], reverse=True)
+            # Top results by cosine similarity against the (normalized) snapshot
+            ranked = snapshot.search(query_embedding, limit=limit)
+            books = Book.objects.in_bulk([book_id for book_id, _ in ranked])
 
             results = []
-            for book_id, score in sorted_results[:limit]:
-                book = next((b for b in self.books_data if b.id == book_id), None)
+            for book_id, score in ranked:
+                book = books.get(book_id)
                 if book:
                     results.append({
                         'book': book,
@@ -90,12 +101,8 @@ class SemanticSearchEngine:
     def _fallback_search(self, query, limit):
         """Fallback to basic text search if semantic search fails"""
         try:
-            books = Book.objects.filter(
-                Q(title__icontains=query) |
-                Q(author__icontains=query) |
-                Q(description__icontains=query) |
-                Q(genre__icontains=query)
-            )[:limit]
+            # Full-text index: any of the query words, ranked by BM25
+            books = text_search.search(Book.objects.all(), query, limit=limit, match_any=True)
 
             return [{
                 'book': book,
@@ -120,7 +127,8 @@ class SemanticSearchEngine:
 
     def refresh_embeddings(self):
         """Refresh embeddings when books are added/updated"""
-        self._precompute_embeddings()
+        self.snapshot = None
+        self._load_embeddings()
 
 # Global instance
 semantic_search_engine = SemanticSearchEngine()
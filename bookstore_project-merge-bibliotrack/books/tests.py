@@ -148,6 +148,24 @@ class SemanticSearchTest(TestCase):
         # This is more of a smoke test
         self.assertIsInstance(engine, SemanticSearchEngine)
 
+class EmbeddingSnapshotTest(TestCase):
+    def test_write_and_load_snapshot(self):
+        """Test that a written snapshot is memory-mapped back and searchable"""
+        import numpy as np
+        from .embedding_snapshot import load_snapshot, write_snapshot
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(load_snapshot(directory))
+            write_snapshot([10, 20], [[1.0, 0.0], [0.0, 2.0]], directory=directory)
+            version = write_snapshot([10, 20, 30], [[1.0, 0.0], [0.0, 2.0], [1.0, 1.0]], directory=directory, keep=1)
+
+            snapshot = load_snapshot(directory)
+            self.assertEqual(snapshot.version, version)
+            self.assertIsInstance(snapshot.embeddings, np.memmap)
+            self.assertEqual(len(snapshot), 3)
+            self.assertEqual([book_id for book_id, _ in snapshot.search([0.0, 1.0], limit=2)], [20, 30])
+            # Only the newest version is kept
+            self.assertEqual(len([name for name in os.listdir(directory) if name != 'CURRENT']), 1)
+
 class VisualSearchTest(TestCase):
     def setUp(self):
         self.book = Book.objects.create(
@@ -313,3 +331,32 @@ class ExportTest(TestCase):
         content = response.content.decode('utf-8')
         self.assertIn('exportuser', content)
         self.assertIn('19.99', content)
+
+
+class TextSearchTest(TestCase):
+    def setUp(self):
+        self.hobbit = Book.objects.create(title="The Hobbit", author="J.R.R. Tolkien", isbn="9780000000001",
+                                          genre="fantasy", price=10, description="A journey to the Lonely Mountain")
+        self.silmarillion = Book.objects.create(title="The Silmarillion", author="J.R.R. Tolkien", isbn="9780000000002",
+                                                genre="fantasy", price=10, description="Tales of hobbits' ancestors")
+        self.dune = Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780000000003",
+                                        genre="sci-fi", price=10)
+
+    def test_book_list_ranks_prefix_matches(self):
+        response = self.client.get(reverse('book_list'), {'search': 'hobb'})
+        self.assertEqual(list(response.context['page_obj']), [self.hobbit, self.silmarillion])
+
+    def test_sort_applies_to_mixed_text_and_semantic_results(self):
+        from unittest.mock import patch
+
+        Book.objects.filter(pk=self.hobbit.pk).update(price=30)
+        with patch('books.views.semantic_search_engine') as engine:
+            engine.search.return_value = [{'book': self.dune, 'similarity': 0.5}]
+            response = self.client.get(reverse('book_list'), {'search': 'hobb', 'sort': 'price_low'})
+            self.assertEqual(list(response.context['page_obj']), [self.silmarillion, self.dune, self.hobbit])
+            response = self.client.get(reverse('book_list'), {'search': 'hobb'})
+            self.assertEqual(list(response.context['page_obj']), [self.hobbit, self.silmarillion, self.dune])
+
+    def test_semantic_fallback_uses_index(self):
+        results = SemanticSearchEngine()._fallback_search('herbert mountain', limit=5)
+        self.assertEqual([result['book'] for result in results], [self.dune, self.hobbit])
@@ -0,0 +1,201 @@
+"""
+Full-text search over the catalog.
+
+One API over two database backends:
+
+  SQLite      an FTS5 virtual table per searched table (external content, so
+              the text is not stored twice), kept in sync by INSERT/UPDATE/DELETE
+              triggers and ranked with bm25() using the column weights below.
+  PostgreSQL  a generated tsvector column with a GIN index, ranked with
+              ts_rank_cd() (PostgreSQL has no built-in BM25); the column weights
+              map to the tsvector weights A-D.
+
+Every word of a query is a prefix, so "tolk hobb" finds "Tolkien - The Hobbit".
+By default all words must match; match_any=True ranks documents matching any
+of them (more matches rank higher). On other databases the search falls back
+to icontains over the same columns, without ranking.
+
+The index objects are created by migration 0002_text_search. Django rebuilds a
+SQLite table (dropping its triggers) for some schema changes, so migrations
+that alter books_book are followed by `python manage.py rebuild_search_index`,
+which reinstalls and refills them.
+"""
+
+import logging
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+# table -> {column: weight}, most important first
+INDEXES = {
+    'books_book': {'title': 10.0, 'author': 6.0, 'genre': 3.0, 'publisher': 2.0, 'description': 1.0},
+}
+POSTGRES_CONFIG = 'english'
+POSTGRES_WEIGHT_LABELS = 'ABCD'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported(conn=None):
+    return (conn or connection).vendor in ('sqlite', 'postgresql')
+
+
+def _fts_table(table):
+    return f'{table}_fts'
+
+
+def _sqlite_statements(table, columns):
+    fts = _fts_table(table)
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{col}' for col in columns)
+    old = ', '.join(f'old.{col}' for col in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+    ]
+
+
+def _postgres_statements(table, columns):
+    labels = POSTGRES_WEIGHT_LABELS
+    vector = ' || '.join(
+        f"setweight(to_tsvector('{POSTGRES_CONFIG}', coalesce({col}, '')), '{labels[min(i, len(labels) - 1)]}')"
+        for i, col in enumerate(columns)
+    )
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({vector}) STORED",
+        f"CREATE INDEX IF NOT EXISTS {table}_search_vector_gin ON {table} USING GIN (search_vector)",
+    ]
+
+
+def install(conn=None, rebuild=True):
+    """Create the search index objects (idempotent); with rebuild, refill SQLite indexes from their tables."""
+    conn = conn or connection
+    if not is_supported(conn):
+        logger.info(f"No full-text index for the {conn.vendor} backend; text search uses icontains")
+        return
+    with conn.cursor() as cursor:
+        for table, weights in INDEXES.items():
+            if conn.vendor == 'sqlite':
+                for statement in _sqlite_statements(table, list(weights)):
+                    cursor.execute(statement)
+                if rebuild:
+                    cursor.execute(f"INSERT INTO {_fts_table(table)}({_fts_table(table)}) VALUES ('rebuild')")
+            else:
+                for statement in _postgres_statements(table, list(weights)):
+                    cursor.execute(statement)
+
+
+def uninstall(conn=None):
+    """Drop the search index objects."""
+    conn = conn or connection
+    if not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        for table in INDEXES:
+            fts = _fts_table(table)
+            if conn.vendor == 'sqlite':
+                for suffix in ('ai', 'ad', 'au'):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+                cursor.execute(f"DROP TABLE IF EXISTS {fts}")
+            else:
+                cursor.execute(f"DROP INDEX IF EXISTS {table}_search_vector_gin")
+                cursor.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
+
+
+def query_terms(query):
+    """The words of a query, lowercased (punctuation and search operators dropped)."""
+    return [word.lower() for word in _WORD_RE.findall(query or '')]
+
+
+def _match_expression(terms, match_any, vendor):
+    """The backend's query syntax for prefix matches of all (or any) of the terms."""
+    if vendor == 'sqlite':
+        return (' OR ' if match_any else ' ').join(f'"{term}"*' for term in terms)
+    return (' | ' if match_any else ' & ').join(f'{term}:*' for term in terms)
+
+
+def _match_sql(table):
+    """
+    SQL for the ids of the matching rows, and for the score of one row of table
+    (higher is better); both take the match expression as their only parameter.
+    """
+    if connection.vendor == 'sqlite':
+        fts = _fts_table(table)
+        weights = ', '.join(str(w) for w in INDEXES[table].values())
+        return (
+            f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s",
+            f"SELECT -bm25({fts}, {weights}) FROM {fts} WHERE {fts} MATCH %s AND {fts}.rowid = {table}.id",
+        )
+    return (
+        f"SELECT id FROM {table} WHERE search_vector @@ to_tsquery('{POSTGRES_CONFIG}', %s)",
+        f"ts_rank_cd({table}.search_vector, to_tsquery('{POSTGRES_CONFIG}', %s))",
+    )
+
+
+def search_ids(model, query, limit=None, match_any=False):
+    """
+    Ids of the rows of a searched model matching every word of query as a prefix
+    (any word with match_any), best first.
+
+    Returns:
+        list: (id, score) pairs, higher scores are better; [] on unsupported backends
+    """
+    terms = query_terms(query)
+    table = model._meta.db_table
+    if not terms or table not in INDEXES or not is_supported():
+        return []
+    ids_sql, score_sql = _match_sql(table)
+    match = _match_expression(terms, match_any, connection.vendor)
+    sql = f"SELECT id, ({score_sql}) AS score FROM {table} WHERE id IN ({ids_sql}) ORDER BY score DESC, id"
+    params = [match, match]
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(row_id, float(score)) for row_id, score in cursor.fetchall()]
+
+
+def _icontains(model, query, match_any):
+    """Q over the indexed columns, for backends without a full-text index."""
+    columns = INDEXES.get(model._meta.db_table, {'title': 1.0})
+    terms = query_terms(query) or [query]
+    term_filters = [Q(*[Q(**{f'{col}__icontains': term}) for col in columns], _connector=Q.OR) for term in terms]
+    return Q(*term_filters, _connector=Q.OR if match_any else Q.AND)
+
+
+def search(queryset, query, limit=None, match_any=False):
+    """
+    Narrow a queryset to the rows matching query, ordered best first.
+
+    Matching, ranking and any slicing or pagination of the result all run in
+    the database: the queryset gets an id IN (full-text query) filter and a
+    search_rank annotation. Further filters can be applied to the result; a
+    later order_by() replaces the relevance order.
+    """
+    model = queryset.model
+    table = model._meta.db_table
+    terms = query_terms(query)
+    if not is_supported() or table not in INDEXES:
+        matches = queryset.filter(_icontains(model, query, match_any))
+    elif not terms:
+        return queryset.none()
+    else:
+        ids_sql, score_sql = _match_sql(table)
+        match = _match_expression(terms, match_any, connection.vendor)
+        matches = queryset.filter(pk__in=RawSQL(ids_sql, [match]))\
+            .annotate(search_rank=RawSQL(score_sql, [match], output_field=FloatField()))\
+            .order_by('-search_rank', 'pk')
+    return matches[:limit] if limit is not None else matches
@@ -7,17 +7,32 @@ from django.http import JsonResponse, HttpResponse
 from django.views.decorators.http import require_POST
 from .models import Book, Review, Wishlist
 from .forms import BookForm, ReviewForm, VisualSearchForm
-from .visual_search import visual_search_engine
-from .semantic_search import semantic_search_engine
-from recommendations.recommendation_engine import recommendation_engine
 from orders.models import Cart, Order, OrderItem
 from accounts.models import User
+from recommendations.leaderboard import top_books
+from recommendations.recommendation_engine import recommendation_engine
+from .semantic_search import semantic_search_engine
+from . import text_search
 import csv
+from operator import attrgetter
 from django.contrib.admin.views.decorators import staff_member_required
+from importlib import import_module
+from django.utils.functional import SimpleLazyObject
 import logging
 
 logger = logging.getLogger(__name__)
 
+# The visual search engine pulls in cv2 and sklearn; import it on first use so
+# catalog pages are served without waiting on the ML stack
+visual_search_engine = SimpleLazyObject(lambda: import_module('books.visual_search').visual_search_engine)
+
+SORT_ORDERINGS = {
+    'price_low': 'price',
+    'price_high': '-price',
+    'rating': '-average_rating',
+    'newest': '-created_at',
+}
+
 def book_list(request):
     books = Book.objects.all()
     genre = request.GET.get('genre')
@@ -30,12 +45,8 @@ def book_list(request):
         books = books.filter(genre=genre)
 
     if search:
-        # First try exact/partial text search
-        text_books = books.filter(
-            Q(title__icontains=search) |
-            Q(author__icontains=search) |
-            Q(description__icontains=search)
-        )
+        # First try the full-text index (prefix matches, best first)
+        text_books = text_search.search(books, search)
 
         # If text search returns few results (< 3), try semantic search
         if text_books.count() < 3:
@@ -52,16 +63,15 @@ def book_list(request):
         else:
             books = text_books
 
-    if sort == 'price_low':
-        books = books.order_by('price')
-    elif sort == 'price_high':
-        books = books.order_by('-price')
-    elif sort == 'rating':
-        books = books.order_by('-average_rating')
-    elif sort == 'newest':
-        books = books.order_by('-created_at')
-    else:
-        books = books.order_by(sort)
+    # Search results keep their relevance order unless a sort was asked for
+    if 'sort' in request.GET or not search:
+        ordering = SORT_ORDERINGS.get(sort, sort)
+        if isinstance(books, list):
+            # Mixed text + semantic results are sorted in Python; unknown sorts keep relevance order
+            if sort in SORT_ORDERINGS:
+                books.sort(key=attrgetter(ordering.lstrip('-')), reverse=ordering.startswith('-'))
+        else:
+            books = books.order_by(ordering)
 
     # Handle pagination
     if isinstance(books, list):
@@ -186,7 +196,8 @@ def admin_dashboard(request):
     # Book statistics
     total_books = Book.objects.count()
     books_by_genre = Book.objects.values('genre').annotate(count=Count('id')).order_by('-count')
-    top_rated_books = Book.objects.filter(average_rating__gt=0).order_by('-average_rating')[:10]
+    # Reviews are 1-5 stars, so rated books average at least 1
+    top_rated_books = top_books('top_rated', limit=10, min_rating=1)
     recent_books = Book.objects.order_by('-created_at')[:10]
 
     # User statistics
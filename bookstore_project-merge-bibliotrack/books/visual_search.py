@@ -1,33 +1,22 @@
 import os
 import numpy as np
 import cv2
-import tensorflow as tf
-from tensorflow.keras.applications import ResNet50
-from tensorflow.keras.applications.resnet50 import preprocess_input
-from tensorflow.keras.preprocessing import image
 from sklearn.metrics.pairwise import cosine_similarity
 from django.conf import settings
 from .models import Book
+from .model_registry import RESNET_MODEL_NAME, get_model
 import logging
 
 logger = logging.getLogger(__name__)
 
 class VisualSearchEngine:
     def __init__(self):
-        self.model = None
         self.feature_cache = {}
-        self._load_model()
 
-    def _load_model(self):
-        """Load the pre-trained ResNet50 model for feature extraction"""
-        try:
-            # Load ResNet50 without the top classification layer
-            base_model = ResNet50(weights='imagenet', include_top=False, pooling='avg')
-            self.model = tf.keras.Model(inputs=base_model.input, outputs=base_model.output)
-            logger.info("ResNet50 model loaded successfully for visual search")
-        except Exception as e:
-            logger.error(f"Failed to load ResNet50 model: {e}")
-            self.model = None
+    @property
+    def model(self):
+        """The shared ResNet50 feature extractor (loaded on first use by the model registry)"""
+        return get_model(RESNET_MODEL_NAME)
 
     def extract_features(self, image_path):
         """Extract features from an image using ResNet50"""
@@ -35,6 +24,9 @@ class VisualSearchEngine:
             return None
 
         try:
+            from tensorflow.keras.applications.resnet50 import preprocess_input
+            from tensorflow.keras.preprocessing import image
+
             # Load and preprocess the image
             img = image.load_img(image_path, target_size=(224, 224))
             img_array = image.img_to_array(img)
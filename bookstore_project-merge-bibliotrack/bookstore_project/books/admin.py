@@ -48,16 +48,35 @@ class ChatMessageAdmin(admin.ModelAdmin):
     list_display = ('user', 'message', 'created_at')
     search_fields = ('user__username', 'message')
 
+class ModerationFeedbackMixin:
+    """Admin actions that confirm a moderation verdict and feed it to the online moderation model."""
+    actions = ['confirm_toxic', 'confirm_clean']
+
+    def _confirm(self, request, queryset, toxic):
+        from .moderation_queue import confirm_labels
+        version = confirm_labels(queryset.model, queryset, toxic)
+        label = 'toxic' if toxic else 'clean'
+        suffix = f' (moderation model v{version})' if version is not None else ''
+        self.message_user(request, f'Marked {queryset.count()} entries as {label}{suffix}.')
+
+    @admin.action(description='Confirm as toxic and train the moderation model')
+    def confirm_toxic(self, request, queryset):
+        self._confirm(request, queryset, True)
+
+    @admin.action(description='Confirm as clean and train the moderation model')
+    def confirm_clean(self, request, queryset):
+        self._confirm(request, queryset, False)
+
 @admin.register(BookClubPost)
-class BookClubPostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'created_at', 'view_count', 'like_count', 'comment_count', 'is_pinned', 'is_moderated')
+class BookClubPostAdmin(ModerationFeedbackMixin, admin.ModelAdmin):
+    list_display = ('title', 'author', 'created_at', 'view_count', 'like_count', 'comment_count', 'is_pinned', 'is_moderated', 'moderation_reason')
     list_filter = ('is_pinned', 'is_moderated', 'created_at')
     search_fields = ('title', 'content', 'author__username')
     list_editable = ('is_pinned', 'is_moderated')
 
 @admin.register(BookClubComment)
-class BookClubCommentAdmin(admin.ModelAdmin):
-    list_display = ('author', 'post', 'content', 'created_at', 'like_count', 'is_moderated')
+class BookClubCommentAdmin(ModerationFeedbackMixin, admin.ModelAdmin):
+    list_display = ('author', 'post', 'content', 'created_at', 'like_count', 'is_moderated', 'moderation_reason')
     list_filter = ('is_moderated', 'created_at')
     search_fields = ('content', 'author__username', 'post__title')
     list_editable = ('is_moderated',)
@@ -1,8 +1,13 @@
+import hashlib
 import numpy as np
 import cv2
-import os
+import imagehash
+from io import BytesIO
 from PIL import Image
-from .models import Book, UserBook
+from .embedding_index import get_cover_descriptor_index, hydrate
+from .hamming_index import HASH_BITS, get_cover_hash_index
+from .visual_search import extract_features_from_image
+from django.conf import settings
 from django.core.cache import cache
 import logging
 
@@ -83,69 +88,155 @@ def cosine_similarity(a, b):
     norm_b = np.linalg.norm(b)
     return dot_product / (norm_a * norm_b) if norm_a != 0 and norm_b != 0 else 0
 
-def find_similar_books_advanced(uploaded_image, top_n=5):
+def cover_hash(img):
+    """64-bit perceptual hash of a PIL image, as the hex string stored in image_hash."""
+    return str(imagehash.phash(img))
+
+def extract_cover_signatures(data):
+    """
+    Compute every stored visual signature of a cover from its encoded bytes.
+    Safe to run in a worker process.
+
+    Returns:
+        dict: image_features, image_hash and cover_descriptor, or None if the image can't be decoded
+    """
+    try:
+        img = Image.open(BytesIO(data)).convert('RGB')
+    except (OSError, ValueError) as e:
+        logger.error(f"Error decoding cover image: {e}")
+        return None
+    descriptor = extract_advanced_features(img)
+    return {
+        'image_features': np.asarray(extract_features_from_image(img), dtype=np.float32),
+        'image_hash': cover_hash(img),
+        'cover_descriptor': None if descriptor is None else np.asarray(descriptor, dtype=np.float32),
+    }
+
+def _read_upload(uploaded_image):
+    """
+    Open an upload as an RGB PIL image and compute a stable digest of its content.
+
+    The digest covers the encoded bytes for files and paths (or the decoded
+    pixels for an in-memory PIL image), so identical uploads share cache entries.
+    """
+    if isinstance(uploaded_image, Image.Image):
+        img = uploaded_image.convert('RGB')
+        digest = hashlib.sha256(f"{img.size}".encode() + img.tobytes()).hexdigest()
+        return img, digest
+    if hasattr(uploaded_image, 'read'):  # File-like object
+        data = uploaded_image.read()
+        if hasattr(uploaded_image, 'seek'):
+            uploaded_image.seek(0)
+    else:  # Assume it's a path
+        with open(uploaded_image, 'rb') as f:
+            data = f.read()
+    return Image.open(BytesIO(data)).convert('RGB'), hashlib.sha256(data).hexdigest()
+
+def _rank_two_stage(image, query, top_n, candidates):
+    """(kind, id, score) results of the two-stage search, or [] if no covers are hashed."""
+    hash_index = get_cover_hash_index()
+    hash_index.ensure_built()
+    if not len(hash_index):
+        return []
+
+    shortlist = hash_index.nearest(cover_hash(image), max(candidates, top_n))
+    keys = [(kind, pk) for _, kind, pk in shortlist]
+    scores = np.array([1.0 - distance / HASH_BITS for distance, _, _ in shortlist], dtype=np.float32)
+
+    has_descriptor = np.zeros(len(keys), dtype=bool)
+    query_norm = np.linalg.norm(query) if query is not None else 0
+    if query_norm > 0:
+        # Candidate descriptors come straight from the (normalized) catalog matrix
+        descriptor_index = get_cover_descriptor_index()
+        descriptor_index.ensure_built()
+        backend = descriptor_index.backend
+        vectors = [backend.get_vector(key) if backend is not None else None for key in keys]
+        rows = [i for i, vector in enumerate(vectors) if vector is not None and len(vector) == len(query)]
+        if rows:
+            scores[rows] = np.vstack([vectors[i] for i in rows]) @ (query / query_norm)
+            has_descriptor[rows] = True
+
+    # Cosine and hash similarities are not on one scale: descriptor matches rank first
+    order = np.lexsort((-scores, ~has_descriptor))[:top_n]
+    return [(keys[i][0], keys[i][1], float(scores[i])) for i in order]
+
+def _rank_exhaustive(query, top_n):
+    """(kind, id, score) results of scoring the whole catalog descriptor matrix in one pass."""
+    if query is None:
+        return []
+    descriptor_index = get_cover_descriptor_index()
+    descriptor_index.ensure_built()
+    return descriptor_index.search(query, top_n=top_n)
+
+def find_similar_books_two_stage(image, top_n=5, candidates=None):
+    """
+    Two-stage visual search.
+
+    Stage one takes the `candidates` covers whose perceptual hash is closest
+    in Hamming distance (multi-index hashing, see books/hamming_index.py).
+    Stage two re-ranks only those by cosine similarity of the cover
+    descriptor. Candidates without a stored descriptor follow them, ranked
+    by hash similarity (1 - distance / 64), which is not comparable to a
+    cosine score.
+
+    Args:
+        image: PIL Image (RGB)
+
+    Returns:
+        list: List of (book, similarity_score) tuples; empty if no covers are hashed
+    """
+    candidates = candidates or getattr(settings, 'VISUAL_SEARCH', {}).get('candidates', 200)
+    query = extract_advanced_features(image)
+    if query is not None:
+        query = np.asarray(query, dtype=np.float32)
+    return hydrate(_rank_two_stage(image, query, top_n, candidates))
+
+def find_similar_books_advanced(uploaded_image, top_n=5, mode=None):
     """
     Find visually similar books using advanced feature extraction.
 
     Args:
-        uploaded_image: PIL Image or file path
+        uploaded_image: PIL Image, file-like object or file path
         top_n: Number of top results to return
+        mode: 'two_stage' or 'exhaustive' (default: settings.VISUAL_SEARCH['mode'])
 
     Returns:
         list: List of (book, similarity_score) tuples
     """
     try:
-        # Extract features from uploaded image
-        if hasattr(uploaded_image, 'read'):  # File-like object
-            img = Image.open(uploaded_image)
-            uploaded_features = extract_advanced_features(img)
-        else:  # Assume it's a path or PIL Image
-            uploaded_features = extract_advanced_features(uploaded_image)
-
-        if uploaded_features is None:
-            logger.warning("Could not extract features from uploaded image")
-            return []
-
-        uploaded_features = np.array(uploaded_features)
-
-        # Use caching for book features
-        cache_key = f"advanced_visual_search_{hash(str(uploaded_features[:10]))}_{top_n}"
-        cached_results = cache.get(cache_key)
-        if cached_results:
-            return cached_results
-
-        similarities = []
-
-        # Compare with Book model
-        books_with_features = Book.objects.exclude(image_features__isnull=True)
-        for book in books_with_features:
-            try:
-                book_features = np.array(book.image_features)
-                similarity = cosine_similarity(uploaded_features, book_features)
-                similarities.append((book, similarity))
-            except (ValueError, TypeError) as e:
-                logger.error(f"Error comparing with book {book.id}: {e}")
-                continue
-
-        # Compare with UserBook model
-        user_books_with_features = UserBook.objects.filter(is_available=True).exclude(image_features__isnull=True)
-        for user_book in user_books_with_features:
-            try:
-                book_features = np.array(user_book.image_features)
-                similarity = cosine_similarity(uploaded_features, book_features)
-                similarities.append((user_book, similarity))
-            except (ValueError, TypeError) as e:
-                logger.error(f"Error comparing with user_book {user_book.id}: {e}")
-                continue
-
-        # Sort by similarity (higher is better)
-        similarities.sort(key=lambda x: x[1], reverse=True)
-
-        # Cache results
-        results = similarities[:top_n]
-        cache.set(cache_key, results, 60 * 30)  # Cache for 30 minutes
-
-        logger.info(f"Advanced visual search found {len(results)} results")
+        config = getattr(settings, 'VISUAL_SEARCH', {})
+        mode = mode or config.get('mode', 'two_stage')
+        image, digest = _read_upload(uploaded_image)
+
+        # Results are cached per upload content and catalog version; a change to
+        # any indexed cover publishes a new stamp, so stale results are never served
+        descriptor_index = get_cover_descriptor_index()
+        hash_index = get_cover_hash_index()
+        descriptor_index.ensure_built()
+        hash_index.ensure_built()
+        version = f"{descriptor_index.stamp}:{hash_index.stamp}"
+        cache_key = "advanced_visual_search_" + hashlib.sha256(
+            f"{digest}:{top_n}:{mode}:{version}".encode()
+        ).hexdigest()
+        ranked = cache.get(cache_key)
+
+        if ranked is None:
+            uploaded_features = extract_advanced_features(image)
+            if uploaded_features is None:
+                logger.warning("Could not extract features from uploaded image")
+                return []
+            query = np.asarray(uploaded_features, dtype=np.float32)
+
+            ranked = []
+            if mode == 'two_stage':
+                ranked = _rank_two_stage(image, query, top_n, config.get('candidates', 200))
+            if not ranked:
+                ranked = _rank_exhaustive(query, top_n)
+            # Cache (kind, id, score) tuples rather than pickled model instances
+            cache.set(cache_key, ranked, 60 * 30)  # Cache for 30 minutes
+
+        results = hydrate(ranked)
+        logger.info(f"Advanced visual search ({mode}) found {len(results)} results")
         return results
 
     except Exception as e:
@@ -1,44 +1,60 @@
 import pickle
 import os
-import math
-from collections import Counter
+import threading
+import numpy as np
 import pandas as pd
+from scipy import sparse
 from .models import Book
+import logging
 
-def cosine_similarity_manual(a, b):
-    """Compute cosine similarity between two vectors."""
-    dot_product = sum(x * y for x, y in zip(a, b))
-    norm_a = math.sqrt(sum(x ** 2 for x in a))
-    norm_b = math.sqrt(sum(y ** 2 for y in b))
-    return dot_product / (norm_a * norm_b) if norm_a != 0 and norm_b != 0 else 0
-
-def compute_tf_idf(documents):
-    """Compute TF-IDF vectors for a list of documents."""
-    # Tokenize documents (simple split for now, can be enhanced with nltk)
-    tokenized_docs = [doc.lower().split() for doc in documents]
-
-    # Compute document frequency
-    df = Counter()
-    for doc in tokenized_docs:
-        unique_words = set(doc)
-        for word in unique_words:
-            df[word] += 1
-
-    # Compute TF-IDF
-    tfidf_vectors = []
-    num_docs = len(documents)
-    for doc in tokenized_docs:
-        tf = Counter(doc)
-        tfidf_vector = {}
-        for word in tf:
-            tf_val = tf[word] / len(doc)
-            idf_val = math.log(num_docs / df[word])
-            tfidf_vector[word] = tf_val * idf_val
-        tfidf_vectors.append(tfidf_vector)
-
-    return tfidf_vectors
+logger = logging.getLogger(__name__)
 
 MODEL_PATH = 'store/ai_models/model.pkl'
+MODEL_FORMAT_VERSION = 2
+CATEGORY_BOOST = 1.5  # similarity multiplier for books in the same category
+
+
+def build_tfidf_matrix(documents):
+    """
+    TF-IDF rows for whitespace-tokenized, lowercased documents.
+
+    Returns:
+        csr_matrix: float32, one L2-normalized row per document
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(lowercase=True, tokenizer=str.split, token_pattern=None, dtype=np.float32)
+    return vectorizer.fit_transform(documents).tocsr()
+
+
+def _model_from_legacy(model_data):
+    """Convert a format-1 artifact (per-book {term: weight} dicts) into the sparse layout."""
+    vocabulary = {}
+    rows, cols, vals = [], [], []
+    for row, vector in enumerate(model_data['tfidf_vectors']):
+        for term, weight in vector.items():
+            rows.append(row)
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+            vals.append(weight)
+    matrix = sparse.csr_matrix(
+        (np.asarray(vals, dtype=np.float32), (rows, cols)),
+        shape=(len(model_data['book_ids']), len(vocabulary)),
+    )
+    return _make_model(matrix, model_data['book_ids'], model_data['categories'])
+
+
+def _make_model(matrix, book_ids, categories):
+    from sklearn.preprocessing import normalize
+
+    category_names, category_codes = np.unique(np.asarray(categories, dtype=object).astype(str), return_inverse=True)
+    return {
+        'version': MODEL_FORMAT_VERSION,
+        'tfidf': normalize(sparse.csr_matrix(matrix, dtype=np.float32)),
+        'book_ids': np.asarray(book_ids, dtype=np.int64),
+        'category_codes': category_codes.astype(np.int32),
+        'category_names': category_names.tolist(),
+    }
+
 
 def train_recommendation_model():
     """Train and save the recommendation model based on book categories and authors."""
@@ -49,90 +65,97 @@ def train_recommendation_model():
     df = pd.DataFrame(books)
     df['features'] = df['category'] + ' ' + df['genre'] + ' ' + df['author']
 
-    # Compute TF-IDF manually
-    documents = df['features'].tolist()
-    tfidf_vectors = compute_tf_idf(documents)
-
-    # Simple clustering replacement: group by category for now (can be enhanced)
-    categories = df['category'].tolist()
-    unique_categories = list(set(categories))
-    category_clusters = {cat: i for i, cat in enumerate(unique_categories)}
-
-    model_data = {
-        'tfidf_vectors': tfidf_vectors,
-        'book_ids': df['id'].tolist(),
-        'features': df['features'].tolist(),
-        'categories': categories,
-        'category_clusters': category_clusters
-    }
+    model_data = _make_model(build_tfidf_matrix(df['features'].tolist()), df['id'].tolist(), df['category'].tolist())
 
+    # Write to a temporary file and rename, so readers never see a partial artifact
     os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-    with open(MODEL_PATH, 'wb') as f:
+    staging = f"{MODEL_PATH}.{os.getpid()}.tmp"
+    with open(staging, 'wb') as f:
         pickle.dump(model_data, f)
+    os.replace(staging, MODEL_PATH)
 
-def get_recommendations(book_id, top_n=5):
-    """Get book recommendations based on category, author, and genre similarity."""
-    from django.core.cache import cache
-    import logging
-    logger = logging.getLogger(__name__)
 
-    # Try to get recommendations from cache first
-    cache_key = f'book_recommendations_{book_id}'
-    cached_recommendations = cache.get(cache_key)
-    if cached_recommendations:
-        return cached_recommendations
+class _ModelCache:
+    """Process-level copy of the trained model, reloaded only when the artifact changes on disk."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.signature = None
+        self.model = None
 
-    if not os.path.exists(MODEL_PATH):
+    def get(self, path=None):
+        path = path or MODEL_PATH
         try:
-            train_recommendation_model()
-        except Exception as e:
-            logger.error(f"Failed to train recommendation model: {e}")
-            default_recommendations = Book.objects.all()[:top_n]
-            cache.set(cache_key, default_recommendations, 60 * 30)  # Cache for 30 minutes
-            return default_recommendations
+            stat = os.stat(path)
+        except OSError:
+            return None
+        signature = (path, stat.st_mtime_ns, stat.st_size)
+        if signature == self.signature:
+            return self.model
+        with self._lock:
+            if signature != self.signature:
+                with open(path, 'rb') as f:
+                    model_data = pickle.load(f)
+                if model_data.get('version') != MODEL_FORMAT_VERSION:
+                    model_data = _model_from_legacy(model_data)
+                model_data['index'] = {int(book_id): row for row, book_id in enumerate(model_data['book_ids'])}
+                self.model, self.signature = model_data, signature
+                logger.info(f"Loaded recommendation model from {path} ({len(model_data['book_ids'])} books)")
+        return self.model
+
+
+model_cache = _ModelCache()
+
+
+def score_similar_books(model_data, book_id, top_n=5):
+    """
+    Rank books by TF-IDF cosine similarity to book_id, boosting same-category books.
+
+    Returns:
+        list: (book_id, score) pairs, best first; [] if the book is not in the model
+    """
+    row = model_data['index'].get(book_id)
+    if row is None or top_n <= 0:
+        return []
+    tfidf = model_data['tfidf']
+    scores = np.asarray((tfidf @ tfidf[row].T).todense(), dtype=np.float32).ravel()
+    categories = model_data['category_codes']
+    scores *= np.where(categories == categories[row], CATEGORY_BOOST, 1.0).astype(np.float32)
+    scores[row] = -np.inf
+
+    k = min(top_n, len(scores) - 1)
+    if k <= 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    book_ids = model_data['book_ids']
+    return [(int(book_ids[i]), float(scores[i])) for i in top]
 
+
+def get_recommendations(book_id, top_n=5):
+    """Get book recommendations based on category, author, and genre similarity."""
+    model_data = None
     try:
-        with open(MODEL_PATH, 'rb') as f:
-            model_data = pickle.load(f)
+        model_data = model_cache.get()
+        if model_data is None:
+            train_recommendation_model()
+            model_data = model_cache.get()
+    except Exception as e:
+        logger.error(f"Failed to load recommendation model: {e}")
 
-        tfidf_vectors = model_data['tfidf_vectors']
-        book_ids = model_data['book_ids']
-        features = model_data['features']
-        categories = model_data['categories']
-        category_clusters = model_data['category_clusters']
+    if model_data is None:
+        return list(Book.objects.all()[:top_n])
 
-        if book_id not in book_ids:
+    try:
+        book_id = int(book_id)
+        if book_id not in model_data['index']:
             logger.warning(f"Book ID {book_id} not found in trained model")
-            default_recommendations = Book.objects.all()[:top_n]
-            cache.set(cache_key, default_recommendations, 60 * 30)
-            return default_recommendations
-
-        book_index = book_ids.index(book_id)
-        book_category = categories[book_index]
-        book_vector = tfidf_vectors[book_index]
-
-        # Find similar books by cosine similarity
-        similarities = []
-        for i, (other_id, other_vector, other_category) in enumerate(zip(book_ids, tfidf_vectors, categories)):
-            if other_id == book_id:
-                continue
-            # Boost similarity if same category
-            similarity = cosine_similarity_manual(list(book_vector.values()), list(other_vector.values()))
-            if other_category == book_category:
-                similarity *= 1.5  # Boost for same category
-            similarities.append((other_id, similarity))
-
-        # Sort by similarity and get top recommendations
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        recommended_ids = [book_id for book_id, sim in similarities[:top_n]]
-        recommended_books = list(Book.objects.filter(id__in=recommended_ids))
-
-        # Cache the recommendations
-        cache.set(cache_key, recommended_books, 60 * 30)  # Cache for 30 minutes
-        return recommended_books
+            return list(Book.objects.all()[:top_n])
+
+        ranked = score_similar_books(model_data, book_id, top_n)
+        books = Book.objects.in_bulk([other_id for other_id, _ in ranked])
+        return [books[other_id] for other_id, _ in ranked if other_id in books]
 
     except Exception as e:
         logger.error(f"Error in recommendation system: {e}")
-        default_recommendations = Book.objects.all()[:top_n]
-        cache.set(cache_key, default_recommendations, 60 * 30)
-        return default_recommendations
+        return list(Book.objects.all()[:top_n])
@@ -0,0 +1,174 @@
+"""
+Approximate nearest-neighbour search for catalog embeddings.
+
+IVFIndex is a pure-NumPy inverted-file index: a spherical k-means coarse
+quantizer splits the catalog into `nlist` lists, and a query only scores the
+vectors in the `nprobe` lists whose centroids are closest. `nprobe` is the
+recall/latency knob (nprobe == nlist is exact search).
+"""
+
+import threading
+import logging
+
+import numpy as np
+
+from .embedding_index import FlatIndex, _normalize, _top_k
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per chunk when assigning vectors to centroids (bounds temp memory)
+ASSIGN_CHUNK_SIZE = 65536
+
+
+def default_nlist(n):
+    """Rule of thumb: about 4 * sqrt(N) lists."""
+    return max(1, int(4 * np.sqrt(n)))
+
+
+def assign_to_centroids(vectors, centroids):
+    """Index of the most similar centroid for each (normalized) vector."""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE):
+        chunk = vectors[start:start + ASSIGN_CHUNK_SIZE]
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def train_kmeans(vectors, k, n_iter=10, max_points_per_centroid=256, seed=0):
+    """
+    Spherical k-means on L2-normalized vectors.
+
+    Trains on at most k * max_points_per_centroid sampled rows, which is
+    plenty for a coarse quantizer and keeps training time bounded.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    if n > k * max_points_per_centroid:
+        sample = vectors[rng.choice(n, k * max_points_per_centroid, replace=False)]
+    else:
+        sample = vectors
+
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = assign_to_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty clusters with random points
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """Inverted-file index: k-means coarse quantizer plus one FlatIndex per list."""
+
+    def __init__(self, nlist=None, nprobe=8, n_iter=10, seed=0):
+        self._lock = threading.RLock()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.seed = seed
+        self._reset()
+
+    def _reset(self):
+        self.centroids = None
+        self.lists = []
+        self._list_of = {}
+
+    def __len__(self):
+        return len(self._list_of)
+
+    @property
+    def dim(self):
+        return 0 if self.centroids is None else self.centroids.shape[1]
+
+    def get_vector(self, key):
+        list_no = self._list_of.get(key)
+        return None if list_no is None else self.lists[list_no].get_vector(key)
+
+    def load(self, keys, vectors):
+        """Train the coarse quantizer on the vectors and fill the inverted lists."""
+        with self._lock:
+            self._reset()
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if vectors.ndim != 2 or not len(vectors):
+                return
+            vectors = _normalize(vectors)
+            nlist = max(1, min(self.nlist or default_nlist(len(vectors)), len(vectors)))
+            self.centroids = train_kmeans(vectors, nlist, n_iter=self.n_iter, seed=self.seed)
+            assignments = assign_to_centroids(vectors, self.centroids)
+
+            order = np.argsort(assignments, kind='stable')
+            boundaries = np.searchsorted(assignments[order], np.arange(nlist + 1))
+            for list_no in range(nlist):
+                rows = order[boundaries[list_no]:boundaries[list_no + 1]]
+                inverted_list = FlatIndex(initial_capacity=16)
+                inverted_list.load([keys[row] for row in rows], vectors[rows])
+                self.lists.append(inverted_list)
+            self._list_of = {key: int(assignments[row]) for row, key in enumerate(keys)}
+            logger.info(f"Trained IVF index with {nlist} lists over {len(vectors)} vectors")
+
+    def upsert(self, kind, pk, embedding):
+        """Insert or move one vector into the list of its nearest centroid."""
+        vector = _normalize(np.asarray(embedding, dtype=np.float32).reshape(1, -1))
+        key = (kind, pk)
+        with self._lock:
+            if self.centroids is None:
+                # Empty index: start with a single list seeded by this vector
+                self.centroids = vector.copy()
+                self.lists = [FlatIndex(initial_capacity=16)]
+            if vector.shape[1] != self.dim:
+                logger.warning(f"Ignoring embedding with dimension {vector.shape[1]} (index has {self.dim})")
+                return
+            list_no = int(np.argmax(self.centroids @ vector[0]))
+            previous = self._list_of.get(key)
+            if previous is not None and previous != list_no:
+                self.lists[previous].remove(kind, pk)
+            self.lists[list_no].upsert(kind, pk, vector[0])
+            self._list_of[key] = list_no
+
+    def remove(self, kind, pk):
+        with self._lock:
+            list_no = self._list_of.pop((kind, pk), None)
+            if list_no is not None:
+                self.lists[list_no].remove(kind, pk)
+
+    def search(self, query_embedding, top_n=10, nprobe=None, min_score=None):
+        """
+        Return the top_n most similar entries among the nprobe closest lists
+        (optionally only those scoring above min_score).
+
+        Returns:
+            list: (kind, id, score) tuples, best first
+        """
+        with self._lock:
+            if self.centroids is None or top_n <= 0:
+                return []
+            query = np.asarray(query_embedding, dtype=np.float32).ravel()
+            if query.shape[0] != self.dim:
+                logger.warning(f"Query dimension {query.shape[0]} does not match index dimension {self.dim}")
+                return []
+            norm = np.linalg.norm(query)
+            if norm == 0:
+                return []
+            query = query / norm
+
+            probe = _top_k(self.centroids @ query, nprobe or self.nprobe)
+            candidates = []
+            for list_no in probe:
+                candidates.extend(self.lists[list_no].search(query, top_n=top_n, min_score=min_score))
+
+        candidates.sort(key=lambda result: result[2], reverse=True)
+        return candidates[:top_n]
+
+
+def recall_at_k(exact_results, approx_results):
+    """Fraction of the exact top-k keys that the approximate search also returned."""
+    exact = {(kind, pk) for kind, pk, _ in exact_results}
+    if not exact:
+        return 1.0
+    approx = {(kind, pk) for kind, pk, _ in approx_results}
+    return len(exact & approx) / len(exact)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class BooksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "books"
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .tasks import check_eager_mode
+
+        check_eager_mode()
@@ -5,13 +5,13 @@ from nltk.stem import WordNetLemmatizer
 import re
 import random
 from .models import Book, Review, UserBook
-from django.db.models import Q
 import os
 import requests
 import json
 import logging
 import google.generativeai as genai
 from .semantic_search import semantic_search_books
+from . import text_search
 from .advanced_visual_search import find_similar_books_advanced
 
 logger = logging.getLogger(__name__)
@@ -188,42 +188,18 @@ class BookChatbot:
                 books = [book for book, score in semantic_results if hasattr(book, 'id')]
                 return books[:limit]
 
-        # Fallback to traditional search if semantic search fails
-        query = Q()
-
-        if keywords['genres']:
-            genre_query = Q()
-            for genre in keywords['genres']:
-                genre_query |= Q(genre__icontains=genre) | Q(category__icontains=genre)
-            query &= genre_query
-
-        if keywords['authors']:
-            author_query = Q()
-            for author in keywords['authors']:
-                author_query |= Q(author__icontains=author)
-            query &= author_query
-
-        if keywords['topics']:
-            topic_query = Q()
-            for topic in keywords['topics']:
-                topic_query |= Q(title__icontains=topic) | Q(description__icontains=topic)
-            query &= topic_query
-
-        # Search in both Book and UserBook models
-        books = list(Book.objects.filter(query).order_by('-rating')[:limit])
-        user_books = list(UserBook.objects.filter(query, is_available=True).order_by('-created_at')[:limit])
-
-        all_books = books + user_books
-
-        if not all_books:
-            # Fallback: search by title or general keywords
-            general_query = Q()
-            for token in keywords['tokens'][:3]:  # Use first 3 tokens
-                general_query |= Q(title__icontains=token) | Q(author__icontains=token)
-
-            books = list(Book.objects.filter(general_query).order_by('-rating')[:limit])
-            user_books = list(UserBook.objects.filter(general_query, is_available=True).order_by('-created_at')[:limit])
+        # Fallback to the full-text index (books matching more of the keywords rank
+        # higher), then to the first tokens of the message
+        all_books = []
+        for search_query in (' '.join(keywords['genres'] + keywords['authors'] + keywords['topics']),
+                             ' '.join(keywords['tokens'][:3])):
+            if not search_query:
+                continue
+            books = list(text_search.search(Book.objects.all(), search_query, match_any=True)[:limit])
+            user_books = list(text_search.search(UserBook.objects.filter(is_available=True), search_query, match_any=True)[:limit])
             all_books = books + user_books
+            if all_books:
+                break
 
         return all_books[:limit]
 
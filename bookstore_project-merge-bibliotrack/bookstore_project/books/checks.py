@@ -0,0 +1,23 @@
+"""
+Deployment checks (manage.py check --deploy) for settings the books app relies
+on when it runs in more than one process.
+"""
+
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The index stamps and task idempotency keys only reach other processes through a shared cache."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if not backend.endswith('LocMemCache'):
+        return []
+    return [
+        checks.Warning(
+            "The default cache is local to each process, so other web and worker processes "
+            "never see index invalidations or task idempotency keys.",
+            hint="Set CACHE_URL to a shared Redis (see CACHES in settings).",
+            id='books.W001',
+        )
+    ]
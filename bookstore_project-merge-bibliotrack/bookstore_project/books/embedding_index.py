@@ -0,0 +1,324 @@
+"""
+Process-level indexes of catalog vectors: Sentence-BERT embeddings for
+semantic search, and cover pixel features / cover descriptors for visual search.
+
+Holds every Book / available UserBook vector as pre-normalized float32
+vectors with parallel kind/id arrays, so a query is a matrix-vector product
+followed by an argpartition top-k instead of a Python loop over rows.
+
+The storage backend is pluggable (see settings.SEMANTIC_INDEX):
+  - 'flat': exact search over one contiguous matrix
+  - 'ivf':  approximate search over k-means inverted lists (books/ann_index.py)
+"""
+
+import threading
+import uuid
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KIND_BOOK = 0
+KIND_USER_BOOK = 1
+
+# Shared generation stamps: bumped on every catalog change so other worker
+# processes (with a shared cache backend) know their local copy is stale.
+INDEX_STAMP_CACHE_KEY = 'semantic_embedding_index_stamp'
+VISUAL_INDEX_STAMP_CACHE_KEY = 'visual_feature_index_stamp'
+DESCRIPTOR_INDEX_STAMP_CACHE_KEY = 'cover_descriptor_index_stamp'
+
+
+def _normalize(vectors):
+    """L2-normalize rows of a float32 matrix; zero rows stay zero."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+class FlatIndex:
+    """Exact cosine-similarity search over one contiguous float32 matrix."""
+
+    def __init__(self, initial_capacity=1024):
+        self._lock = threading.RLock()
+        self._initial_capacity = initial_capacity
+        self._reset(0)
+
+    def _reset(self, dim):
+        self.dim = dim
+        self._size = 0
+        self._matrix = np.zeros((self._initial_capacity if dim else 0, dim), dtype=np.float32)
+        self._kinds = np.zeros(self._matrix.shape[0], dtype=np.int8)
+        self._ids = np.zeros(self._matrix.shape[0], dtype=np.int64)
+        self._positions = {}
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def matrix(self):
+        return self._matrix[:self._size]
+
+    @property
+    def kinds(self):
+        return self._kinds[:self._size]
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    def get_vector(self, key):
+        """Return the stored (normalized) vector for a (kind, id) key, or None."""
+        row = self._positions.get(key)
+        return None if row is None else self._matrix[row]
+
+    def _grow(self, needed):
+        capacity = max(self._matrix.shape[0] * 2, needed, self._initial_capacity)
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        kinds = np.zeros(capacity, dtype=np.int8)
+        kinds[:self._size] = self._kinds[:self._size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._kinds, self._ids = matrix, kinds, ids
+
+    def load(self, keys, vectors):
+        """Replace the index contents with (kind, id) keys and their vectors."""
+        with self._lock:
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if vectors.ndim != 2 or not len(vectors):
+                self._reset(0)
+                return
+            self._reset(vectors.shape[1])
+            self._grow(len(vectors))
+            self._matrix[:len(vectors)] = _normalize(vectors)
+            for row, (kind, pk) in enumerate(keys):
+                self._kinds[row] = kind
+                self._ids[row] = pk
+                self._positions[(kind, pk)] = row
+            self._size = len(vectors)
+
+    def upsert(self, kind, pk, embedding):
+        """Insert or replace one vector."""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            if not self._size:
+                self._reset(vector.shape[1])
+            if vector.shape[1] != self.dim:
+                logger.warning(f"Ignoring embedding with dimension {vector.shape[1]} (index has {self.dim})")
+                return
+            row = self._positions.get((kind, pk))
+            if row is None:
+                if self._size == self._matrix.shape[0]:
+                    self._grow(self._size + 1)
+                row = self._size
+                self._size += 1
+                self._kinds[row] = kind
+                self._ids[row] = pk
+                self._positions[(kind, pk)] = row
+            self._matrix[row] = _normalize(vector)[0]
+
+    def remove(self, kind, pk):
+        """Remove one vector by moving the last row into its slot."""
+        with self._lock:
+            row = self._positions.pop((kind, pk), None)
+            if row is None:
+                return
+            last = self._size - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._kinds[row] = self._kinds[last]
+                self._ids[row] = self._ids[last]
+                self._positions[(int(self._kinds[row]), int(self._ids[row]))] = row
+            self._size = last
+
+    def search(self, query_embedding, top_n=10, min_score=None):
+        """
+        Return the top_n most similar entries, optionally only those scoring above min_score.
+
+        Returns:
+            list: (kind, id, score) tuples, best first
+        """
+        with self._lock:
+            if not self._size or top_n <= 0:
+                return []
+            query = np.asarray(query_embedding, dtype=np.float32).ravel()
+            if query.shape[0] != self.dim:
+                logger.warning(f"Query dimension {query.shape[0]} does not match index dimension {self.dim}")
+                return []
+            norm = np.linalg.norm(query)
+            if norm == 0:
+                return []
+            scores = self.matrix @ (query / norm)
+            if min_score is None:
+                top = _top_k(scores, top_n)
+            else:
+                candidates = np.flatnonzero(scores > min_score)
+                top = candidates[_top_k(scores[candidates], top_n)]
+            return [(int(self._kinds[i]), int(self._ids[i]), float(scores[i])) for i in top]
+
+
+def make_backend(name=None, **options):
+    """Instantiate an index backend by name ('flat' or 'ivf'), defaulting to settings.SEMANTIC_INDEX."""
+    config = dict(getattr(settings, 'SEMANTIC_INDEX', {}))
+    backend = name or config.get('backend', 'flat')
+    config.update(options)
+    if backend == 'flat':
+        return FlatIndex()
+    if backend == 'ivf':
+        from .ann_index import IVFIndex
+        return IVFIndex(nlist=config.get('nlist'), nprobe=config.get('nprobe', 8))
+    raise ValueError(f"Unknown semantic index backend: {backend}")
+
+
+class EmbeddingIndex:
+    """Catalog-wide vector index over one Book/UserBook field: loads from the database and follows model changes."""
+
+    def __init__(self, backend=None, field='semantic_embedding', stamp_key=INDEX_STAMP_CACHE_KEY):
+        self._lock = threading.RLock()
+        self._backend_name = backend
+        self.field = field
+        self.stamp_key = stamp_key
+        self.backend = None
+        self.is_built = False
+        self.stamp = None
+
+    def __len__(self):
+        return len(self.backend) if self.backend is not None else 0
+
+    def load_catalog(self):
+        """Read every searchable vector from the database as (keys, vectors)."""
+        from .models import Book, UserBook
+
+        keys, vectors = [], []
+        sources = (
+            (KIND_BOOK, Book.objects.all()),
+            (KIND_USER_BOOK, UserBook.objects.filter(is_available=True)),
+        )
+        dim = None
+        for kind, queryset in sources:
+            rows = queryset.exclude(**{f'{self.field}__isnull': True}).values_list('id', self.field)
+            for pk, embedding in rows.iterator(chunk_size=2000):
+                if not len(embedding):
+                    continue
+                if dim is None:
+                    dim = len(embedding)
+                if len(embedding) != dim:
+                    logger.warning(f"Skipping embedding with dimension {len(embedding)} (expected {dim}) for id {pk}")
+                    continue
+                keys.append((kind, pk))
+                vectors.append(embedding)
+        return keys, vectors
+
+    def build(self):
+        """Load every stored embedding from the database into a fresh backend."""
+        keys, vectors = self.load_catalog()
+        backend = make_backend(self._backend_name)
+        backend.load(keys, vectors)
+
+        with self._lock:
+            self.backend = backend
+            self.is_built = True
+            self.stamp = cache.get(self.stamp_key)
+        logger.info(f"Built {self.field} index with {len(keys)} vectors")
+
+    def ensure_built(self):
+        """Build lazily, and rebuild if another process changed the catalog."""
+        if not self.is_built or cache.get(self.stamp_key) != self.stamp:
+            self.build()
+
+    def apply_change(self, kind, pk, embedding=None):
+        """
+        Keep the index in sync with one saved/deleted row.
+
+        A None embedding removes the row. The signals call this (after commit)
+        only when the stored vector actually changed. A built, current copy is
+        patched in place; an unbuilt one has nothing to patch and a stale one is
+        rebuilt on next use. Either way the new stamp tells the other processes.
+        """
+        has_embedding = embedding is not None and len(embedding) > 0
+        with self._lock:
+            if self.is_built and cache.get(self.stamp_key) == self.stamp:
+                current = self.backend.get_vector((kind, pk))
+                if has_embedding:
+                    vector = _normalize(np.asarray(embedding, dtype=np.float32).reshape(1, -1))[0]
+                    if current is not None and np.array_equal(current, vector):
+                        return
+                    self.backend.upsert(kind, pk, embedding)
+                else:
+                    if current is None:
+                        return
+                    self.backend.remove(kind, pk)
+            elif self.is_built:
+                self.is_built = False
+            stamp = uuid.uuid4().hex
+            cache.set(self.stamp_key, stamp, None)
+            self.stamp = stamp
+
+    def invalidate(self):
+        """Mark every process's copy stale, e.g. after bulk_update() bypassed the signals."""
+        with self._lock:
+            self.is_built = False
+            stamp = uuid.uuid4().hex
+            cache.set(self.stamp_key, stamp, None)
+            self.stamp = stamp
+
+    def search(self, query_embedding, top_n=10, min_score=None):
+        """Return (kind, id, score) tuples for the top_n nearest catalog entries (scoring above min_score, if given)."""
+        backend = self.backend
+        if backend is None:
+            return []
+        return backend.search(query_embedding, top_n=top_n, min_score=min_score)
+
+
+def hydrate(results):
+    """Turn (kind, id, score) tuples into (Book/UserBook, score) tuples with one query per model."""
+    from .models import Book, UserBook
+
+    book_ids = [pk for kind, pk, _ in results if kind == KIND_BOOK]
+    user_book_ids = [pk for kind, pk, _ in results if kind == KIND_USER_BOOK]
+    objects = {
+        KIND_BOOK: Book.objects.in_bulk(book_ids) if book_ids else {},
+        KIND_USER_BOOK: UserBook.objects.in_bulk(user_book_ids) if user_book_ids else {},
+    }
+    hydrated = []
+    for kind, pk, score in results:
+        obj = objects[kind].get(pk)
+        if obj is not None:
+            hydrated.append((obj, score))
+    return hydrated
+
+
+_index = EmbeddingIndex()
+# Cover features are dense pixel vectors: always searched exactly
+_visual_index = EmbeddingIndex(backend='flat', field='image_features', stamp_key=VISUAL_INDEX_STAMP_CACHE_KEY)
+_descriptor_index = EmbeddingIndex(backend='flat', field='cover_descriptor', stamp_key=DESCRIPTOR_INDEX_STAMP_CACHE_KEY)
+
+
+def get_embedding_index():
+    """Return the process-wide embedding index (built on first use)."""
+    return _index
+
+
+def get_visual_feature_index():
+    """Return the process-wide image_features index (built on first use)."""
+    return _visual_index
+
+
+def get_cover_descriptor_index():
+    """Return the process-wide cover_descriptor index used by advanced visual search (built on first use)."""
+    return _descriptor_index
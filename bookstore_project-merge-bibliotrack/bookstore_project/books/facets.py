@@ -0,0 +1,174 @@
+"""
+Facet counts for filter dropdowns and sidebars.
+
+Keeps value -> count maps for the catalog (Book category, genre, author) and
+for available marketplace listings (UserBook category, condition) in process
+memory, so the lists cost no query per request.
+
+The maps are built with one GROUP BY per facet and then maintained
+incrementally from model signals (signals.py): once a save or delete commits,
+its +1/-1 changes are applied to this process's maps. A version counter in the
+cache tells processes apart: a process whose maps are exactly one version behind
+after its own change applies it in place, any other process rebuilds on next
+use. Maps are also rebuilt after INDEX_TIMEOUT seconds, for bulk_create() and
+queryset.update() which send no signals.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+INDEX_TIMEOUT = 60 * 10
+FACETS_VERSION_CACHE_KEY = 'facets_version'
+
+# facet name -> (model name, field)
+FACETS = {
+    'book_category': ('book', 'category'),
+    'book_genre': ('book', 'genre'),
+    'book_author': ('book', 'author'),
+    'listing_category': ('userbook', 'category'),
+    'listing_condition': ('userbook', 'condition'),
+}
+
+
+def _counted_rows(model_name):
+    """The rows a model's facets count: the whole catalog, but only available listings."""
+    from .models import Book, UserBook
+
+    if model_name == 'book':
+        return Book.objects.all()
+    return UserBook.objects.filter(is_available=True)
+
+
+def tracked_fields(model_name):
+    """The fields whose changes can move a row between facet values."""
+    fields = [field for model, field in FACETS.values() if model == model_name]
+    if model_name == 'userbook':
+        fields.append('is_available')
+    return fields
+
+
+def facet_values(model_name, row):
+    """
+    The facet values a row ({field: value}, see tracked_fields) is counted under.
+
+    Returns:
+        dict: {facet name: value}, empty for listings that are not available
+    """
+    if model_name == 'userbook' and not row['is_available']:
+        return {}
+    return {name: row[field] for name, (model, field) in FACETS.items() if model == model_name}
+
+
+def _build():
+    counts = {}
+    for name, (model_name, field) in FACETS.items():
+        rows = _counted_rows(model_name).values_list(field).annotate(n=Count('pk')).order_by()
+        counts[name] = Counter({value: n for value, n in rows if value})
+    return counts
+
+
+def _current_version():
+    # Random start, so a counter lost from the cache never matches maps built from the old one
+    cache.add(FACETS_VERSION_CACHE_KEY, random.randrange(1 << 30), None)
+    return cache.get(FACETS_VERSION_CACHE_KEY)
+
+
+def _next_version():
+    _current_version()  # the counter must exist before incr()
+    return cache.incr(FACETS_VERSION_CACHE_KEY)
+
+
+_index_lock = threading.Lock()
+_index_state = {'counts': None, 'built_at': 0.0, 'version': None}
+
+
+def _is_fresh(state, version):
+    return state['counts'] is not None and state['version'] == version and time.monotonic() - state['built_at'] < INDEX_TIMEOUT
+
+
+def _facet_counts():
+    version = _current_version()
+    if _is_fresh(_index_state, version):
+        return _index_state['counts']
+    with _index_lock:
+        if not _is_fresh(_index_state, version):
+            started = time.perf_counter()
+            counts = _build()
+            _index_state.update(counts=counts, built_at=time.monotonic(), version=version)
+            logger.info(f"Built facet counts in {time.perf_counter() - started:.2f}s")
+        return _index_state['counts']
+
+
+def counts(facet):
+    """
+    Value -> count map of a facet.
+
+    Returns:
+        dict: {value: count}, most common first
+    """
+    return dict(_facet_counts()[facet].most_common())
+
+
+def values(facet):
+    """The values of a facet, sorted."""
+    return sorted(_facet_counts()[facet])
+
+
+def choices(facet, labels=None):
+    """
+    (value, label, count) triples for a filter dropdown, sorted by label.
+
+    labels maps stored values to display names (e.g. a field's choices).
+    """
+    labels = dict(labels or {})
+    return sorted(
+        ((value, labels.get(value, value), count) for value, count in _facet_counts()[facet].items()),
+        key=lambda choice: str(choice[1]).lower(),
+    )
+
+
+def _apply(changes):
+    version = _next_version()
+    with _index_lock:
+        if _index_state['counts'] is None or _index_state['version'] != version - 1:
+            # Other processes changed the facets too: rebuild on next use
+            _index_state['counts'] = None
+            return
+        for (facet, value), delta in changes.items():
+            facet_counts = _index_state['counts'][facet]
+            facet_counts[value] += delta
+            if facet_counts[value] <= 0:
+                del facet_counts[value]
+        _index_state['version'] = version
+
+
+def record_change(old_values, new_values):
+    """
+    Queue the count changes of one save or delete ({facet: value} before and after)
+    to be applied when the current transaction commits.
+    """
+    changes = Counter()
+    for facet, value in old_values.items():
+        if value:
+            changes[(facet, value)] -= 1
+    for facet, value in new_values.items():
+        if value:
+            changes[(facet, value)] += 1
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if changes:
+        transaction.on_commit(lambda: _apply(changes))
+
+
+def invalidate_facets():
+    """Make every process rebuild its facet counts on next use."""
+    _next_version()
+    _index_state['counts'] = None
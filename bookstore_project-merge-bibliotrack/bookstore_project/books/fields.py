@@ -0,0 +1,125 @@
+"""
+Compact binary storage for embedding / feature vectors.
+
+A VectorField stores a 1-D vector as a small header followed by the raw
+little-endian values, instead of a JSON list of decimal floats:
+
+    b'V' | dtype code (1 byte) | dimension (uint32 LE) | values
+
+Values come back from the database as read-only numpy arrays (a zero-copy
+view of the column bytes for float32), so search code can stack them without
+parsing text.
+"""
+
+import struct
+from base64 import b64encode
+
+import numpy as np
+from django.core import checks, exceptions
+from django.db import models
+
+MAGIC = b'V'
+HEADER = struct.Struct('<cBI')
+
+# dtype code stored in the header -> numpy dtype
+DTYPES = {
+    1: np.dtype('<f4'),
+    2: np.dtype('<f2'),
+}
+DTYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+
+
+def encode_vector(value, dtype='float32'):
+    """Serialize a 1-D sequence of numbers into the VectorField byte format."""
+    dtype = np.dtype(dtype).newbyteorder('<')
+    array = np.asarray(value, dtype=dtype).ravel()
+    return HEADER.pack(MAGIC, DTYPE_CODES[dtype], array.shape[0]) + array.tobytes()
+
+
+def decode_vector(data):
+    """Deserialize VectorField bytes into a read-only 1-D numpy array."""
+    data = bytes(data) if isinstance(data, memoryview) else data
+    if len(data) < HEADER.size:
+        raise ValueError("Vector data is too short")
+    magic, code, dim = HEADER.unpack_from(data)
+    if magic != MAGIC or code not in DTYPES:
+        raise ValueError("Unrecognized vector header")
+    dtype = DTYPES[code]
+    if len(data) != HEADER.size + dim * dtype.itemsize:
+        raise ValueError(f"Vector data length does not match dimension {dim}")
+    array = np.frombuffer(data, dtype=dtype, count=dim, offset=HEADER.size)
+    if dtype != np.float32:
+        array = array.astype(np.float32)
+        array.flags.writeable = False
+    return array
+
+
+class VectorField(models.BinaryField):
+    """
+    Binary column holding a float32 (or float16) vector.
+
+    Accepts lists, tuples or numpy arrays on assignment; reads back as a
+    float32 numpy array. Use dtype='float16' to halve storage when the values
+    don't need full precision (e.g. pixel features in [0, 1]).
+    """
+
+    description = "Binary float vector"
+
+    def __init__(self, *args, dtype='float32', **kwargs):
+        self.dtype = dtype
+        super().__init__(*args, **kwargs)
+
+    def check(self, **kwargs):
+        errors = super().check(**kwargs)
+        try:
+            supported = np.dtype(self.dtype).newbyteorder('<') in DTYPE_CODES
+        except TypeError:
+            supported = False
+        if not supported:
+            errors.append(
+                checks.Error(
+                    f"VectorField dtype must be 'float32' or 'float16', not {self.dtype!r}.",
+                    obj=self,
+                    id='books.E001',
+                )
+            )
+        return errors
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.dtype != 'float32':
+            kwargs['dtype'] = self.dtype
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return decode_vector(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, np.ndarray):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return decode_vector(value)
+        if isinstance(value, str):
+            # Serialized form (dumpdata/loaddata): base64 of the stored bytes
+            return decode_vector(super().to_python(value))
+        try:
+            return np.asarray(value, dtype=np.float32).ravel()
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError(
+                "Enter a list of numbers.", code='invalid', params={'value': value}
+            )
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return value
+        return encode_vector(value, self.dtype)
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        if value is None:
+            return None
+        return b64encode(self.get_prep_value(value)).decode('ascii')
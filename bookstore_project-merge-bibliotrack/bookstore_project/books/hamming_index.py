@@ -0,0 +1,218 @@
+"""
+Hamming-distance index over 64-bit perceptual cover hashes (Book/UserBook.image_hash).
+
+MultiIndexHash splits each hash into `tables` substrings and keeps one
+exact-match table per substring. By the pigeonhole principle, two hashes
+within distance r agree to within r // tables bits on at least one
+substring, so a query only probes the few substring values near its own
+and verifies the resulting candidates with a popcount.
+
+This is stage one of the two-stage visual search: cheap candidate
+generation that stage two re-ranks with the richer cover descriptor.
+"""
+
+import threading
+import uuid
+import logging
+from collections import defaultdict
+from itertools import combinations
+
+import numpy as np
+from django.core.cache import cache
+
+from .embedding_index import KIND_BOOK, KIND_USER_BOOK
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+COVER_HASH_STAMP_CACHE_KEY = 'cover_hash_index_stamp'
+
+
+def hash_to_int(value):
+    """Parse an imagehash hex string (as stored in image_hash) into an int, or None."""
+    if not value:
+        return None
+    try:
+        return int(str(value), 16) & ((1 << HASH_BITS) - 1)
+    except ValueError:
+        return None
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """Multi-index hashing over fixed-width integer hashes, keyed by arbitrary hashable keys."""
+
+    def __init__(self, bits=HASH_BITS, tables=4, max_substring_radius=3):
+        self.bits = bits
+        self.tables = tables
+        self.substring_bits = bits // tables
+        self.max_substring_radius = max_substring_radius
+        self._mask = (1 << self.substring_bits) - 1
+        self._lock = threading.RLock()
+        self._tables = [defaultdict(set) for _ in range(tables)]
+        self._hashes = {}
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def get(self, key):
+        return self._hashes.get(key)
+
+    def _substrings(self, value):
+        return [(value >> (i * self.substring_bits)) & self._mask for i in range(self.tables)]
+
+    def _probes(self, substring, radius):
+        """Every substring value within `radius` bits of `substring`."""
+        yield substring
+        for r in range(1, radius + 1):
+            for positions in combinations(range(self.substring_bits), r):
+                flipped = substring
+                for position in positions:
+                    flipped ^= 1 << position
+                yield flipped
+
+    def add(self, key, value):
+        with self._lock:
+            self.remove(key)
+            self._hashes[key] = value
+            for table, substring in zip(self._tables, self._substrings(value)):
+                table[substring].add(key)
+
+    def remove(self, key):
+        with self._lock:
+            value = self._hashes.pop(key, None)
+            if value is None:
+                return
+            for table, substring in zip(self._tables, self._substrings(value)):
+                bucket = table.get(substring)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del table[substring]
+
+    def search(self, value, max_distance):
+        """
+        Return (distance, key) pairs for every stored hash within max_distance, nearest first.
+
+        Exact for max_distance < tables * (max_substring_radius + 1).
+        """
+        radius = min(max_distance // self.tables, self.max_substring_radius)
+        with self._lock:
+            candidates = set()
+            for table, substring in zip(self._tables, self._substrings(value)):
+                for probe in self._probes(substring, radius):
+                    bucket = table.get(probe)
+                    if bucket:
+                        candidates |= bucket
+            results = []
+            for key in candidates:
+                distance = hamming_distance(value, self._hashes[key])
+                if distance <= max_distance:
+                    results.append((distance, key))
+        results.sort(key=lambda result: result[0])
+        return results
+
+    def nearest(self, value, k):
+        """
+        Return the k nearest (distance, key) pairs.
+
+        Widens the probe radius until k hashes are found; if the probed
+        neighbourhood is still too sparse, falls back to a vectorized scan.
+        """
+        if k <= 0 or not self._hashes:
+            return []
+        for substring_radius in range(self.max_substring_radius + 1):
+            results = self.search(value, self.tables * (substring_radius + 1) - 1)
+            if len(results) >= k:
+                return results[:k]
+        return self._scan(value, k)
+
+    def _scan(self, value, k):
+        with self._lock:
+            keys = list(self._hashes)
+            hashes = np.fromiter(self._hashes.values(), dtype=np.uint64, count=len(keys))
+        xor = np.bitwise_xor(hashes, np.uint64(value))
+        distances = np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        order = np.argsort(distances, kind='stable')[:k]
+        return [(int(distances[i]), keys[i]) for i in order]
+
+
+class CoverHashIndex:
+    """Process-level MultiIndexHash over catalog cover hashes, kept in sync like EmbeddingIndex."""
+
+    def __init__(self, stamp_key=COVER_HASH_STAMP_CACHE_KEY):
+        self._lock = threading.RLock()
+        self.stamp_key = stamp_key
+        self.index = MultiIndexHash()
+        self.is_built = False
+        self.stamp = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def build(self):
+        from .models import Book, UserBook
+
+        index = MultiIndexHash()
+        sources = (
+            (KIND_BOOK, Book.objects.all()),
+            (KIND_USER_BOOK, UserBook.objects.filter(is_available=True)),
+        )
+        for kind, queryset in sources:
+            rows = queryset.exclude(image_hash__isnull=True).exclude(image_hash='').values_list('id', 'image_hash')
+            for pk, image_hash in rows.iterator(chunk_size=2000):
+                value = hash_to_int(image_hash)
+                if value is not None:
+                    index.add((kind, pk), value)
+
+        with self._lock:
+            self.index = index
+            self.is_built = True
+            self.stamp = cache.get(self.stamp_key)
+        logger.info(f"Built cover hash index with {len(index)} hashes")
+
+    def ensure_built(self):
+        if not self.is_built or cache.get(self.stamp_key) != self.stamp:
+            self.build()
+
+    def apply_change(self, kind, pk, image_hash=None):
+        """Keep the index in sync with one saved/deleted row (None removes it)."""
+        value = hash_to_int(image_hash)
+        with self._lock:
+            if self.is_built and cache.get(self.stamp_key) == self.stamp:
+                if self.index.get((kind, pk)) == value:
+                    return
+                if value is None:
+                    self.index.remove((kind, pk))
+                else:
+                    self.index.add((kind, pk), value)
+            elif self.is_built:
+                self.is_built = False
+            stamp = uuid.uuid4().hex
+            cache.set(self.stamp_key, stamp, None)
+            self.stamp = stamp
+
+    def invalidate(self):
+        with self._lock:
+            self.is_built = False
+            stamp = uuid.uuid4().hex
+            cache.set(self.stamp_key, stamp, None)
+            self.stamp = stamp
+
+    def nearest(self, image_hash, k):
+        """Return (distance, kind, id) for the k catalog covers closest to image_hash."""
+        value = hash_to_int(image_hash) if isinstance(image_hash, str) else image_hash
+        if value is None:
+            return []
+        return [(distance, kind, pk) for distance, (kind, pk) in self.index.nearest(value, k)]
+
+
+_cover_hash_index = CoverHashIndex()
+
+
+def get_cover_hash_index():
+    """Return the process-wide cover hash index (built on first use)."""
+    return _cover_hash_index
@@ -1,40 +1,195 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_squared_error
+from scipy import sparse
 from .models import Book, Review, Order, UserProfile, UserBook
-from django.db.models import Avg, Count
+from django.conf import settings
 from django.core.cache import cache
 import logging
-from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 
+ITEM_NEIGHBOURS = 50  # top-k similar items kept per item
+SIMILARITY_BLOCK_SIZE = 2048  # items per block when computing item-item similarity
+CONTENT_NEIGHBOURS = 50  # top-k content neighbours kept per item
+SIMILARITY_CHUNK_SIZE = 512  # rows per block of the content similarity computation
+MODEL_TIMEOUT = 60 * 30  # rebuild the in-process model after 30 minutes
+MODEL_STAMP_CACHE_KEY = 'recommendation_model_stamp'
+
+KIND_BOOK = 0
+KIND_USER_BOOK = 1
+
+
+def item_key(kind, pk):
+    """Public item id used throughout this module ('book_<id>' / 'user_book_<id>')."""
+    return f"book_{pk}" if kind == KIND_BOOK else f"user_book_{pk}"
+
+
 def build_user_item_matrix():
-    """Build user-item interaction matrix for collaborative filtering."""
-    # Get all orders (purchases)
-    orders = Order.objects.filter(status__in=['delivered', 'confirmed']).select_related('user', 'book', 'user_book')
-
-    # Create user-item matrix
-    user_item_data = defaultdict(lambda: defaultdict(float))
-
-    for order in orders:
-        user_id = order.user.id
-        if order.book:
-            item_id = f"book_{order.book.id}"
-            user_item_data[user_id][item_id] = 1.0  # Purchased
-        elif order.user_book:
-            item_id = f"user_book_{order.user_book.id}"
-            user_item_data[user_id][item_id] = 1.0
-
-    # Convert to DataFrame
-    if user_item_data:
-        df = pd.DataFrame.from_dict(user_item_data, orient='index').fillna(0)
-        return df
-    return pd.DataFrame()
+    """
+    Build the sparse user-item purchase matrix for collaborative filtering.
+
+    Returns:
+        tuple: (csr_matrix users x items with 1.0 per purchased item,
+                {user_id: row}, [item id per column])
+    """
+    rows = Order.objects.filter(
+        status__in=['delivered', 'confirmed']
+    ).values_list('user_id', 'book_id', 'user_book_id')
+
+    user_ids, kinds, pks = [], [], []
+    for user_id, book_id, user_book_id in rows.iterator(chunk_size=10000):
+        if book_id is not None:
+            user_ids.append(user_id)
+            kinds.append(KIND_BOOK)
+            pks.append(book_id)
+        elif user_book_id is not None:
+            user_ids.append(user_id)
+            kinds.append(KIND_USER_BOOK)
+            pks.append(user_book_id)
+
+    if not user_ids:
+        return sparse.csr_matrix((0, 0), dtype=np.float32), {}, []
+
+    users, user_rows = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+    # One integer key per (kind, id) so both item kinds share a column space
+    keys = np.asarray(pks, dtype=np.int64) * 2 + np.asarray(kinds, dtype=np.int64)
+    items, item_cols = np.unique(keys, return_inverse=True)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(keys), dtype=np.float32), (user_rows, item_cols)),
+        shape=(len(users), len(items)),
+    )
+    # Repeat purchases are summed by the constructor; the signal is "purchased"
+    matrix.data[:] = 1.0
+
+    user_index = {int(user_id): row for row, user_id in enumerate(users)}
+    item_ids = [item_key(int(key % 2), int(key // 2)) for key in items]
+    return matrix, user_index, item_ids
+
+
+def compute_item_similarity(matrix, k=ITEM_NEIGHBOURS, block_size=SIMILARITY_BLOCK_SIZE):
+    """
+    Item-item cosine similarity over the purchase columns, keeping the top k per item.
+
+    Computed a block of items at a time as sparse products, so only
+    block_size rows of the items x items similarity exist at once.
+
+    Returns:
+        csr_matrix: items x items, at most k non-zeros per row, no self-similarity
+    """
+    n_items = matrix.shape[1]
+    if not n_items:
+        return sparse.csr_matrix((0, 0), dtype=np.float32)
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    normalized = sparse.csc_matrix(matrix.multiply(1.0 / norms).astype(np.float32))
+    normalized_t = normalized.T.tocsr()
+
+    indptr = [0]
+    indices, data = [], []
+    for start in range(0, n_items, block_size):
+        block = (normalized_t[start:start + block_size] @ normalized).tocsr()
+        # Drop self-similarity: block row r is item start + r
+        rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+        block.data[block.indices == start + rows] = 0
+        block.eliminate_zeros()
+        for row in range(block.shape[0]):
+            lo, hi = block.indptr[row], block.indptr[row + 1]
+            cols, vals = block.indices[lo:hi], block.data[lo:hi]
+            if len(vals) > k:
+                top = np.argpartition(-vals, k - 1)[:k]
+                cols, vals = cols[top], vals[top]
+            indices.append(cols)
+            data.append(vals)
+            indptr.append(indptr[-1] + len(cols))
+
+    return sparse.csr_matrix(
+        (np.concatenate(data).astype(np.float32), np.concatenate(indices), np.asarray(indptr)),
+        shape=(n_items, n_items),
+    )
+
+
+class CollaborativeModel:
+    """Sparse purchase matrix plus precomputed item-item neighbours."""
+
+    def __init__(self, matrix, user_index, item_ids, item_similarity):
+        self.matrix = matrix
+        self.user_index = user_index
+        self.item_ids = item_ids
+        self.item_similarity = item_similarity
+
+    @classmethod
+    def build(cls, k=ITEM_NEIGHBOURS):
+        matrix, user_index, item_ids = build_user_item_matrix()
+        return cls(matrix, user_index, item_ids, compute_item_similarity(matrix, k=k))
+
+    def recommend(self, user_id, top_n=10):
+        """
+        Score unseen items for a user with one sparse row x item-similarity product.
+
+        Returns:
+            list: (item id, score) pairs, best first
+        """
+        row = self.user_index.get(user_id)
+        if row is None or top_n <= 0:
+            return []
+        purchased = self.matrix[row]
+        scores = np.asarray((purchased @ self.item_similarity).todense()).ravel()
+        scores[purchased.indices] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return []
+        if len(candidates) > top_n:
+            candidates = candidates[np.argpartition(-scores[candidates], top_n - 1)[:top_n]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self.item_ids[i], float(scores[i])) for i in candidates]
+
+
+_model_lock = threading.Lock()
+_model_state = {'model': None, 'built_at': 0.0, 'stamp': None}
+
+
+def get_recommendation_model(workers=1):
+    """
+    Process-level recommendation model, rebuilt after MODEL_TIMEOUT or when another
+    process publishes a new stamp (train_recommendation_model).
+
+    Kept in process memory rather than the Django cache, so requests never
+    unpickle the matrices.
+    """
+    stamp = cache.get(MODEL_STAMP_CACHE_KEY)
+    state = _model_state
+    if state['model'] is not None and state['stamp'] == stamp and time.monotonic() - state['built_at'] < MODEL_TIMEOUT:
+        return state['model']
+    with _model_lock:
+        if state['model'] is not None and state['stamp'] == stamp and time.monotonic() - state['built_at'] < MODEL_TIMEOUT:
+            return state['model']
+        content_df = build_content_features()
+        if content_df.empty:
+            content_neighbours, item_ids = sparse.csr_matrix((0, 0), dtype=np.float32), []
+        else:
+            content_neighbours, item_ids = calculate_content_similarity(content_df, workers=workers)
+        model = {
+            'collaborative': CollaborativeModel.build(),
+            'content_df': content_df,
+            'content_neighbours': content_neighbours,
+            'item_ids': item_ids,
+            'item_index': {item: i for i, item in enumerate(item_ids)},
+        }
+        state.update(model=model, built_at=time.monotonic(), stamp=stamp)
+        return model
+
+
+def invalidate_recommendation_model():
+    """Make every process rebuild its recommendation model on next use."""
+    cache.set(MODEL_STAMP_CACHE_KEY, uuid.uuid4().hex, None)
+    _model_state['model'] = None
+
 
 def build_content_features():
     """Build content-based features for books."""
@@ -73,8 +228,70 @@ def build_content_features():
 
     return pd.DataFrame(features)
 
-def calculate_content_similarity(content_df):
-    """Calculate content similarity matrix using TF-IDF and cosine similarity."""
+def _top_k_rows(matrix, start, stop, k):
+    """Top-k cosine neighbours of rows start:stop of an L2-normalized sparse matrix."""
+    scores = (matrix[start:stop] @ matrix.T).toarray().astype(np.float32, copy=False)
+    # Never return an item as its own neighbour
+    scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+    k = min(k, scores.shape[1] - 1)
+    if k <= 0:
+        empty = np.empty((stop - start, 0))
+        return empty.astype(np.int32), empty.astype(np.float32)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return top.astype(np.int32), np.take_along_axis(scores, top, axis=1)
+
+
+_worker_matrix = None
+
+
+def _init_similarity_worker(matrix):
+    global _worker_matrix
+    _worker_matrix = matrix
+
+
+def _top_k_rows_in_worker(start, stop, k):
+    return _top_k_rows(_worker_matrix, start, stop, k)
+
+
+def top_k_neighbours(matrix, k=CONTENT_NEIGHBOURS, chunk_size=SIMILARITY_CHUNK_SIZE, workers=1):
+    """
+    Top-k cosine neighbours for every row of an L2-normalized sparse matrix.
+
+    Rows are multiplied against the whole matrix chunk_size at a time, so at
+    most a chunk_size x N block of scores exists at once (never the full N x N).
+    With workers > 1 the chunks run in a process pool.
+
+    Returns:
+        csr_matrix: N x N, at most k non-zeros per row (positive scores only)
+    """
+    n = matrix.shape[0]
+    if not n:
+        return sparse.csr_matrix((0, 0), dtype=np.float32)
+    matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+    bounds = [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+
+    if workers > 1 and len(bounds) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_similarity_worker, initargs=(matrix,)) as pool:
+            blocks = list(pool.map(_top_k_rows_in_worker, *zip(*bounds), [k] * len(bounds)))
+    else:
+        blocks = [_top_k_rows(matrix, start, stop, k) for start, stop in bounds]
+
+    columns = np.vstack([cols for cols, _ in blocks])
+    values = np.vstack([vals for _, vals in blocks])
+    rows = np.repeat(np.arange(n), columns.shape[1])
+    keep = values.ravel() > 0
+    return sparse.csr_matrix(
+        (values.ravel()[keep], (rows[keep], columns.ravel()[keep])), shape=(n, n), dtype=np.float32,
+    )
+
+
+def calculate_content_similarity(content_df, k=CONTENT_NEIGHBOURS, chunk_size=SIMILARITY_CHUNK_SIZE, workers=1):
+    """
+    Content neighbours from TF-IDF cosine similarity.
+
+    Returns:
+        tuple: (csr_matrix of the top-k neighbours per item, [item id per row])
+    """
     from sklearn.feature_extraction.text import TfidfVectorizer
 
     # Combine text features
@@ -83,73 +300,40 @@ def calculate_content_similarity(content_df):
         axis=1
     )
 
-    # TF-IDF vectorization
-    tfidf = TfidfVectorizer(stop_words='english', max_features=5000)
+    # TF-IDF vectorization (rows are L2-normalized, so dot products are cosines)
+    tfidf = TfidfVectorizer(stop_words='english', max_features=5000, dtype=np.float32)
     tfidf_matrix = tfidf.fit_transform(content_df['combined_text'])
 
-    # Calculate cosine similarity
-    similarity_matrix = cosine_similarity(tfidf_matrix)
-
-    return similarity_matrix, content_df['id'].tolist()
+    neighbours = top_k_neighbours(tfidf_matrix, k=k, chunk_size=chunk_size, workers=workers)
+    return neighbours, content_df['id'].tolist()
 
 def hybrid_recommendation(user_id, book_id=None, top_n=10):
     """Generate hybrid recommendations combining collaborative and content-based filtering."""
     try:
-        # Get cached matrices
-        cache_key = 'recommendation_matrices'
-        cached_data = cache.get(cache_key)
-
-        if cached_data is None:
-            # Build matrices
-            user_item_df = build_user_item_matrix()
-            content_df = build_content_features()
-            similarity_matrix, item_ids = calculate_content_similarity(content_df)
-
-            cached_data = {
-                'user_item_df': user_item_df,
-                'content_df': content_df,
-                'similarity_matrix': similarity_matrix,
-                'item_ids': item_ids
-            }
-            cache.set(cache_key, cached_data, 60 * 30)  # Cache for 30 minutes
-        else:
-            user_item_df = cached_data['user_item_df']
-            content_df = cached_data['content_df']
-            similarity_matrix = cached_data['similarity_matrix']
-            item_ids = cached_data['item_ids']
+        model = get_recommendation_model()
+        item_ids = model['item_ids']
 
         recommendations = []
 
-        # Collaborative filtering component
-        if user_id in user_item_df.index and not user_item_df.empty:
-            user_ratings = user_item_df.loc[user_id]
-            similar_users = user_item_df.corrwith(user_ratings).sort_values(ascending=False).dropna()
-
-            # Get recommendations from similar users
-            collab_recs = defaultdict(float)
-            for similar_user, similarity in similar_users.head(10).items():
-                if similarity > 0.1:
-                    similar_user_ratings = user_item_df.loc[similar_user]
-                    unrated_items = similar_user_ratings[similar_user_ratings > 0] - user_ratings[user_ratings > 0]
-                    for item, rating in unrated_items.items():
-                        collab_recs[item] += similarity * rating
-
-            # Sort collaborative recommendations
-            collab_sorted = sorted(collab_recs.items(), key=lambda x: x[1], reverse=True)
-            recommendations.extend([(item, score, 'collaborative') for item, score in collab_sorted[:top_n//2]])
+        # Collaborative filtering component: item-item neighbours of the user's purchases
+        if user_id is not None:
+            collab_sorted = model['collaborative'].recommend(user_id, top_n=top_n // 2)
+            recommendations.extend([(item, score, 'collaborative') for item, score in collab_sorted])
 
         # Content-based component
         if book_id:
-            try:
-                # Find similar books by content
-                book_idx = item_ids.index(f"book_{book_id}")
-                similar_scores = similarity_matrix[book_idx]
-                content_recs = [(item_ids[i], score) for i, score in enumerate(similar_scores) if score > 0.1 and i != book_idx]
+            book_idx = model['item_index'].get(f"book_{book_id}")
+            if book_idx is not None:
+                # Precomputed top-k neighbours of the book
+                neighbours = model['content_neighbours']
+                lo, hi = neighbours.indptr[book_idx], neighbours.indptr[book_idx + 1]
+                content_recs = [
+                    (item_ids[i], float(score))
+                    for i, score in zip(neighbours.indices[lo:hi], neighbours.data[lo:hi]) if score > 0.1
+                ]
                 content_recs.sort(key=lambda x: x[1], reverse=True)
 
                 recommendations.extend([(item, score, 'content') for item, score in content_recs[:top_n//2]])
-            except (ValueError, IndexError):
-                pass
 
         # Combine and deduplicate
         seen_items = set()
@@ -162,20 +346,14 @@ def hybrid_recommendation(user_id, book_id=None, top_n=10):
                 if len(final_recs) >= top_n:
                     break
 
-        # Convert to Book/UserBook objects
-        result = []
-        for item_id, score, method in final_recs:
-            try:
-                if item_id.startswith('book_'):
-                    book_id_int = int(item_id.split('_')[1])
-                    book = Book.objects.get(id=book_id_int)
-                    result.append(book)
-                elif item_id.startswith('user_book_'):
-                    user_book_id = int(item_id.split('_')[2])
-                    user_book = UserBook.objects.get(id=user_book_id)
-                    result.append(user_book)
-            except (Book.DoesNotExist, UserBook.DoesNotExist, ValueError):
-                continue
+        # Convert to Book/UserBook objects (one query per model)
+        book_ids = [int(item[len('book_'):]) for item, _, _ in final_recs if item.startswith('book_')]
+        user_book_ids = [int(item[len('user_book_'):]) for item, _, _ in final_recs if item.startswith('user_book_')]
+        objects = {
+            **{f"book_{pk}": obj for pk, obj in Book.objects.in_bulk(book_ids).items()},
+            **{f"user_book_{pk}": obj for pk, obj in UserBook.objects.in_bulk(user_book_ids).items()},
+        }
+        result = [objects[item_id] for item_id, _, _ in final_recs if item_id in objects]
 
         return result
 
@@ -194,38 +372,40 @@ def get_recommendations(book_id, top_n=5):
         return []
 
 def get_popular_books(top_n=10):
-    """Get most popular books based on sales and ratings."""
-    books = Book.objects.annotate(
-        total_orders=Count('order'),
-        avg_rating=Avg('review__rating')
-    ).order_by('-total_orders', '-avg_rating')[:top_n]
+    """Get the most popular books (time-decayed sales, reviews and views) from the leaderboard."""
+    from .leaderboard import top_books
 
-    return list(books)
+    return top_books('popular', limit=top_n)
 
 def get_personalized_recommendations(user_id, top_n=10):
     """Get personalized recommendations for a user."""
     return hybrid_recommendation(user_id, None, top_n)
 
-def train_recommendation_model():
-    """Train the recommendation model (for periodic retraining)."""
+def train_recommendation_model(workers=None):
+    """
+    Train the recommendation model (for periodic retraining).
+
+    workers: processes for the content similarity chunks
+    (default: settings.RECOMMENDATIONS['similarity_workers']).
+    """
     try:
         logger.info("Training recommendation model...")
 
-        # Build matrices
-        user_item_df = build_user_item_matrix()
-        content_df = build_content_features()
-
-        if not user_item_df.empty:
-            # Simple collaborative filtering training
-            # This is a placeholder for more sophisticated model training
-            logger.info(f"Built user-item matrix with {len(user_item_df)} users and {len(user_item_df.columns)} items")
-
-        if not content_df.empty:
-            similarity_matrix, item_ids = calculate_content_similarity(content_df)
-            logger.info(f"Built content similarity matrix for {len(item_ids)} items")
-
-        # Clear cache to force refresh
-        cache.delete('recommendation_matrices')
+        # Publish a new stamp so every process rebuilds, then build this one's model now
+        invalidate_recommendation_model()
+        if workers is None:
+            workers = getattr(settings, 'RECOMMENDATIONS', {}).get('similarity_workers', 1)
+        model = get_recommendation_model(workers=workers)
+
+        collaborative = model['collaborative']
+        logger.info(
+            f"Built user-item matrix with {collaborative.matrix.shape[0]} users, "
+            f"{collaborative.matrix.shape[1]} items and {collaborative.matrix.nnz} purchases"
+        )
+        logger.info(
+            f"Built content neighbours for {len(model['item_ids'])} items "
+            f"({model['content_neighbours'].nnz} non-zeros)"
+        )
 
         logger.info("Recommendation model training completed")
         return True
@@ -0,0 +1,249 @@
+"""
+Materialized popularity leaderboards.
+
+Every book has one BookPopularity row. Order, review, wishlist and view events
+adjust that row with a single UPDATE (record_event, wired up in signals.py), so
+the "popular", "best sellers" and "top rated" lists are an indexed
+ORDER BY ... LIMIT on a small table instead of an aggregate over orders and
+reviews. The top ids of each list are also cached for
+LEADERBOARD['list_timeout'] seconds, so most requests read a list with one
+cache get and hydrate it with one in_bulk query.
+
+Popularity decays with forward decay: an event of weight w at time t adds
+w * 2 ** ((t - landmark) / half_life) to the stored score. Older events count
+for less without any row being rewritten, and ordering by the stored score is
+the same as ordering by the decayed score at any moment (current_score gives
+the decayed value). The landmark is kept in the LeaderboardState row.
+`python manage.py rebuild_leaderboard` recomputes every row from the event
+tables relative to a new landmark (now). Run it regularly (e.g. daily) so the
+stored scores stay small. The exponent is clamped to MAX_DECAY_EXPONENT, so a
+landmark that is never moved makes new events stop outweighing old ones, but
+it never overflows.
+"""
+
+import hashlib
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Landmark of the scores stored before LeaderboardState existed (see migration 0022)
+DECAY_EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+MAX_DECAY_EXPONENT = 512  # 2 ** 512 is about 1e154, well inside float range
+LEADERBOARD_STAMP_CACHE_KEY = 'leaderboard_stamp'
+
+# Score added per event (per unit for orders)
+EVENT_WEIGHTS = {
+    'order': 5.0,
+    'review': 3.0,
+    'wishlist': 2.0,
+    'view': 1.0,
+}
+# Orders count as sales once they leave the cart, until cancelled or refunded
+SOLD_STATUSES = frozenset(['pending', 'confirmed', 'processing', 'packed', 'shipped', 'out_for_delivery', 'delivered'])
+RATING_PRIOR_WEIGHT = 5  # reviews needed before they outweigh the catalog rating
+
+BOARDS = {
+    'popular': '-score',
+    'best_sellers': '-units_sold',
+    'top_rated': '-rating_score',
+}
+
+DEFAULTS = {
+    'half_life_days': 7.0,
+    'list_size': 50,
+    'list_timeout': 300,
+}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'LEADERBOARD', {})}
+
+
+def decay_landmark():
+    """The time the stored scores are relative to."""
+    from .models import LeaderboardState
+
+    state, _ = LeaderboardState.objects.get_or_create(pk=1, defaults={'decay_landmark': timezone.now()})
+    return state.decay_landmark
+
+
+def decay_factor(when=None, landmark=None):
+    """Forward-decay multiplier for an event at `when` (default: now), relative to the landmark."""
+    when = when or timezone.now()
+    landmark = landmark or decay_landmark()
+    half_life = _config()['half_life_days'] * 86400
+    exponent = (when - landmark).total_seconds() / half_life
+    return 2.0 ** max(-MAX_DECAY_EXPONENT, min(MAX_DECAY_EXPONENT, exponent))
+
+
+def current_score(stored_score, now=None):
+    """The decayed popularity, as of now, of a stored (forward-decayed) score."""
+    return stored_score / decay_factor(now)
+
+
+def _rating_score(rating_sum, review_count, catalog_rating):
+    """Review average shrunk towards the catalog rating (works on values and F expressions)."""
+    return (rating_sum + catalog_rating * RATING_PRIOR_WEIGHT) / (review_count + RATING_PRIOR_WEIGHT)
+
+
+def _baseline_row(book):
+    """A leaderboard row for a book with no recorded events (book is a values() dict)."""
+    from .models import BookPopularity
+
+    return BookPopularity(
+        book_id=book['id'],
+        genre=book['genre'],
+        category=book['category'],
+        # Book.total_sold is the imported sales figure; orders are counted on top of it
+        units_sold=book['total_sold'],
+        catalog_rating=book['rating'],
+        rating_score=book['rating'],
+    )
+
+
+def _create_row(book_id):
+    from .models import Book, BookPopularity
+
+    book = Book.objects.filter(pk=book_id).values('id', 'genre', 'category', 'rating', 'total_sold').first()
+    if book is None:
+        return False
+    BookPopularity.objects.bulk_create([_baseline_row(book)], ignore_conflicts=True)
+    return True
+
+
+def record_event(book_id, event, amount=1, when=None, rating=None):
+    """
+    Apply one event to a book's leaderboard row with a single UPDATE.
+
+    amount is the number of units for orders and +1/-1 otherwise; a negative
+    amount with the original event time undoes an event (cancelled order,
+    deleted review). rating is the star rating of a review event.
+    """
+    from .models import BookPopularity
+
+    changes = {'score': F('score') + EVENT_WEIGHTS[event] * amount * decay_factor(when)}
+    if event == 'order':
+        changes['units_sold'] = F('units_sold') + amount
+    if rating is not None:
+        changes['review_count'] = F('review_count') + amount
+        changes['rating_sum'] = F('rating_sum') + rating * amount
+        # The right-hand side sees the old column values, hence the deltas
+        changes['rating_score'] = _rating_score(
+            F('rating_sum') + rating * amount, F('review_count') + amount, F('catalog_rating')
+        )
+    rows = BookPopularity.objects.filter(book_id=book_id)
+    if not rows.update(**changes) and _create_row(book_id):
+        rows.update(**changes)
+
+
+def sync_book(book):
+    """Copy the list-relevant Book columns onto its leaderboard row."""
+    from .models import BookPopularity
+
+    updated = BookPopularity.objects.filter(book_id=book.pk).update(
+        genre=book.genre,
+        category=book.category,
+        catalog_rating=book.rating,
+        rating_score=_rating_score(F('rating_sum'), F('review_count'), book.rating),
+    )
+    if not updated:
+        _create_row(book.pk)
+
+
+def _list_key(board, genre, category, stamp):
+    scope = hashlib.sha1(f"{genre or ''}\0{category or ''}".encode()).hexdigest()[:16]
+    return f"leaderboard:{stamp}:{board}:{scope}"
+
+
+def top_book_ids(board='popular', genre=None, category=None, limit=10):
+    """
+    Ids of the top books of a leaderboard, optionally within one genre or category.
+
+    Returns:
+        list: book ids, best first
+    """
+    from .models import BookPopularity
+
+    if board not in BOARDS:
+        raise ValueError(f"Unknown leaderboard: {board}")
+    config = _config()
+    stamp = cache.get(LEADERBOARD_STAMP_CACHE_KEY) or 'initial'
+    key = _list_key(board, genre, category, stamp)
+    ids = cache.get(key)
+    if ids is None or (len(ids) < limit and len(ids) == config['list_size']):
+        rows = BookPopularity.objects.all()
+        if genre:
+            rows = rows.filter(genre=genre)
+        if category:
+            rows = rows.filter(category=category)
+        ids = list(rows.order_by(BOARDS[board], 'book_id').values_list('book_id', flat=True)[:max(limit, config['list_size'])])
+        cache.set(key, ids, config['list_timeout'])
+    return ids[:limit]
+
+
+def top_books(board='popular', genre=None, category=None, limit=10):
+    """Top books of a leaderboard as Book instances (one in_bulk query)."""
+    from .models import Book
+
+    ids = top_book_ids(board, genre=genre, category=category, limit=limit)
+    books = Book.objects.in_bulk(ids)
+    return [books[book_id] for book_id in ids if book_id in books]
+
+
+def invalidate_lists():
+    """Make every process re-read the top lists from the table."""
+    cache.set(LEADERBOARD_STAMP_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def rebuild_leaderboard(chunk_size=2000):
+    """
+    Recompute every leaderboard row from the orders, reviews, wishlists and views,
+    relative to a new decay landmark (now).
+
+    Returns:
+        int: number of rows written
+    """
+    from .models import Book, BookPopularity, LeaderboardState, Order, RecentlyViewed, Review, Wishlist
+
+    landmark = timezone.now()
+    scores = defaultdict(float)
+    units = defaultdict(int)
+    reviews = defaultdict(lambda: [0, 0.0])
+
+    sold = Order.objects.filter(book__isnull=False, status__in=SOLD_STATUSES)
+    for book_id, quantity, ordered_at in sold.values_list('book_id', 'quantity', 'ordered_at').iterator(chunk_size=chunk_size):
+        scores[book_id] += EVENT_WEIGHTS['order'] * quantity * decay_factor(ordered_at, landmark)
+        units[book_id] += quantity
+    for book_id, rating, created_at in Review.objects.values_list('book_id', 'rating', 'created_at').iterator(chunk_size=chunk_size):
+        scores[book_id] += EVENT_WEIGHTS['review'] * decay_factor(created_at, landmark)
+        reviews[book_id][0] += 1
+        reviews[book_id][1] += rating
+    for event, model, field in (('wishlist', Wishlist, 'added_at'), ('view', RecentlyViewed, 'viewed_at')):
+        for book_id, when in model.objects.values_list('book_id', field).iterator(chunk_size=chunk_size):
+            scores[book_id] += EVENT_WEIGHTS[event] * decay_factor(when, landmark)
+
+    rows = []
+    for book in Book.objects.values('id', 'genre', 'category', 'rating', 'total_sold').iterator(chunk_size=chunk_size):
+        row = _baseline_row(book)
+        row.score = scores.get(book['id'], 0.0)
+        row.units_sold += units.get(book['id'], 0)
+        row.review_count, row.rating_sum = reviews.get(book['id'], (0, 0.0))
+        row.rating_score = _rating_score(row.rating_sum, row.review_count, row.catalog_rating)
+        rows.append(row)
+
+    with transaction.atomic():
+        LeaderboardState.objects.update_or_create(pk=1, defaults={'decay_landmark': landmark})
+        BookPopularity.objects.all().delete()
+        BookPopularity.objects.bulk_create(rows, batch_size=chunk_size)
+    invalidate_lists()
+    logger.info(f"Rebuilt leaderboard for {len(rows)} books")
+    return len(rows)
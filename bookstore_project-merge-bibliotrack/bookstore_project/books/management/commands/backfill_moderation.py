@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from books.models import BookClubComment, BookClubPost
+from books.moderation_utils import CONFIRMED_REASONS
+from books.moderation_queue import MODERATION_FIELDS, apply_results, moderation_texts, score_text_groups
+
+
+class Command(BaseCommand):
+    help = 'Re-moderate the whole book club history (or only pending rows) in parallel chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes used for classification (default: 1, in-process)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Rows classified per task and written back per bulk_update (default: 1000)',
+        )
+        parser.add_argument(
+            '--pending-only',
+            action='store_true',
+            help='Only moderate rows the worker has not processed yet',
+        )
+
+    def handle(self, *args, **options):
+        self.chunk_size = max(1, options['chunk_size'])
+        self.pending_only = options['pending_only']
+        self.workers = options['workers']
+        self.moderated_at = timezone.now()
+        started = time.perf_counter()
+        # Workers run django.setup() so the pool also works with the 'spawn' start method
+        pool = ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) if options['workers'] > 1 else None
+        try:
+            totals = [
+                self._backfill(BookClubPost, ('id', 'title', 'content'), pool),
+                self._backfill(BookClubComment, ('id', 'content'), pool),
+            ]
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        elapsed = time.perf_counter() - started
+
+        moderated = sum(total for total, _ in totals)
+        flagged = sum(flags for _, flags in totals)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Moderated {totals[0][0]} posts and {totals[1][0]} comments, {flagged} flagged '
+                f'({moderated / elapsed if elapsed else 0:.0f} rows/sec)'
+            )
+        )
+
+    def _chunks(self, model, fields):
+        # Labels confirmed by a moderator are never overwritten by the classifier
+        queryset = model.objects.only(*fields).exclude(moderation_reason__in=CONFIRMED_REASONS)
+        if self.pending_only:
+            queryset = queryset.filter(moderated_at__isnull=True)
+        last_id = 0
+        while True:
+            # Keyset pagination: rows written by bulk_update never disturb the scan
+            chunk = list(queryset.filter(id__gt=last_id).order_by('id')[:self.chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1].id
+
+    def _write(self, model, chunk, results):
+        apply_results(chunk, results, moderated_at=self.moderated_at)
+        model.objects.bulk_update(chunk, MODERATION_FIELDS)
+        flagged = sum(1 for obj in chunk if obj.is_moderated)
+        self.stdout.write(f'{model.__name__}: moderated {len(chunk)} rows up to id {chunk[-1].id} ({flagged} flagged)')
+        return flagged
+
+    def _backfill(self, model, fields, pool):
+        moderated = flagged = 0
+        if pool is None:
+            for chunk in self._chunks(model, fields):
+                flagged += self._write(model, chunk, score_text_groups([moderation_texts(obj) for obj in chunk]))
+                moderated += len(chunk)
+            return moderated, flagged
+
+        # Keep a bounded number of chunks in flight; write results back in submission order
+        in_flight = []
+        for chunk in self._chunks(model, fields):
+            in_flight.append((chunk, pool.submit(score_text_groups, [moderation_texts(obj) for obj in chunk])))
+            if len(in_flight) >= self.workers * 2:
+                done, future = in_flight.pop(0)
+                flagged += self._write(model, done, future.result())
+                moderated += len(done)
+        for done, future in in_flight:
+            flagged += self._write(model, done, future.result())
+            moderated += len(done)
+        return moderated, flagged
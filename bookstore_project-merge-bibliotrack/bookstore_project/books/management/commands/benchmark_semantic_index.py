@@ -0,0 +1,66 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from books.embedding_index import EmbeddingIndex, FlatIndex, KIND_BOOK
+from books.ann_index import IVFIndex, recall_at_k
+
+class Command(BaseCommand):
+    help = 'Benchmark IVF approximate semantic search (recall@k and latency) against exact search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, default=0, help='Benchmark on N random clustered vectors instead of the catalog')
+        parser.add_argument('--dim', type=int, default=384, help='Vector dimension for --synthetic')
+        parser.add_argument('--queries', type=int, default=100, help='Number of queries to run')
+        parser.add_argument('--k', type=int, default=10, help='Top-k to compare')
+        parser.add_argument('--nlist', type=int, default=None, help='Number of IVF lists (default ~4*sqrt(N))')
+        parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32], help='nprobe values to try')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        k = options['k']
+
+        if options['synthetic']:
+            n, dim = options['synthetic'], options['dim']
+            centers = rng.normal(size=(max(16, n // 1000), dim)).astype(np.float32)
+            vectors = centers[rng.integers(len(centers), size=n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+            keys = [(KIND_BOOK, i) for i in range(n)]
+        else:
+            keys, vectors = EmbeddingIndex().load_catalog()
+            vectors = np.asarray(vectors, dtype=np.float32)
+
+        if not len(keys):
+            self.stdout.write(self.style.WARNING('No embeddings to benchmark. Run precompute_embeddings or use --synthetic.'))
+            return
+
+        # Queries: perturbed copies of stored vectors
+        picks = rng.integers(len(vectors), size=options['queries'])
+        queries = vectors[picks] + 0.1 * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+
+        self.stdout.write(f'Indexing {len(keys)} vectors of dimension {vectors.shape[1]}...')
+        exact = FlatIndex()
+        exact.load(keys, vectors)
+
+        start = time.perf_counter()
+        ivf = IVFIndex(nlist=options['nlist'])
+        ivf.load(keys, vectors)
+        self.stdout.write(f'IVF training: {len(ivf.lists)} lists in {time.perf_counter() - start:.2f}s')
+
+        exact_results, exact_times = self._run(lambda q: exact.search(q, top_n=k), queries)
+        self.stdout.write(f'exact      recall@{k}=1.000  mean={np.mean(exact_times):.2f}ms  p95={np.percentile(exact_times, 95):.2f}ms')
+
+        for nprobe in options['nprobe']:
+            results, times = self._run(lambda q: ivf.search(q, top_n=k, nprobe=nprobe), queries)
+            recall = np.mean([recall_at_k(e, a) for e, a in zip(exact_results, results)])
+            self.stdout.write(
+                f'nprobe={nprobe:<4} recall@{k}={recall:.3f}  mean={np.mean(times):.2f}ms  p95={np.percentile(times, 95):.2f}ms'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
+
+    def _run(self, search, queries):
+        results, times = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(search(query))
+            times.append((time.perf_counter() - start) * 1000)
+        return results, times
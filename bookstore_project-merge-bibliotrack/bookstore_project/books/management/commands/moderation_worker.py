@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from books.moderation_queue import drain_pending
+
+
+class Command(BaseCommand):
+    help = 'Drain pending book club posts/comments and moderate them in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=256,
+            help='Rows classified per predict_proba call and bulk_update (default: 256)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to sleep when the queue is empty (default: 5)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the current queue and exit instead of polling',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        self.stdout.write(f'Moderation worker started (batch size {batch_size})')
+        try:
+            while True:
+                started = time.perf_counter()
+                moderated, flagged = drain_pending(batch_size=batch_size)
+                elapsed = time.perf_counter() - started
+                if moderated:
+                    self.stdout.write(
+                        f'Moderated {moderated} entries, {flagged} flagged '
+                        f'({moderated / elapsed if elapsed else 0:.0f} rows/sec)'
+                    )
+                if options['once']:
+                    break
+                if not moderated:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Moderation worker stopped'))
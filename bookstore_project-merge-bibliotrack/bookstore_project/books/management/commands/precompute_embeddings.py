@@ -1,3 +1,7 @@
+import os
+import time
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from books.semantic_search import precompute_book_embeddings
 
@@ -10,18 +14,54 @@ class Command(BaseCommand):
             action='store_true',
             help='Force recomputation of embeddings even if they already exist',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=256,
+            help='Number of texts encoded per model call (default: 256)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of rows read from the database per query (default: 2000)',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, 'precompute_embeddings.checkpoint.json'),
+            help='File recording progress so an interrupted run can resume',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore any existing checkpoint and start from the first row',
+        )
 
     def handle(self, *args, **options):
         force = options['force']
+        checkpoint = options['checkpoint']
         self.stdout.write('Starting semantic embedding precomputation...')
 
         if force:
             self.stdout.write('Force mode enabled - recomputing all embeddings')
+        if options['restart'] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elif os.path.exists(checkpoint):
+            self.stdout.write(f'Resuming from checkpoint {checkpoint}')
 
-        updated_books, updated_user_books = precompute_book_embeddings()
+        started = time.perf_counter()
+        updated_books, updated_user_books = precompute_book_embeddings(
+            force=force,
+            batch_size=options['batch_size'],
+            chunk_size=options['chunk_size'],
+            checkpoint_path=checkpoint,
+        )
+        elapsed = time.perf_counter() - started
+        total = updated_books + updated_user_books
 
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully computed embeddings for {updated_books} books and {updated_user_books} user books'
+                f'Successfully computed embeddings for {updated_books} books and {updated_user_books} user books '
+                f'in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f} rows/s)'
             )
         )
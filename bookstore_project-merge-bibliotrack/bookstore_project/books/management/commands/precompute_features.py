@@ -1,11 +1,46 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import django
+import requests
 from django.core.management.base import BaseCommand
+from django.db.models import Q
 from books.models import Book, UserBook
-from books.visual_search import extract_features_from_url, extract_features_from_path
+from books.embedding_index import get_cover_descriptor_index, get_visual_feature_index
+from books.hamming_index import get_cover_hash_index
+from books.advanced_visual_search import extract_cover_signatures
 from django.conf import settings
-import os
+
+SIGNATURE_FIELDS = ['image_features', 'image_hash', 'cover_descriptor']
+
+
+def _book_image_source(book):
+    """Local path for media-hosted covers, otherwise the cover URL."""
+    cover = book.cover_image_url or ''
+    # If cover looks like a media path (local), read it from MEDIA_ROOT
+    if cover.startswith(settings.MEDIA_URL) or cover.startswith('/media/') or cover.startswith('media/'):
+        rel_path = cover.replace(settings.MEDIA_URL, '').lstrip('/')
+        local_path = os.path.join(settings.MEDIA_ROOT, rel_path)
+        if os.path.exists(local_path):
+            return local_path
+        # Try with simple join in case cover has leading /media/
+        return os.path.join(settings.BASE_DIR, cover.lstrip('/'))
+    return cover
+
+
+def _read_image(source):
+    """Fetch the raw bytes of a cover from a URL or local path (runs in the download threads)."""
+    if source.startswith('http://') or source.startswith('https://'):
+        response = requests.get(source, timeout=10)
+        response.raise_for_status()
+        return response.content
+    with open(source, 'rb') as f:
+        return f.read()
+
 
 class Command(BaseCommand):
-    help = 'Precompute VGG16 features for all books with images'
+    help = 'Precompute visual signatures (pixel features, perceptual hash, cover descriptor) for all books with images'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -13,70 +48,121 @@ class Command(BaseCommand):
             action='store_true',
             help='Force recomputation of features even if they already exist',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes used for decoding and feature extraction (default: 1, in-process)',
+        )
+        parser.add_argument(
+            '--download-threads',
+            type=int,
+            default=8,
+            help='Concurrent cover downloads/reads (default: 8)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Rows processed and written back per bulk_update (default: 200)',
+        )
 
     def handle(self, *args, **options):
         force = options['force']
+        self.chunk_size = max(1, options['chunk_size'])
         self.stdout.write('Starting feature precomputation...')
 
-        # Process Book model
-        books_with_images = Book.objects.exclude(cover_image_url__isnull=True).exclude(cover_image_url='')
-        updated_books = 0
-
-        for book in books_with_images:
-            if force or not book.image_features:  # Only process if features not already computed or force is True
-                try:
-                    cover = book.cover_image_url or ''
-                    features = None
-                    # If cover looks like a media path (local), try extracting from local file
-                    if cover.startswith(settings.MEDIA_URL) or cover.startswith('/media/') or cover.startswith('media/'):
-                        # Build local path from MEDIA_ROOT
-                        rel_path = cover.replace(settings.MEDIA_URL, '').lstrip('/')
-                        local_path = os.path.join(settings.MEDIA_ROOT, rel_path)
-                        if os.path.exists(local_path):
-                            features = extract_features_from_path(local_path)
-                        else:
-                            # Try with simple join in case cover has leading /media/
-                            local_path = os.path.join(settings.BASE_DIR, cover.lstrip('/'))
-                            if os.path.exists(local_path):
-                                features = extract_features_from_path(local_path)
-                    else:
-                        # Fallback to URL extraction
-                        features = extract_features_from_url(cover)
-
-                    if features:
-                        book.image_features = features
-                        book.save()
-                        updated_books += 1
-                        self.stdout.write(f'Processed book: {book.title}')
-                    else:
-                        self.stdout.write(f'Failed to extract features for book: {book.title}')
-                except Exception as e:
-                    self.stdout.write(f'Error processing book {book.title}: {e}')
-
-        # Process UserBook model
-        user_books_with_images = UserBook.objects.exclude(cover_image__isnull=True)
-        updated_user_books = 0
-
-        for user_book in user_books_with_images:
-            if force or not user_book.image_features:  # Only process if features not already computed or force is True
-                try:
-                    image_path = user_book.cover_image.path
-                    if os.path.exists(image_path):
-                        features = extract_features_from_path(image_path)
-                        if features:
-                            user_book.image_features = features
-                            user_book.save()
-                            updated_user_books += 1
-                            self.stdout.write(f'Processed user book: {user_book.title}')
-                        else:
-                            self.stdout.write(f'Failed to extract features for user book: {user_book.title}')
-                    else:
-                        self.stdout.write(f'Image file not found for user book: {user_book.title}')
-                except Exception as e:
-                    self.stdout.write(f'Error processing user book {user_book.title}: {e}')
+        books = Book.objects.exclude(cover_image_url__isnull=True).exclude(cover_image_url='')
+        user_books = UserBook.objects.exclude(cover_image__isnull=True).exclude(cover_image='')
+        if not force:
+            # Only process rows with a signature that was not already computed
+            missing = (
+                Q(image_features__isnull=True) | Q(image_hash__isnull=True) | Q(image_hash='')
+                | Q(cover_descriptor__isnull=True)
+            )
+            books = books.filter(missing)
+            user_books = user_books.filter(missing)
+
+        self.attempted = 0
+        started = time.perf_counter()
+        downloads = ThreadPoolExecutor(max_workers=max(1, options['download_threads']))
+        # Workers run django.setup() so the pool also works with the 'spawn' start method
+        extractor = ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) if options['workers'] > 1 else None
+        try:
+            updated_books = self._process(
+                Book, books.only('id', 'title', 'cover_image_url'), _book_image_source, downloads, extractor,
+            )
+            updated_user_books = self._process(
+                UserBook, user_books.only('id', 'title', 'cover_image'), lambda ub: ub.cover_image.path, downloads, extractor,
+            )
+        finally:
+            downloads.shutdown()
+            if extractor is not None:
+                extractor.shutdown()
+        elapsed = time.perf_counter() - started
 
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully processed {updated_books} books and {updated_user_books} user books'
+                f'Successfully processed {updated_books} books and {updated_user_books} user books '
+                f'({self.attempted} images in {elapsed:.1f}s, '
+                f'{self.attempted / elapsed if elapsed else 0:.1f} images/sec)'
             )
         )
+
+    def _process(self, model, queryset, source_for, downloads, extractor):
+        updated = 0
+        last_id = 0
+        while True:
+            # Keyset pagination: rows written by bulk_update never disturb an open cursor
+            chunk = list(queryset.filter(id__gt=last_id).order_by('id')[:self.chunk_size])
+            if not chunk:
+                return updated
+            updated += self._process_chunk(model, chunk, source_for, downloads, extractor)
+            last_id = chunk[-1].id
+
+    def _process_chunk(self, model, chunk, source_for, downloads, extractor):
+        """Download covers concurrently, extract features as each arrives, then bulk_update the chunk."""
+        pending = {}
+        for obj in chunk:
+            try:
+                pending[downloads.submit(_read_image, source_for(obj))] = obj
+            except Exception as e:
+                self.stdout.write(f'Error locating image for {model.__name__} {obj.title}: {e}')
+
+        extracted = []
+        for future in as_completed(pending):
+            obj = pending[future]
+            try:
+                data = future.result()
+            except Exception as e:
+                self.stdout.write(f'Error reading image for {model.__name__} {obj.title}: {e}')
+                continue
+            if extractor is not None:
+                extracted.append((obj, extractor.submit(extract_cover_signatures, data)))
+            else:
+                extracted.append((obj, extract_cover_signatures(data)))
+        self.attempted += len(extracted)
+
+        updated = []
+        for obj, signatures in extracted:
+            try:
+                if extractor is not None:
+                    signatures = signatures.result()
+            except Exception as e:
+                self.stdout.write(f'Error processing {model.__name__} {obj.title}: {e}')
+                continue
+            if signatures is None:
+                self.stdout.write(f'Failed to extract features for {model.__name__}: {obj.title}')
+                continue
+            for field in SIGNATURE_FIELDS:
+                setattr(obj, field, signatures[field])
+            updated.append(obj)
+
+        if updated:
+            model.objects.bulk_update(updated, SIGNATURE_FIELDS)
+            # bulk_update() skips post_save, so let the visual indexes rebuild
+            get_visual_feature_index().invalidate()
+            get_cover_descriptor_index().invalidate()
+            get_cover_hash_index().invalidate()
+        self.stdout.write(f'{model.__name__}: wrote features for {len(updated)}/{len(chunk)} rows')
+        return len(updated)
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+from books import text_search
+
+
+class Command(BaseCommand):
+    help = 'Reinstall the full-text search index of books and listings and refill it from the tables'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        text_search.install(rebuild=True)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index for {len(text_search.INDEXES)} tables in {elapsed:.1f}s'))
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from books.models import BookClubComment, BookClubPost
+from books.moderation_queue import moderation_texts
+from books.moderation_utils import CONFIRMED_REASONS, CONFIRMED_TOXIC, moderator
+
+
+class Command(BaseCommand):
+    help = 'Train the forum moderation model and publish it as a new versioned artifact'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bootstrap',
+            action='store_true',
+            help='Start over from the seed dataset instead of updating the current model',
+        )
+        parser.add_argument(
+            '--replay-confirmed',
+            action='store_true',
+            help='partial_fit on every moderator-confirmed post and comment',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Labels applied per partial_fit call when replaying (default: 1000)',
+        )
+
+    def _confirmed_batches(self, batch_size):
+        """(texts, labels) batches of every moderator-confirmed post and comment."""
+        texts, labels = [], []
+        for model, fields in ((BookClubPost, ('id', 'title', 'content', 'moderation_reason')),
+                              (BookClubComment, ('id', 'content', 'moderation_reason'))):
+            rows = model.objects.filter(moderation_reason__in=CONFIRMED_REASONS).only(*fields).order_by('id')
+            for obj in rows.iterator(chunk_size=2000):
+                for text in moderation_texts(obj):
+                    texts.append(text)
+                    labels.append(int(obj.moderation_reason == CONFIRMED_TOXIC))
+                if len(texts) >= batch_size:
+                    self.learned += len(texts)
+                    yield texts, labels
+                    texts, labels = [], []
+        if texts:
+            self.learned += len(texts)
+            yield texts, labels
+
+    def handle(self, *args, **options):
+        if not options['bootstrap'] and not options['replay_confirmed']:
+            raise CommandError('Nothing to do: pass --bootstrap and/or --replay-confirmed')
+
+        started = time.perf_counter()
+        if options['bootstrap']:
+            moderator.train_model()
+            self.stdout.write(f'Trained seed model as version {moderator.version}')
+
+        self.learned = 0
+        if options['replay_confirmed']:
+            # Every batch goes into one copy of the model, published as a single version
+            moderator.learn_batches(self._confirmed_batches(max(1, options['batch_size'])))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Moderation model is now version {moderator.version} '
+                f'({self.learned} confirmed labels applied in {elapsed:.1f}s)'
+            )
+        )
@@ -0,0 +1,89 @@
+import json
+
+import books.fields
+from django.db import migrations
+
+VECTOR_FIELDS = (
+    ("semantic_embedding", "float32"),
+    ("image_features", "float16"),
+)
+BATCH_SIZE = 500
+
+
+def _as_list(value):
+    # JSONField values normally come back decoded, but tolerate raw strings
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value if isinstance(value, (list, tuple)) and value else None
+
+
+def json_to_vectors(apps, schema_editor):
+    for model_name in ("Book", "UserBook"):
+        model = apps.get_model("books", model_name)
+        batch = []
+        for obj in model.objects.only("id", *(name for name, _ in VECTOR_FIELDS)).iterator(chunk_size=BATCH_SIZE):
+            for name, _ in VECTOR_FIELDS:
+                values = _as_list(getattr(obj, name))
+                if values is not None:
+                    try:
+                        setattr(obj, f"{name}_vector", [float(v) for v in values])
+                    except (TypeError, ValueError):
+                        pass
+            batch.append(obj)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, [f"{name}_vector" for name, _ in VECTOR_FIELDS])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, [f"{name}_vector" for name, _ in VECTOR_FIELDS])
+
+
+def vectors_to_json(apps, schema_editor):
+    for model_name in ("Book", "UserBook"):
+        model = apps.get_model("books", model_name)
+        batch = []
+        for obj in model.objects.only("id", *(f"{name}_vector" for name, _ in VECTOR_FIELDS)).iterator(chunk_size=BATCH_SIZE):
+            for name, _ in VECTOR_FIELDS:
+                vector = getattr(obj, f"{name}_vector")
+                setattr(obj, name, None if vector is None else vector.tolist())
+            batch.append(obj)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, [name for name, _ in VECTOR_FIELDS])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, [name for name, _ in VECTOR_FIELDS])
+
+
+def _vector_field(dtype):
+    if dtype == "float32":
+        return books.fields.VectorField(blank=True, null=True)
+    return books.fields.VectorField(blank=True, null=True, dtype=dtype)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0015_bookclubcomment_bookclubcommentlike_bookclubpost_and_more"),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name=model_name,
+                name=f"{name}_vector",
+                field=_vector_field(dtype),
+            )
+            for model_name in ("book", "userbook")
+            for name, dtype in VECTOR_FIELDS
+        ],
+        migrations.RunPython(json_to_vectors, vectors_to_json),
+        *[
+            migrations.RemoveField(model_name=model_name, name=name)
+            for model_name in ("book", "userbook")
+            for name, _ in VECTOR_FIELDS
+        ],
+        *[
+            migrations.RenameField(model_name=model_name, old_name=f"{name}_vector", new_name=name)
+            for model_name in ("book", "userbook")
+            for name, _ in VECTOR_FIELDS
+        ],
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:28
+
+import books.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0016_vector_fields"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="cover_descriptor",
+            field=books.fields.VectorField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="userbook",
+            name="cover_descriptor",
+            field=books.fields.VectorField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0017_cover_descriptor"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookclubcomment",
+            name="moderated_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="bookclubpost",
+            name="moderated_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
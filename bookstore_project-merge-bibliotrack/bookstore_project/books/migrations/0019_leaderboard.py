@@ -0,0 +1,68 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_baseline_rows(apps, schema_editor):
+    """One leaderboard row per existing book; rebuild_leaderboard adds the event history."""
+    Book = apps.get_model("books", "Book")
+    BookPopularity = apps.get_model("books", "BookPopularity")
+    BookPopularity.objects.bulk_create(
+        [
+            BookPopularity(
+                book_id=book["id"],
+                genre=book["genre"],
+                category=book["category"],
+                units_sold=book["total_sold"],
+                catalog_rating=book["rating"],
+                rating_score=book["rating"],
+            )
+            for book in Book.objects.values("id", "genre", "category", "rating", "total_sold").iterator()
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0018_moderation_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookPopularity",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="popularity",
+                        serialize=False,
+                        to="books.book",
+                    ),
+                ),
+                ("genre", models.CharField(max_length=50)),
+                ("category", models.CharField(max_length=50)),
+                ("score", models.FloatField(default=0.0)),
+                ("units_sold", models.IntegerField(default=0)),
+                ("review_count", models.IntegerField(default=0)),
+                ("rating_sum", models.FloatField(default=0.0)),
+                ("catalog_rating", models.FloatField(default=0.0)),
+                ("rating_score", models.FloatField(default=0.0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["-score"], name="popularity_score_idx"),
+                    models.Index(fields=["-units_sold"], name="popularity_units_sold_idx"),
+                    models.Index(fields=["-rating_score"], name="popularity_rating_idx"),
+                    models.Index(fields=["genre", "-score"], name="popularity_genre_score_idx"),
+                    models.Index(fields=["category", "-score"], name="popularity_category_score_idx"),
+                ],
+            },
+        ),
+        migrations.RunPython(create_baseline_rows, migrations.RunPython.noop),
+    ]
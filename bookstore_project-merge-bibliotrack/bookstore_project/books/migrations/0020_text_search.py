@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-17 03:10
+
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    """FTS5 tables and triggers on SQLite, tsvector columns and GIN indexes on PostgreSQL."""
+    from books import text_search
+
+    text_search.install(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from books import text_search
+
+    text_search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0019_leaderboard"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-17 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0020_text_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deal",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -4,6 +4,8 @@ from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
+from .fields import VectorField
+
 class Book(models.Model):
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=100)
@@ -16,8 +18,9 @@ class Book(models.Model):
     cover_image_url = models.URLField(blank=True, null=True)
     description = models.TextField(blank=True)
     image_hash = models.CharField(max_length=64, blank=True, null=True)  # Store perceptual hash
-    image_features = models.JSONField(blank=True, null=True)  # Store VGG16 features for visual search
-    semantic_embedding = models.JSONField(blank=True, null=True)  # Store Sentence-BERT embeddings for semantic search
+    image_features = VectorField(blank=True, null=True, dtype='float16')  # Store image features for visual search
+    semantic_embedding = VectorField(blank=True, null=True)  # Store Sentence-BERT embeddings for semantic search
+    cover_descriptor = VectorField(blank=True, null=True)  # Compact color/texture/shape descriptor for visual re-ranking
     # New ImageField to store uploaded/local cover images under MEDIA_ROOT/books/
     image = models.ImageField(upload_to='books/', blank=True, null=True)
     total_sold = models.PositiveIntegerField(default=0)  # Track sales for best sellers
@@ -42,25 +45,13 @@ class Book(models.Model):
     @property
     def current_price(self):
         """Return the current price considering any active deals"""
-        active_deals = Deal.objects.filter(
-            book=self,
-            is_active=True,
-            start_date__lte=timezone.now(),
-            end_date__gte=timezone.now()
-        )
-        if active_deals.exists():
-            deal = active_deals.first()
-            return self.price * (1 - deal.discount_percentage / 100)
-        return self.price
+        from .pricing import price_for
+        return price_for(self)
 
     def get_active_deal(self):
         """Get the active deal for this book if any"""
-        return Deal.objects.filter(
-            book=self,
-            is_active=True,
-            start_date__lte=timezone.now(),
-            end_date__gte=timezone.now()
-        ).first()
+        from .pricing import get_active_deal
+        return get_active_deal(self.pk)
 
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -171,8 +162,9 @@ class UserBook(models.Model):
     description = models.TextField(blank=True)
     cover_image = models.ImageField(upload_to='user_book_covers/', blank=True, null=True)
     image_hash = models.CharField(max_length=64, blank=True, null=True)  # Store perceptual hash
-    image_features = models.JSONField(blank=True, null=True)  # Store VGG16 features for visual search
-    semantic_embedding = models.JSONField(blank=True, null=True)  # Store Sentence-BERT embeddings for semantic search
+    image_features = VectorField(blank=True, null=True, dtype='float16')  # Store image features for visual search
+    semantic_embedding = VectorField(blank=True, null=True)  # Store Sentence-BERT embeddings for semantic search
+    cover_descriptor = VectorField(blank=True, null=True)  # Compact color/texture/shape descriptor for visual re-ranking
     is_available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -205,6 +197,8 @@ class BookClubPost(models.Model):
     is_moderated = models.BooleanField(default=False)
     moderation_reason = models.CharField(max_length=100, blank=True, null=True)
     moderation_confidence = models.FloatField(default=0.0)
+    # NULL until the moderation worker has classified the content (see moderation_queue)
+    moderated_at = models.DateTimeField(blank=True, null=True, db_index=True)
 
     class Meta:
         ordering = ['-is_pinned', '-created_at']
@@ -226,16 +220,10 @@ class BookClubPost(models.Model):
         return self.updated_at
 
     def moderate_content(self):
-        """Auto-moderate post content using AI."""
-        from .moderation_utils import moderate_forum_content
+        """Moderate this post now (the moderation worker normally does this in batches)."""
+        from .moderation_queue import moderate_objects
 
-        if self.content:
-            result = moderate_forum_content(self.content)
-            self.is_moderated = result['is_flagged']
-            if result['is_flagged']:
-                self.moderation_reason = result['reason']
-                self.moderation_confidence = result['confidence']
-            self.save()
+        moderate_objects(type(self), [self])
 
 class BookClubComment(models.Model):
     """Threaded comments/replies in book club discussions."""
@@ -249,6 +237,8 @@ class BookClubComment(models.Model):
     is_moderated = models.BooleanField(default=False)
     moderation_reason = models.CharField(max_length=100, blank=True, null=True)
     moderation_confidence = models.FloatField(default=0.0)
+    # NULL until the moderation worker has classified the content (see moderation_queue)
+    moderated_at = models.DateTimeField(blank=True, null=True, db_index=True)
 
     class Meta:
         ordering = ['created_at']
@@ -267,16 +257,10 @@ class BookClubComment(models.Model):
         return self.replies.count()
 
     def moderate_content(self):
-        """Auto-moderate comment content using AI."""
-        from .moderation_utils import moderate_forum_content
+        """Moderate this comment now (the moderation worker normally does this in batches)."""
+        from .moderation_queue import moderate_objects
 
-        if self.content:
-            result = moderate_forum_content(self.content)
-            self.is_moderated = result['is_flagged']
-            if result['is_flagged']:
-                self.moderation_reason = result['reason']
-                self.moderation_confidence = result['confidence']
-            self.save()
+        moderate_objects(type(self), [self])
 
 class BookClubPostLike(models.Model):
     """User likes for book club posts."""
@@ -321,6 +305,8 @@ class Deal(models.Model):
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Probed by pricing.active_deals() to notice deal changes made in other processes
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.discount_percentage}% off on {self.book.title}"
@@ -330,6 +316,11 @@ class Deal(models.Model):
         now = timezone.now()
         return self.is_active and self.start_date <= now <= self.end_date
 
+    @property
+    def discounted_price(self):
+        from .pricing import discounted_price
+        return discounted_price(self.book.price, self.discount_percentage)
+
 class SellerRating(models.Model):
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='given_ratings')
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_ratings')
@@ -366,3 +357,37 @@ class BookRecommendation(models.Model):
 
     def __str__(self):
         return f"Recommendation for {self.user.username}: {self.book.title} (Score: {self.score})"
+
+class BookPopularity(models.Model):
+    """Materialized leaderboard row per book, kept up to date by books/leaderboard.py."""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+    # Copied from Book so per-genre/per-category lists are served from this table's indexes
+    genre = models.CharField(max_length=50)
+    category = models.CharField(max_length=50)
+    score = models.FloatField(default=0.0)  # forward-decayed event weight (see leaderboard.decay_factor)
+    units_sold = models.IntegerField(default=0)
+    review_count = models.IntegerField(default=0)
+    rating_sum = models.FloatField(default=0.0)
+    catalog_rating = models.FloatField(default=0.0)  # Book.rating, the prior of rating_score
+    rating_score = models.FloatField(default=0.0)  # review average shrunk towards catalog_rating
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], name='popularity_score_idx'),
+            models.Index(fields=['-units_sold'], name='popularity_units_sold_idx'),
+            models.Index(fields=['-rating_score'], name='popularity_rating_idx'),
+            models.Index(fields=['genre', '-score'], name='popularity_genre_score_idx'),
+            models.Index(fields=['category', '-score'], name='popularity_category_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"Popularity of book {self.book_id}: {self.score:.3f}"
+
+
+class LeaderboardState(models.Model):
+    """Single row: the landmark the forward-decayed BookPopularity scores are relative to."""
+    decay_landmark = models.DateTimeField()
+
+    def __str__(self):
+        return f"Leaderboard landmark {self.decay_landmark.isoformat()}"
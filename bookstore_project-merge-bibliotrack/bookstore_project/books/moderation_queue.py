@@ -0,0 +1,123 @@
+"""
+Queue-based moderation of book club posts and comments.
+
+New posts and comments are saved with moderated_at = NULL, which is the
+queue: nothing runs the classifier inside the request. The worker
+(`python manage.py moderation_worker`) drains pending rows in batches, scores
+each batch with one vectorized predict_proba call and writes the flags back
+with bulk_update. `python manage.py backfill_moderation` re-scores the whole
+forum history in parallel chunks.
+"""
+
+import logging
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MODERATION_FIELDS = ['is_moderated', 'moderation_reason', 'moderation_confidence', 'moderated_at']
+
+
+def moderation_texts(obj):
+    """Texts that are classified for a post (title and content) or comment (content)."""
+    title = getattr(obj, 'title', None)
+    return [title, obj.content] if title is not None else [obj.content]
+
+
+def score_text_groups(groups):
+    """
+    Classify groups of texts in one batch; a group is flagged if any of its texts is.
+
+    Top-level so it can run in a process pool.
+
+    Returns:
+        list: one moderation result dict per group
+    """
+    from .moderation_utils import moderate_forum_batch
+
+    flat = [text or '' for group in groups for text in group]
+    results = moderate_forum_batch(flat) if flat else []
+    scored = []
+    position = 0
+    for group in groups:
+        group_results = results[position:position + len(group)]
+        position += len(group)
+        flagged = [result for result in group_results if result['is_flagged']]
+        if flagged:
+            scored.append(max(flagged, key=lambda result: result['confidence']))
+        else:
+            scored.append({'is_approved': True, 'is_flagged': False, 'confidence': 0.0, 'reason': None})
+    return scored
+
+
+def apply_results(objs, results, moderated_at=None):
+    """Copy moderation results onto instances (without saving them)."""
+    moderated_at = moderated_at or timezone.now()
+    for obj, result in zip(objs, results):
+        obj.is_moderated = bool(result['is_flagged'])
+        obj.moderation_reason = result['reason'] if result['is_flagged'] else None
+        obj.moderation_confidence = float(result['confidence']) if result['is_flagged'] else 0.0
+        obj.moderated_at = moderated_at
+
+
+def moderate_objects(model, objs):
+    """Classify objs in one batch and bulk_update their moderation fields. Returns the number flagged."""
+    if not objs:
+        return 0
+    results = score_text_groups([moderation_texts(obj) for obj in objs])
+    apply_results(objs, results)
+    model.objects.bulk_update(objs, MODERATION_FIELDS)
+    return sum(1 for obj in objs if obj.is_moderated)
+
+
+def drain_pending(batch_size=256, max_batches=None):
+    """
+    Moderate every pending post and comment, batch_size rows at a time.
+
+    Returns:
+        tuple: (rows moderated, rows flagged)
+    """
+    from .models import BookClubComment, BookClubPost
+
+    moderated = flagged = batches = 0
+    for model, fields in ((BookClubPost, ('id', 'title', 'content')), (BookClubComment, ('id', 'content'))):
+        last_id = 0
+        while max_batches is None or batches < max_batches:
+            # Keyset pagination over the pending rows
+            batch = list(
+                model.objects.filter(moderated_at__isnull=True, id__gt=last_id)
+                .only(*fields).order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+            flagged += moderate_objects(model, batch)
+            moderated += len(batch)
+            batches += 1
+            last_id = batch[-1].id
+    if moderated:
+        logger.info(f"Moderated {moderated} forum entries ({flagged} flagged)")
+    return moderated, flagged
+
+
+def confirm_labels(model, objs, toxic):
+    """
+    Record a moderator's verdict on objs and teach it to the classifier.
+
+    Returns:
+        The new moderation model version (None if there was nothing to learn)
+    """
+    from .moderation_utils import CONFIRMED_CLEAN, CONFIRMED_TOXIC, moderator
+
+    objs = list(objs)
+    if not objs:
+        return None
+    moderated_at = timezone.now()
+    texts = []
+    for obj in objs:
+        obj.is_moderated = toxic
+        obj.moderation_reason = CONFIRMED_TOXIC if toxic else CONFIRMED_CLEAN
+        obj.moderation_confidence = 1.0
+        obj.moderated_at = moderated_at
+        texts.extend(text for text in moderation_texts(obj) if text)
+    model.objects.bulk_update(objs, MODERATION_FIELDS)
+    return moderator.learn(texts, [int(toxic)] * len(texts))
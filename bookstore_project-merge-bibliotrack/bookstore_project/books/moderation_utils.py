@@ -1,31 +1,92 @@
 """
 AI-powered content moderation for book club forum.
 Uses scikit-learn to classify toxic content and flag inappropriate posts/comments.
+
+The classifier is a hashing vectorizer feeding an SGD logistic regression, so
+it learns online: moderator-confirmed labels are applied with partial_fit
+(cost proportional to the new feedback, no vocabulary to grow). Every update
+is written as a new versioned artifact under settings.MODERATION['model_dir']
+and swapped into the `moderator` singleton; other processes pick up the new
+CURRENT version within MODERATION['reload_interval'] seconds. Updates hold a
+lock file in the artifact directory and start from the CURRENT artifact, so
+concurrent learners never build on a stale version.
 """
 
+import copy
 import os
 import pickle
 import re
-from typing import List, Tuple, Optional
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, List, Tuple, Optional
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
-from sklearn.pipeline import Pipeline
+from django.conf import settings
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
-import pandas as pd
 import logging
 
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+# moderation_reason values recorded when a moderator confirms a label in the admin
+CONFIRMED_TOXIC = 'confirmed_toxic'
+CONFIRMED_CLEAN = 'confirmed_clean'
+CONFIRMED_REASONS = (CONFIRMED_TOXIC, CONFIRMED_CLEAN)
+
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = '.lock'
+HASH_FEATURES = 2 ** 18
+
+
+class StreamingToxicityModel:
+    """Hashed word/bigram features + SGD logistic regression, trainable with partial_fit."""
+
+    classes = np.array([0, 1])
+
+    def __init__(self, n_features: int = HASH_FEATURES, alpha: float = 1e-4, random_state: int = 42):
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features, ngram_range=(1, 2), alternate_sign=False, norm='l2'
+        )
+        self.classifier = SGDClassifier(loss='log_loss', alpha=alpha, random_state=random_state)
+        self.samples_seen = 0
+
+    def partial_fit(self, texts: List[str], labels: List[int]) -> 'StreamingToxicityModel':
+        self.classifier.partial_fit(self.vectorizer.transform(texts), labels, classes=self.classes)
+        self.samples_seen += len(labels)
+        return self
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        return self.classifier.predict_proba(self.vectorizer.transform(texts))
+
+    def predict(self, texts: List[str]) -> np.ndarray:
+        return self.classifier.predict(self.vectorizer.transform(texts))
+
+
 class ContentModerator:
     """AI-powered content moderation system for forum posts and comments."""
 
     def __init__(self, model_path: str = 'moderation_model.pkl'):
+        # Legacy single-file TF-IDF pipeline, used until a versioned artifact exists
         self.model_path = os.path.join('books', 'models', model_path)
         self.model = None
         self.vectorizer = None
         self.is_trained = False
+        self.version = None
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+
+    @property
+    def artifact_dir(self) -> str:
+        config = getattr(settings, 'MODERATION', {})
+        return os.fspath(config.get('model_dir') or os.path.join(settings.BASE_DIR, 'books', 'models', 'moderation'))
 
     def preprocess_text(self, text: str) -> str:
         """Clean and preprocess text for classification."""
@@ -106,8 +167,8 @@ class ContentModerator:
 
         return texts, labels
 
-    def train_model(self, save_model: bool = True) -> None:
-        """Train the toxicity classification model."""
+    def train_model(self, save_model: bool = True, epochs: int = 5) -> None:
+        """Train a fresh streaming toxicity model on the seed dataset and make it current."""
         logger.info("Training content moderation model...")
 
         # Load dataset
@@ -121,24 +182,80 @@ class ContentModerator:
             processed_texts, labels, test_size=0.2, random_state=42, stratify=labels
         )
 
-        # Create pipeline
-        self.model = Pipeline([
-            ('tfidf', TfidfVectorizer(max_features=5000, ngram_range=(1, 2))),
-            ('classifier', LogisticRegression(random_state=42, max_iter=1000))
-        ])
-
-        # Train model
-        self.model.fit(X_train, y_train)
+        # Several shuffled passes of partial_fit over the training split
+        model = StreamingToxicityModel()
+        rng = np.random.default_rng(42)
+        X_train, y_train = np.array(X_train, dtype=object), np.array(y_train)
+        for _ in range(epochs):
+            order = rng.permutation(len(y_train))
+            model.partial_fit(list(X_train[order]), y_train[order])
 
         # Evaluate
-        y_pred = self.model.predict(X_test)
+        y_pred = model.predict(X_test)
         logger.info("Model training completed")
-        logger.info(f"Classification Report:\n{classification_report(y_test, y_pred)}")
+        logger.info(f"Classification Report:\n{classification_report(y_test, y_pred, zero_division=0)}")
 
-        self.is_trained = True
+        version = self.save_version(model) if save_model else None
+        self._swap(model, version)
+
+    def learn(self, texts: List[str], labels: List[int]) -> Optional[int]:
+        """
+        Update the model with moderator-confirmed labels (1 = toxic, 0 = clean).
 
-        if save_model:
-            self.save_model()
+        Returns:
+            The new artifact version, or None if nothing was learned
+        """
+        return self.learn_batches([(texts, labels)])
+
+    def learn_batches(self, batches: Iterable[Tuple[List[str], List[int]]]) -> Optional[int]:
+        """
+        Update the model with batches of moderator-confirmed labels, saved once.
+
+        Under the artifact lock the CURRENT version is reloaded if another process
+        published it, every batch is applied to one copy with partial_fit, and the
+        copy is saved as a new artifact version and swapped in, so concurrent
+        predictions never see half-updated weights.
+
+        Returns:
+            The new artifact version, or None if nothing was learned
+        """
+        with self._lock, self._artifact_lock():
+            if not self.is_trained or self.current_version() != self.version:
+                self.load_model()
+            model = None
+            learned = 0
+            for texts, labels in batches:
+                pairs = [(self.preprocess_text(text), int(label)) for text, label in zip(texts, labels)]
+                pairs = [(text, label) for text, label in pairs if text]
+                if not pairs:
+                    continue
+                if model is None:
+                    if not hasattr(self.model, 'partial_fit'):
+                        # Legacy pipeline (or no model): start from the seed dataset
+                        self.train_model(save_model=False)
+                    model = copy.deepcopy(self.model)
+                model.partial_fit([text for text, _ in pairs], [label for _, label in pairs])
+                learned += len(pairs)
+            if model is None:
+                return None
+            version = self.save_version(model)
+            self._swap(model, version)
+        logger.info(f"Moderation model updated with {learned} labels (version {version})")
+        return version
+
+    @contextmanager
+    def _artifact_lock(self):
+        """Exclusive lock on the artifact directory, shared by every process that learns."""
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        with open(os.path.join(self.artifact_dir, LOCK_FILE), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)  # released when the file is closed
+            yield
+
+    def _swap(self, model, version: Optional[int]) -> None:
+        self.model = model
+        self.version = version
+        self.is_trained = True
 
     def predict_toxicity(self, text: str, threshold: float = 0.7) -> Tuple[bool, float]:
         """
@@ -147,59 +264,139 @@ class ContentModerator:
         Returns:
             Tuple of (is_toxic: bool, confidence: float)
         """
-        if not self.is_trained and not self.load_model():
-            logger.warning("Model not trained and no saved model found")
-            return False, 0.0
+        return self.predict_toxicity_batch([text], threshold)[0]
 
-        processed_text = self.preprocess_text(text)
-
-        if not processed_text:
-            return False, 0.0
+    def predict_toxicity_batch(self, texts: List[str], threshold: float = 0.7) -> List[Tuple[bool, float]]:
+        """
+        Predict toxicity for many texts with a single vectorized predict_proba call.
 
-        try:
-            # Get prediction probabilities
-            probabilities = self.model.predict_proba([processed_text])[0]
-            toxic_probability = probabilities[1]  # Probability of class 1 (toxic)
+        Returns:
+            List of (is_toxic: bool, confidence: float), aligned with texts
+        """
+        results = [(False, 0.0)] * len(texts)
+        if not self.ensure_model():
+            return results
+        self.maybe_reload()
+        model = self.model
 
-            is_toxic = toxic_probability >= threshold
-            return is_toxic, toxic_probability
+        processed = [self.preprocess_text(text) for text in texts]
+        positions = [i for i, text in enumerate(processed) if text]
+        if not positions:
+            return results
 
+        try:
+            # Probability of class 1 (toxic) for every non-empty text
+            toxic_probabilities = model.predict_proba([processed[i] for i in positions])[:, 1]
         except Exception as e:
             logger.error(f"Error predicting toxicity: {e}")
-            return False, 0.0
+            return results
+
+        for i, probability in zip(positions, toxic_probabilities):
+            probability = float(probability)
+            results[i] = (probability >= threshold, probability)
+        return results
+
+    def ensure_model(self) -> bool:
+        """Load the current model, training one from the seed dataset if none exists yet."""
+        if self.is_trained or self.load_model():
+            return True
+        with self._lock:
+            if self.is_trained:
+                return True
+            logger.info("No saved model found, training new model...")
+            try:
+                self.train_model()
+            except Exception as e:
+                logger.error(f"Failed to train content moderation model: {e}")
+                return False
+        return True
+
+    def current_version(self) -> Optional[int]:
+        """Version named by the CURRENT pointer, or None if no artifact has been written."""
+        try:
+            with open(os.path.join(self.artifact_dir, CURRENT_FILE)) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _artifact_path(self, version: int) -> str:
+        return os.path.join(self.artifact_dir, f'moderation-v{version:05d}.pkl')
+
+    def save_version(self, model, keep: int = 5) -> int:
+        """Write model as the next artifact version and point CURRENT at it."""
+        directory = self.artifact_dir
+        os.makedirs(directory, exist_ok=True)
+        fd, staging = tempfile.mkstemp(prefix='.staging-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(model, f)
+            version = (self.current_version() or 0) + 1
+            while True:
+                try:
+                    # link() fails if another process already claimed this version
+                    os.link(staging, self._artifact_path(version))
+                    break
+                except FileExistsError:
+                    version += 1
+        finally:
+            os.unlink(staging)
+
+        pointer = os.path.join(directory, f'.{CURRENT_FILE}.tmp.{os.getpid()}')
+        with open(pointer, 'w') as f:
+            f.write(str(version))
+        os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+
+        for old in range(version - keep, 0, -1):
+            path = self._artifact_path(old)
+            if not os.path.exists(path):
+                break
+            os.unlink(path)
+        logger.info(f"Model saved to {self._artifact_path(version)}")
+        return version
 
     def save_model(self) -> bool:
-        """Save the trained model to disk."""
+        """Save the trained model as a new artifact version."""
         if not self.is_trained:
             logger.warning("Cannot save untrained model")
             return False
 
         try:
-            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            with open(self.model_path, 'wb') as f:
-                pickle.dump(self.model, f)
-            logger.info(f"Model saved to {self.model_path}")
+            self.version = self.save_version(self.model)
             return True
         except Exception as e:
             logger.error(f"Error saving model: {e}")
             return False
 
     def load_model(self) -> bool:
-        """Load a trained model from disk."""
+        """Load the current artifact version (or the legacy model file) from disk."""
+        version = self.current_version()
+        path = self._artifact_path(version) if version is not None else self.model_path
         try:
-            if os.path.exists(self.model_path):
-                with open(self.model_path, 'rb') as f:
-                    self.model = pickle.load(f)
-                self.is_trained = True
-                logger.info(f"Model loaded from {self.model_path}")
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    model = pickle.load(f)
+                self._swap(model, version)
+                self._checked_at = time.monotonic()
+                logger.info(f"Model loaded from {path}")
                 return True
             else:
-                logger.warning(f"Model file not found: {self.model_path}")
+                logger.warning(f"Model file not found: {path}")
                 return False
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             return False
 
+    def maybe_reload(self) -> None:
+        """Hot-swap in a newer artifact written by another process (checked every reload_interval s)."""
+        interval = getattr(settings, 'MODERATION', {}).get('reload_interval', 30)
+        now = time.monotonic()
+        if now - self._checked_at < interval:
+            return
+        self._checked_at = now
+        version = self.current_version()
+        if version is not None and version != self.version:
+            self.load_model()
+
     def moderate_content(self, content: str) -> dict:
         """
         Moderate content and return moderation result.
@@ -207,16 +404,19 @@ class ContentModerator:
         Returns:
             dict with keys: 'is_approved', 'is_flagged', 'confidence', 'reason'
         """
-        is_toxic, confidence = self.predict_toxicity(content)
-
-        result = {
-            'is_approved': not is_toxic,
-            'is_flagged': is_toxic,
-            'confidence': confidence,
-            'reason': 'toxic_content' if is_toxic else None
-        }
-
-        return result
+        return self.moderate_batch([content])[0]
+
+    def moderate_batch(self, contents: List[str]) -> List[dict]:
+        """Moderate many texts at once; returns one moderate_content() result per text."""
+        return [
+            {
+                'is_approved': not is_toxic,
+                'is_flagged': is_toxic,
+                'confidence': confidence,
+                'reason': 'toxic_content' if is_toxic else None
+            }
+            for is_toxic, confidence in self.predict_toxicity_batch(contents)
+        ]
 
 # Global moderator instance
 moderator = ContentModerator()
@@ -233,14 +433,10 @@ def moderate_forum_content(content: str) -> dict:
     """
     return moderator.moderate_content(content)
 
-def initialize_moderator():
-    """Initialize the content moderator by loading or training the model."""
-    if not moderator.load_model():
-        logger.info("No saved model found, training new model...")
-        moderator.train_model()
+def moderate_forum_batch(contents: List[str]) -> List[dict]:
+    """Batched moderate_forum_content(): one classifier call for all contents."""
+    return moderator.moderate_batch(contents)
 
-# Initialize moderator when module is imported
-try:
-    initialize_moderator()
-except Exception as e:
-    logger.error(f"Failed to initialize content moderator: {e}")
+def initialize_moderator():
+    """Initialize the content moderator by loading or training the model (otherwise done on first use)."""
+    return moderator.ensure_model()
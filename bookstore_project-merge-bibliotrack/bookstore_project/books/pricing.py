@@ -0,0 +1,149 @@
+"""
+Deal-aware pricing without per-book Deal queries.
+
+The deals running right now are loaded into an index {book_id: Deal} with one
+query and kept in process memory, so Book.current_price, cart totals and the
+admin's price column are dictionary lookups. When several deals cover the same
+book the oldest one wins, as before.
+
+The index is rebuilt:
+  - at the next deal boundary (the soonest start_date or end_date of an enabled
+    deal), so deals switch on and off on time without anyone saving them;
+  - when a Deal is saved or deleted in this process (signals.py);
+  - when the deals table changed in another process: at most every
+    CHANGE_CHECK_INTERVAL seconds one aggregate query compares the number of
+    deals and their latest updated_at with those the index was built from, so
+    this does not depend on a cache shared between processes;
+  - after INDEX_TIMEOUT seconds, for changes made with queryset.update().
+"""
+
+import copy
+import logging
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+INDEX_TIMEOUT = 60 * 10
+CHANGE_CHECK_INTERVAL = 5
+
+
+def discounted_price(price, discount_percentage):
+    """Price after a percentage discount."""
+    return price * (1 - Decimal(discount_percentage) / 100)
+
+
+def _deals_version():
+    """(number of deals, latest updated_at): changes whenever a deal is created, edited or deleted."""
+    from .models import Deal
+
+    version = Deal.objects.aggregate(n=Count('pk'), changed=Max('updated_at'))
+    return version['n'], version['changed']
+
+
+def _build_index(now):
+    from .models import Deal
+
+    deals = {}
+    for deal in Deal.objects.filter(is_active=True, start_date__lte=now, end_date__gte=now).order_by('pk'):
+        deals.setdefault(deal.book_id, deal)
+
+    boundaries = Deal.objects.filter(is_active=True).aggregate(
+        next_start=Min('start_date', filter=Q(start_date__gt=now)),
+        next_end=Min('end_date', filter=Q(end_date__gte=now)),
+    )
+    expires_at = now + timedelta(seconds=INDEX_TIMEOUT)
+    if boundaries['next_start'] is not None:
+        expires_at = min(expires_at, boundaries['next_start'])
+    if boundaries['next_end'] is not None:
+        # A deal is still running at its end_date and stops right after it
+        expires_at = min(expires_at, boundaries['next_end'] + timedelta(microseconds=1))
+    return deals, expires_at
+
+
+_index_lock = threading.Lock()
+_index_state = {'deals': None, 'expires_at': None, 'version': None, 'checked_at': 0.0}
+
+
+def _is_current(state, now):
+    return state['deals'] is not None and now < state['expires_at']
+
+
+def _is_checked(state):
+    return time.monotonic() - state['checked_at'] < CHANGE_CHECK_INTERVAL
+
+
+def active_deals():
+    """
+    The deals running right now.
+
+    Returns:
+        dict: {book_id: Deal}
+    """
+    now = timezone.now()
+    if _is_current(_index_state, now) and _is_checked(_index_state):
+        return _index_state['deals']
+    with _index_lock:
+        if _is_current(_index_state, now) and _is_checked(_index_state):
+            return _index_state['deals']
+        version = _deals_version()
+        if not _is_current(_index_state, now) or version != _index_state['version']:
+            deals, expires_at = _build_index(now)
+            _index_state.update(deals=deals, expires_at=expires_at, version=version)
+            logger.debug(f"Loaded {len(deals)} active deals, valid until {expires_at.isoformat()}")
+        _index_state['checked_at'] = time.monotonic()
+        return _index_state['deals']
+
+
+def get_active_deal(book_id):
+    """The deal running on a book right now, or None."""
+    return active_deals().get(book_id)
+
+
+def price_for(book):
+    """The price of a Book right now, with its active deal (if any) applied."""
+    deal = get_active_deal(book.pk)
+    if deal is None:
+        return book.price
+    return discounted_price(book.price, deal.discount_percentage)
+
+
+def deals_on_sale(limit=None):
+    """Running deals with their books loaded (one in_bulk query), biggest discount first."""
+    from .models import Book
+
+    deals = sorted(active_deals().values(), key=lambda deal: (-deal.discount_percentage, deal.pk))[:limit]
+    books = Book.objects.in_bulk([deal.book_id for deal in deals])
+    on_sale = []
+    for deal in deals:
+        if deal.book_id in books:
+            # A copy, so the shared index never holds per-request books
+            deal = copy.copy(deal)
+            deal.book = books[deal.book_id]
+            on_sale.append(deal)
+    return on_sale
+
+
+def order_total(orders):
+    """
+    Total of orders at today's prices (deals applied to catalog books).
+
+    Pass a queryset with select_related('book', 'user_book') to avoid a query per order.
+    """
+    total = Decimal('0')
+    for order in orders:
+        if order.book_id:
+            total += price_for(order.book) * order.quantity
+        elif order.user_book_id:
+            total += order.user_book.price * order.quantity
+    return total
+
+
+def invalidate_deals():
+    """Reload the active deals on next use (other processes notice within CHANGE_CHECK_INTERVAL)."""
+    _index_state['deals'] = None
@@ -0,0 +1,122 @@
+"""
+Query-side caching for semantic search.
+
+Two layers:
+  - a per-process LRU of query embeddings, so repeated queries skip the
+    Sentence-BERT encode entirely;
+  - search results in the Django cache, keyed by a SHA-256 digest of the
+    normalized query plus the embedding index version, so every worker
+    (with a shared cache backend) computes the same key and entries expire
+    as soon as the catalog changes.
+
+Queries are normalized (Unicode NFKC, case-folded, whitespace collapsed)
+before either lookup, so "Fantasy  Books" and "fantasy books" share entries.
+"""
+
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+RESULT_CACHE_PREFIX = 'semantic_search:v2'
+RESULT_CACHE_TIMEOUT = 60 * 30  # 30 minutes
+EMBEDDING_CACHE_SIZE = 2048
+
+
+def normalize_query(query):
+    """Canonical form of a search query: NFKC, case-folded, single-spaced."""
+    return ' '.join(unicodedata.normalize('NFKC', str(query)).casefold().split())
+
+
+def query_digest(normalized_query):
+    """Stable (process-independent) digest of a normalized query."""
+    return hashlib.sha256(normalized_query.encode('utf-8')).hexdigest()
+
+
+def result_cache_key(normalized_query, top_n, index_version):
+    return f"{RESULT_CACHE_PREFIX}:{index_version}:{top_n}:{query_digest(normalized_query)}"
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU mapping normalized queries to their embeddings."""
+
+    def __init__(self, maxsize=EMBEDDING_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, normalized_query):
+        with self._lock:
+            embedding = self._entries.get(normalized_query)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(normalized_query)
+            self.hits += 1
+            return embedding
+
+    def put(self, normalized_query, embedding):
+        with self._lock:
+            self._entries[normalized_query] = embedding
+            self._entries.move_to_end(normalized_query)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class CacheStats:
+    """Hit/miss counters for the result cache (per process)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+embedding_cache = QueryEmbeddingCache()
+result_stats = CacheStats()
+
+
+def _ratio(hits, misses):
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+def get_stats():
+    """Hit/miss counters for both cache layers in this process."""
+    return {
+        'results': {
+            'hits': result_stats.hits,
+            'misses': result_stats.misses,
+            'hit_ratio': _ratio(result_stats.hits, result_stats.misses),
+        },
+        'embeddings': {
+            'hits': embedding_cache.hits,
+            'misses': embedding_cache.misses,
+            'hit_ratio': _ratio(embedding_cache.hits, embedding_cache.misses),
+            'size': len(embedding_cache),
+            'maxsize': embedding_cache.maxsize,
+        },
+    }
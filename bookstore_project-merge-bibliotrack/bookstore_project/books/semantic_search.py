@@ -1,28 +1,21 @@
+import json
 import numpy as np
 import os
-from sentence_transformers import SentenceTransformer
 from .models import Book, UserBook
+from .embedding_index import get_embedding_index, hydrate
+from .model_registry import get_sentence_transformer
+from .query_cache import (
+    RESULT_CACHE_TIMEOUT, embedding_cache, normalize_query, result_cache_key, result_stats,
+)
 from django.core.cache import cache
-from django.db.models import Q
+from django.db import transaction
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Global model variable
-_model = None
-
 def get_sentence_transformer_model():
-    """Load and cache the Sentence-BERT model."""
-    global _model
-    if _model is None:
-        try:
-            # Use a smaller, efficient model for semantic search
-            _model = SentenceTransformer('all-MiniLM-L6-v2')
-            logger.info("Sentence-BERT model loaded successfully")
-        except Exception as e:
-            logger.error(f"Failed to load Sentence-BERT model: {e}")
-            return None
-    return _model
+    """Return the shared Sentence-BERT model from the model registry (None if unavailable)."""
+    return get_sentence_transformer()
 
 def compute_semantic_embedding(text):
     """Compute semantic embedding for a given text."""
@@ -56,6 +49,11 @@ def semantic_search_books(query, top_n=10):
     """
     Perform semantic search on books using Sentence-BERT embeddings.
 
+    The query is normalized first (see query_cache.normalize_query); its
+    embedding is kept in a per-process LRU and the ranked ids are cached in
+    the shared cache under a stable digest plus the index version, so a
+    catalog change makes older entries unreachable.
+
     Args:
         query (str): The search query
         top_n (int): Number of top results to return
@@ -63,105 +61,135 @@ def semantic_search_books(query, top_n=10):
     Returns:
         list: List of (book, similarity_score) tuples
     """
-    from django.core.cache import cache
-    import logging
-    logger = logging.getLogger(__name__)
-
     try:
-        # Check cache first
-        cache_key = f"semantic_search_{hash(query)}_{top_n}"
-        cached_results = cache.get(cache_key)
-        if cached_results:
-            return cached_results
-
-        # Compute query embedding
-        query_embedding = compute_semantic_embedding(query)
-        if query_embedding is None:
-            logger.warning("Could not compute embedding for query")
+        normalized = normalize_query(query)
+        if not normalized:
             return []
 
-        # Get all books with semantic embeddings
-        books_with_embeddings = Book.objects.exclude(semantic_embedding__isnull=True).exclude(semantic_embedding__exact=[])
-
-        similarities = []
-
-        for book in books_with_embeddings:
-            try:
-                book_embedding = book.semantic_embedding
-                if book_embedding:
-                    similarity = cosine_similarity(query_embedding, book_embedding)
-                    similarities.append((book, similarity))
-            except Exception as e:
-                logger.error(f"Error computing similarity for book {book.id}: {e}")
-                continue
+        index = get_embedding_index()
+        index.ensure_built()
 
-        # Also search UserBook model
-        user_books_with_embeddings = UserBook.objects.filter(is_available=True).exclude(semantic_embedding__isnull=True).exclude(semantic_embedding__exact=[])
-
-        for user_book in user_books_with_embeddings:
-            try:
-                book_embedding = user_book.semantic_embedding
-                if book_embedding:
-                    similarity = cosine_similarity(query_embedding, book_embedding)
-                    similarities.append((user_book, similarity))
-            except Exception as e:
-                logger.error(f"Error computing similarity for user_book {user_book.id}: {e}")
-                continue
+        # Cached entries hold (kind, id, score) triples, not model instances
+        cache_key = result_cache_key(normalized, top_n, index.stamp)
+        cached_results = cache.get(cache_key)
+        result_stats.record(cached_results is not None)
+        if cached_results is not None:
+            return hydrate(cached_results)
 
-        # Sort by similarity (higher is better)
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        # Compute query embedding (or reuse a recent one)
+        query_embedding = embedding_cache.get(normalized)
+        if query_embedding is None:
+            query_embedding = compute_semantic_embedding(normalized)
+            if query_embedding is None:
+                logger.warning("Could not compute embedding for query")
+                return []
+            embedding_cache.put(normalized, query_embedding)
 
-        # Cache results for 30 minutes
-        cache.set(cache_key, similarities[:top_n], 60 * 30)
+        # Score against the in-memory embedding index (one matrix-vector product)
+        results = index.search(query_embedding, top_n=top_n)
+        cache.set(cache_key, [(kind, pk, float(score)) for kind, pk, score in results], RESULT_CACHE_TIMEOUT)
+        similarities = hydrate(results)
 
         logger.info(f"Semantic search found {len(similarities)} results for query: {query}")
-        return similarities[:top_n]
+        return similarities
 
     except Exception as e:
         logger.error(f"Error in semantic search: {e}")
         return []
 
-def precompute_book_embeddings():
+def embedding_text(obj):
+    """Rich text representation of a Book/UserBook used for its embedding."""
+    return f"{obj.title} {obj.author} {obj.genre} {obj.category} {obj.description}".strip()
+
+def _read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable embedding checkpoint {path}: {e}")
+        return {}
+
+def _write_checkpoint(path, checkpoint):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def precompute_book_embeddings(force=False, batch_size=256, chunk_size=2000, checkpoint_path=None):
     """
     Precompute semantic embeddings for all books that don't have them.
     This should be run as a management command.
+
+    Rows are read in primary-key order in chunks of `chunk_size`, encoded in
+    batches of `batch_size` texts and written back with bulk_update(). After
+    every batch the last processed id per model is saved to `checkpoint_path`,
+    so an interrupted run resumes where it stopped; the checkpoint is removed
+    once both models are done. With force=True every row is re-embedded.
+
+    Returns:
+        tuple: (updated_books, updated_user_books)
     """
     logger.info("Starting precomputation of semantic embeddings")
 
-    # Process Book model
-    books_without_embeddings = Book.objects.filter(
-        Q(semantic_embedding__isnull=True) | Q(semantic_embedding__exact=[])
-    )
-
-    updated_books = 0
-    for book in books_without_embeddings:
-        # Create a rich text representation for embedding
-        text_content = f"{book.title} {book.author} {book.genre} {book.category} {book.description}"
-        embedding = compute_semantic_embedding(text_content)
-
-        if embedding:
-            book.semantic_embedding = embedding
-            book.save()
-            updated_books += 1
-            logger.info(f"Computed embedding for book: {book.title}")
-
-    # Process UserBook model
-    user_books_without_embeddings = UserBook.objects.filter(
-        is_available=True
-    ).filter(
-        Q(semantic_embedding__isnull=True) | Q(semantic_embedding__exact=[])
+    model = get_sentence_transformer_model()
+    if model is None:
+        logger.error("Sentence-BERT model unavailable; no embeddings computed")
+        return 0, 0
+
+    checkpoint = _read_checkpoint(checkpoint_path)
+    if checkpoint and checkpoint.get('force') != force:
+        logger.info("Embedding checkpoint was written in a different mode; starting over")
+        checkpoint = {}
+    checkpoint['force'] = force
+
+    sources = (
+        ('book', Book.objects.all()),
+        ('user_book', UserBook.objects.filter(is_available=True)),
     )
-
-    updated_user_books = 0
-    for user_book in user_books_without_embeddings:
-        text_content = f"{user_book.title} {user_book.author} {user_book.genre} {user_book.category} {user_book.description}"
-        embedding = compute_semantic_embedding(text_content)
-
-        if embedding:
-            user_book.semantic_embedding = embedding
-            user_book.save()
-            updated_user_books += 1
-            logger.info(f"Computed embedding for user book: {user_book.title}")
-
-    logger.info(f"Precomputed embeddings for {updated_books} books and {updated_user_books} user books")
-    return updated_books, updated_user_books
+    counts = {}
+    index = get_embedding_index()
+    for label, queryset in sources:
+        if not force:
+            queryset = queryset.filter(semantic_embedding__isnull=True)
+        queryset = queryset.only('id', 'title', 'author', 'genre', 'category', 'description').order_by('id')
+        model_class = queryset.model
+        last_id = checkpoint.get(label, 0)
+        updated = 0
+
+        while True:
+            # Keyset pagination: each chunk is a fresh query, so rows written by
+            # bulk_update don't disturb an open cursor and resuming is just id > last_id
+            chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            for start in range(0, len(chunk), batch_size):
+                batch = [obj for obj in chunk[start:start + batch_size] if embedding_text(obj)]
+                if batch:
+                    embeddings = model.encode(
+                        [embedding_text(obj) for obj in batch],
+                        batch_size=batch_size,
+                        convert_to_numpy=True,
+                        show_progress_bar=False,
+                    )
+                    for obj, embedding in zip(batch, embeddings):
+                        obj.semantic_embedding = embedding
+                    with transaction.atomic():
+                        model_class.objects.bulk_update(batch, ['semantic_embedding'])
+                    updated += len(batch)
+                    # bulk_update() skips post_save, so let the search index rebuild
+                    index.invalidate()
+                last_id = chunk[min(start + batch_size, len(chunk)) - 1].id
+                checkpoint[label] = last_id
+                _write_checkpoint(checkpoint_path, checkpoint)
+            logger.info(f"Embedded {updated} {model_class.__name__} rows (up to id {last_id})")
+        counts[label] = updated
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    logger.info(f"Precomputed embeddings for {counts['book']} books and {counts['user_book']} user books")
+    return counts['book'], counts['user_book']
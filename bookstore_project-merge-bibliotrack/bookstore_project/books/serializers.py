@@ -4,4 +4,5 @@ from .models import Book
 class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
-        fields = '__all__'
+        # Vector columns are internal search data, not part of the API
+        exclude = ['image_features', 'semantic_embedding']
@@ -0,0 +1,191 @@
+from functools import partial
+
+import numpy as np
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from .models import Book, UserBook, Order, Review, Wishlist, RecentlyViewed, Deal
+from . import facets, leaderboard, pricing
+from .embedding_index import (
+    get_embedding_index, get_visual_feature_index, get_cover_descriptor_index, KIND_BOOK, KIND_USER_BOOK,
+)
+from .hamming_index import get_cover_hash_index
+
+# (index accessor, model field it is built from)
+INDEXED_FIELDS = (
+    (get_embedding_index, 'semantic_embedding'),
+    (get_visual_feature_index, 'image_features'),
+    (get_cover_descriptor_index, 'cover_descriptor'),
+    (get_cover_hash_index, 'image_hash'),
+)
+
+
+def _touches(update_fields, *fields):
+    """False when a save() explicitly limited update_fields to unrelated columns."""
+    return update_fields is None or any(field in update_fields for field in fields)
+
+
+def _stored_fields(sender):
+    """Columns whose stored values the index and facet signals compare against."""
+    fields = [field for _, field in INDEXED_FIELDS] + facets.tracked_fields(sender._meta.model_name)
+    return list(dict.fromkeys(fields))
+
+
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=UserBook)
+def remember_stored_row(sender, instance, update_fields=None, **kwargs):
+    """
+    Note the indexed and faceted values the row had before this save (one query),
+    so the post_save handlers only act on real changes.
+    """
+    fields = _stored_fields(sender)
+    instance._stored_row = None
+    if not _touches(update_fields, *fields):
+        return
+    instance._stored_row = {}
+    if instance.pk:
+        instance._stored_row = sender.objects.filter(pk=instance.pk).values(*fields).first() or {}
+
+
+def _searchable_value(kind, row, field):
+    """The value a row contributes to an index (unavailable listings are not searchable)."""
+    if kind == KIND_USER_BOOK and not row.get('is_available', True):
+        return None
+    value = row.get(field)
+    return value if value is not None and len(value) else None
+
+
+def _same_value(a, b, dtype=None):
+    """Whether two indexed values are equal (vectors once stored in the field's dtype)."""
+    if a is None or b is None or dtype is None:
+        return (a is None and b is None) or (dtype is None and a == b)
+    return np.array_equal(np.asarray(a, dtype=dtype), np.asarray(b, dtype=dtype))
+
+
+def _sync_indexes(kind, instance, update_fields, *extra_fields):
+    stored = getattr(instance, '_stored_row', None)
+    if stored is None:
+        return
+    row = {field: getattr(instance, field) for field in _stored_fields(type(instance))}
+    for get_index, field in INDEXED_FIELDS:
+        if not _touches(update_fields, field, *extra_fields):
+            continue
+        value = _searchable_value(kind, row, field)
+        dtype = getattr(type(instance)._meta.get_field(field), 'dtype', None)
+        if _same_value(_searchable_value(kind, stored, field), value, dtype):
+            continue
+        # Applied once the row is committed, so other workers rebuild from committed data
+        transaction.on_commit(partial(get_index().apply_change, kind, instance.pk, value))
+
+
+@receiver(post_save, sender=Book)
+def sync_book_embedding(sender, instance, update_fields=None, **kwargs):
+    """Keep the search indexes in sync with Book saves that change an indexed vector."""
+    _sync_indexes(KIND_BOOK, instance, update_fields)
+
+
+@receiver(post_save, sender=UserBook)
+def sync_user_book_embedding(sender, instance, update_fields=None, **kwargs):
+    """Keep the search indexes in sync with UserBook saves (only available listings are searchable)."""
+    _sync_indexes(KIND_USER_BOOK, instance, update_fields, 'is_available')
+
+
+def _remove_from_indexes(kind, instance):
+    row = {field: getattr(instance, field) for field in _stored_fields(type(instance))}
+    for get_index, field in INDEXED_FIELDS:
+        if _searchable_value(kind, row, field) is not None:
+            transaction.on_commit(partial(get_index().apply_change, kind, instance.pk))
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_embedding(sender, instance, **kwargs):
+    _remove_from_indexes(KIND_BOOK, instance)
+
+
+@receiver(post_delete, sender=UserBook)
+def remove_user_book_embedding(sender, instance, **kwargs):
+    _remove_from_indexes(KIND_USER_BOOK, instance)
+
+
+@receiver(post_save, sender=Book)
+def sync_book_popularity(sender, instance, created=False, update_fields=None, **kwargs):
+    """Keep the book's leaderboard row (genre, category, catalog rating) in sync."""
+    if created or _touches(update_fields, 'genre', 'category', 'rating'):
+        leaderboard.sync_book(instance)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    """Note whether the order already counted as a sale, to detect status transitions."""
+    previous = None
+    if instance.pk:
+        previous = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+    instance._was_sold = previous in leaderboard.SOLD_STATUSES
+
+
+@receiver(post_save, sender=Order)
+def record_order_sale(sender, instance, **kwargs):
+    """Count an order on the leaderboard when it leaves the cart, and uncount it when cancelled."""
+    if not instance.book_id:
+        return
+    is_sold = instance.status in leaderboard.SOLD_STATUSES
+    was_sold = getattr(instance, '_was_sold', False)
+    if is_sold != was_sold:
+        amount = instance.quantity if is_sold else -instance.quantity
+        leaderboard.record_event(instance.book_id, 'order', amount, when=instance.ordered_at)
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_sale(sender, instance, **kwargs):
+    if instance.book_id and instance.status in leaderboard.SOLD_STATUSES:
+        leaderboard.record_event(instance.book_id, 'order', -instance.quantity, when=instance.ordered_at)
+
+
+@receiver(post_save, sender=Review)
+def record_review(sender, instance, created=False, **kwargs):
+    if created:
+        leaderboard.record_event(instance.book_id, 'review', when=instance.created_at, rating=instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review(sender, instance, **kwargs):
+    leaderboard.record_event(instance.book_id, 'review', -1, when=instance.created_at, rating=instance.rating)
+
+
+@receiver(post_save, sender=Wishlist)
+def record_wishlist(sender, instance, created=False, **kwargs):
+    if created:
+        leaderboard.record_event(instance.book_id, 'wishlist', when=instance.added_at)
+
+
+@receiver(post_save, sender=RecentlyViewed)
+def record_view(sender, instance, created=False, **kwargs):
+    if created:
+        leaderboard.record_event(instance.book_id, 'view', when=instance.viewed_at)
+
+
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+def refresh_active_deals(sender, **kwargs):
+    """Reload this process's active-deal index after a deal changes (others poll, see pricing)."""
+    pricing.invalidate_deals()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=UserBook)
+def update_facet_counts(sender, instance, update_fields=None, **kwargs):
+    model_name = sender._meta.model_name
+    previous = getattr(instance, '_stored_row', None)
+    if previous is None or not _touches(update_fields, *facets.tracked_fields(model_name)):
+        return
+    row = {field: getattr(instance, field) for field in facets.tracked_fields(model_name)}
+    facets.record_change(facets.facet_values(model_name, previous) if previous else {},
+                         facets.facet_values(model_name, row))
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=UserBook)
+def remove_facet_counts(sender, instance, **kwargs):
+    model_name = sender._meta.model_name
+    row = {field: getattr(instance, field) for field in facets.tracked_fields(model_name)}
+    facets.record_change(facets.facet_values(model_name, row), {})
@@ -0,0 +1,191 @@
+"""
+Background tasks: the slow side work of requests, run on Celery workers.
+
+Tasks are grouped into named queues so each kind of work gets its own workers:
+
+    pdf    invoice rendering
+    email  order confirmation mail
+    ml     forum moderation, listing embeddings and cover signatures
+
+On a worker every task retries failures with exponential backoff and jitter;
+an eager task fails once instead of re-running inside the caller. enqueue()
+optionally takes an idempotency key: the first call with a key claims it in
+the cache and later calls with the same key are dropped, so retried payment
+callbacks don't send the confirmation twice. A task that runs out of retries
+releases its claim.
+
+With CELERY_TASK_ALWAYS_EAGER (the default with DEBUG and no broker, see
+settings) tasks run in-process at enqueue time.
+"""
+
+import base64
+import hashlib
+import logging
+
+from celery import Task, shared_task
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = 60 * 60 * 24
+MODERATION_COALESCE_SECONDS = 5  # new posts within this window share one moderation run
+
+
+class BackgroundTask(Task):
+    """Base task: retried with exponential backoff, and releases its idempotency claim when it gives up."""
+    autoretry_for = (Exception,)
+    dont_autoretry_for = (ImportError,)  # a missing optional dependency won't appear on retry
+    max_retries = 5
+    retry_backoff = True
+    retry_backoff_max = 600
+    retry_jitter = True
+
+    def retry(self, *args, **kwargs):
+        if self.request.is_eager and kwargs.get('exc') is not None:
+            # Eager retries would run again right away inside the request, ignoring the backoff
+            raise kwargs['exc']
+        return super().retry(*args, **kwargs)
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        cache.delete(_claim_key(task_id))
+        logger.error(f"Task {self.name} [{task_id}] failed: {exc}")
+
+
+def check_eager_mode():
+    """Log at startup when, outside DEBUG, tasks would not run on the workers."""
+    if settings.DEBUG:
+        return
+    if settings.CELERY_TASK_ALWAYS_EAGER:
+        logger.warning("CELERY_TASK_ALWAYS_EAGER is on: background tasks run inside the requests that queue them")
+    elif settings.CELERY_BROKER_URL.startswith('memory://'):
+        logger.error("CELERY_BROKER_URL is not set: background tasks are queued in process memory and never run")
+
+
+def _claim_key(task_id):
+    return f"task-claim:{task_id}"
+
+
+def idempotent_task_id(task, key):
+    """Deterministic task id for (task, idempotency key)."""
+    return f"{task.name}:{hashlib.sha1(str(key).encode()).hexdigest()}"
+
+
+def enqueue(task, args=(), kwargs=None, idempotency_key=None, idempotency_ttl=IDEMPOTENCY_TTL, **options):
+    """
+    Queue a task on its queue (or run it now in eager mode).
+
+    options are passed to apply_async (e.g. countdown).
+
+    Returns:
+        The AsyncResult, or None if the idempotency key was already claimed
+    """
+    if idempotency_key is not None:
+        task_id = idempotent_task_id(task, idempotency_key)
+        if not cache.add(_claim_key(task_id), 1, idempotency_ttl):
+            logger.info(f"Skipping {task.name}: already queued for key {idempotency_key}")
+            return None
+        options['task_id'] = task_id
+    return task.apply_async(args, kwargs or {}, **options)
+
+
+@shared_task(base=BackgroundTask, queue='pdf')
+def render_invoice(user_id, order_ids, shipping_info):
+    """Render the invoice PDF, then hand it to the email queue."""
+    from .views import generate_invoice_pdf
+
+    pdf = base64.b64encode(generate_invoice_pdf(order_ids, shipping_info).getvalue()).decode('ascii')
+    enqueue(
+        email_order_confirmation,
+        args=(user_id, order_ids, shipping_info, pdf),
+        idempotency_key=f"order-confirmation:{sorted(order_ids)}",
+    )
+
+
+@shared_task(base=BackgroundTask, queue='email')
+def email_order_confirmation(user_id, order_ids, shipping_info, pdf=None):
+    from django.contrib.auth.models import User
+    from .views import send_order_confirmation_email
+
+    user = User.objects.get(pk=user_id)
+    pdf_buffer = None
+    if pdf is not None:
+        from io import BytesIO
+        pdf_buffer = BytesIO(base64.b64decode(pdf))
+    send_order_confirmation_email(user, order_ids, shipping_info, pdf_buffer)
+
+
+def queue_order_confirmation(user, order_ids, shipping_info):
+    """Render and mail the invoice for placed orders in the background (once per set of orders)."""
+    if not order_ids or not user.email:
+        return None
+    return enqueue(
+        render_invoice,
+        args=(user.id, list(order_ids), dict(shipping_info)),
+        idempotency_key=f"invoice:{sorted(order_ids)}",
+    )
+
+
+@shared_task(base=BackgroundTask, queue='ml')
+def moderate_pending(batch_size=256):
+    """Moderate every pending post and comment (see moderation_queue)."""
+    from .moderation_queue import drain_pending
+
+    return drain_pending(batch_size=batch_size)
+
+
+def queue_moderation():
+    """
+    Schedule a moderation run once the current transaction commits; bursts of
+    new posts and comments share one run (`manage.py moderation_worker` still
+    sweeps anything left pending).
+    """
+    from django.db import transaction
+
+    transaction.on_commit(lambda: enqueue(
+        moderate_pending,
+        idempotency_key='pending',
+        idempotency_ttl=MODERATION_COALESCE_SECONDS,
+        countdown=MODERATION_COALESCE_SECONDS,
+    ))
+
+
+@shared_task(base=BackgroundTask, queue='ml')
+def index_listing(model_name, pk):
+    """Compute the semantic embedding and cover signatures of a Book or UserBook."""
+    from .models import Book, UserBook
+    from .semantic_search import compute_semantic_embedding, embedding_text
+
+    model = {'book': Book, 'userbook': UserBook}[model_name]
+    obj = model.objects.filter(pk=pk).first()
+    if obj is None:
+        return []
+    fields = []
+    embedding = compute_semantic_embedding(embedding_text(obj))
+    if embedding is not None:
+        obj.semantic_embedding = embedding
+        fields.append('semantic_embedding')
+
+    cover = getattr(obj, 'cover_image', None) or getattr(obj, 'image', None)
+    if cover:
+        from .advanced_visual_search import extract_cover_signatures
+
+        with cover.open('rb') as f:
+            signatures = extract_cover_signatures(f.read())
+        if signatures is not None:
+            for field, value in signatures.items():
+                setattr(obj, field, value)
+            fields.extend(signatures)
+    if fields:
+        # post_save keeps the search indexes in sync with the new vectors
+        obj.save(update_fields=fields)
+    return fields
+
+
+def queue_listing_index(obj):
+    """Index a saved Book or UserBook once the current transaction commits."""
+    from django.db import transaction
+
+    model_name, pk = obj._meta.model_name, obj.pk
+    transaction.on_commit(lambda: enqueue(index_listing, args=(model_name, pk)))
+
@@ -2,6 +2,7 @@ import json
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
 from django.core.files.uploadedfile import SimpleUploadedFile
 from unittest.mock import patch, MagicMock
 from .models import Book, Review, Order, UserProfile, Wishlist, UserBook, PaymentEvent, BookClubPost, BookClubComment
@@ -544,7 +545,8 @@ class ForumTestCase(TestCase):
         self.post = BookClubPost.objects.create(
             author=self.user,
             title="Test Forum Post",
-            content="This is a test post content."
+            content="This is a test post content.",
+            moderated_at=timezone.now()
         )
 
     def test_book_club_view(self):
@@ -647,3 +649,986 @@ class SerializerTests(TestCase):
         book = serializer.save()
         self.assertEqual(book.title, 'New Book')
         self.assertEqual(float(book.price), 15.99)
+
+
+class EmbeddingIndexTest(TestCase):
+    def setUp(self):
+        from .embedding_index import get_embedding_index
+        self.seller = User.objects.create_user(username='indexseller', password='testpass')
+        self.space = Book.objects.create(
+            title="Space Opera", author="A", genre="Sci-Fi", category="Novel", price=10,
+            semantic_embedding=[1.0, 0.0, 0.0]
+        )
+        self.romance = Book.objects.create(
+            title="Romance", author="B", genre="Romance", category="Novel", price=10,
+            semantic_embedding=[0.0, 1.0, 0.0]
+        )
+        self.listing = UserBook.objects.create(
+            seller=self.seller, title="Used Space Book", author="C", genre="Sci-Fi", category="Novel",
+            price=5, semantic_embedding=[0.9, 0.1, 0.0]
+        )
+        self.index = get_embedding_index()
+        self.index.build()
+
+    def test_search_ranks_books_and_user_books(self):
+        from .embedding_index import hydrate
+        results = hydrate(self.index.search([1.0, 0.0, 0.0], top_n=2))
+        self.assertEqual([obj for obj, score in results], [self.space, self.listing])
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+
+    def test_index_follows_saves_and_deletes(self):
+        from .embedding_index import KIND_BOOK, KIND_USER_BOOK
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Book.objects.create(
+                title="Nebula", author="D", genre="Sci-Fi", category="Novel", price=10,
+                semantic_embedding=[0.0, 0.0, 1.0]
+            )
+        self.assertEqual(self.index.search([0.0, 0.0, 1.0], top_n=1)[0][:2], (KIND_BOOK, added.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.is_available = False
+            self.listing.save()
+            self.romance.delete()
+        keys = {(kind, pk) for kind, pk, _ in self.index.search([1.0, 1.0, 1.0], top_n=10)}
+        self.assertNotIn((KIND_USER_BOOK, self.listing.id), keys)
+        self.assertNotIn((KIND_BOOK, self.romance.id), keys)
+        self.assertEqual(len(self.index), 2)
+
+    def test_unrelated_saves_leave_the_index_alone(self):
+        from django.core.cache import cache
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.space.stock = 3
+            self.space.save()
+            self.listing.price = 4
+            self.listing.save()
+        self.assertEqual(callbacks, [])
+        self.assertTrue(self.index.is_built)
+        self.assertEqual(cache.get(self.index.stamp_key), self.index.stamp)
+
+
+class IVFIndexTest(TestCase):
+    def setUp(self):
+        import numpy as np
+        from .ann_index import IVFIndex
+        from .embedding_index import FlatIndex, KIND_BOOK
+        rng = np.random.default_rng(42)
+        self.vectors = rng.normal(size=(500, 16)).astype(np.float32)
+        self.keys = [(KIND_BOOK, i) for i in range(len(self.vectors))]
+        self.exact = FlatIndex()
+        self.exact.load(self.keys, self.vectors)
+        self.ivf = IVFIndex(nlist=10, nprobe=3)
+        self.ivf.load(self.keys, self.vectors)
+
+    def test_full_probe_matches_exact_search(self):
+        from .ann_index import recall_at_k
+        for query in self.vectors[:20]:
+            exact = self.exact.search(query, top_n=5)
+            approx = self.ivf.search(query, top_n=5, nprobe=10)
+            self.assertEqual(recall_at_k(exact, approx), 1.0)
+
+    def test_incremental_insert_and_delete(self):
+        from .embedding_index import KIND_USER_BOOK
+        query = self.vectors[0] * -1
+        self.ivf.upsert(KIND_USER_BOOK, 999, query)
+        self.assertEqual(self.ivf.search(query, top_n=1)[0][:2], (KIND_USER_BOOK, 999))
+        self.assertEqual(len(self.ivf), 501)
+
+        self.ivf.remove(KIND_USER_BOOK, 999)
+        self.assertNotIn((KIND_USER_BOOK, 999), [r[:2] for r in self.ivf.search(query, top_n=10, nprobe=10)])
+        self.assertEqual(len(self.ivf), 500)
+
+
+class VectorFieldTest(TestCase):
+    def test_round_trip_through_database(self):
+        import numpy as np
+        book = Book.objects.create(
+            title="Vectors", author="A", genre="Sci-Fi", category="Novel", price=10,
+            semantic_embedding=[0.25, -1.5, 3.0], image_features=np.array([0.1, 0.5, 1.0])
+        )
+        book.refresh_from_db()
+        self.assertEqual(book.semantic_embedding.dtype, np.float32)
+        np.testing.assert_array_equal(book.semantic_embedding, [0.25, -1.5, 3.0])
+        # image_features is stored as float16
+        np.testing.assert_allclose(book.image_features, [0.1, 0.5, 1.0], atol=1e-3)
+        self.assertFalse(Book.objects.filter(semantic_embedding__isnull=True).exists())
+
+    def test_encoded_size(self):
+        from .fields import HEADER, encode_vector, decode_vector
+        data = encode_vector([0.0] * 384)
+        self.assertEqual(len(data), HEADER.size + 384 * 4)
+        self.assertEqual(len(encode_vector([0.0] * 384, 'float16')), HEADER.size + 384 * 2)
+        self.assertEqual(decode_vector(data).shape, (384,))
+        with self.assertRaises(ValueError):
+            decode_vector(data[:-1])
+
+
+class PrecomputeEmbeddingsTest(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Book.objects.create(title=f"Book {i}", author="A", genre="G", category="C", price=10)
+
+    def test_batched_precompute_resumes_from_checkpoint(self):
+        import os
+        import tempfile
+        import numpy as np
+        from . import semantic_search
+
+        model = MagicMock()
+        model.encode.side_effect = lambda texts, **kwargs: np.ones((len(texts), 3), dtype=np.float32)
+        first_id = Book.objects.order_by('id').first().id
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'checkpoint.json')
+            with open(checkpoint, 'w') as f:
+                json.dump({'force': False, 'book': first_id + 1}, f)
+            with patch.object(semantic_search, 'get_sentence_transformer_model', return_value=model):
+                self.assertEqual(semantic_search.precompute_book_embeddings(batch_size=2, checkpoint_path=checkpoint), (3, 0))
+                self.assertFalse(os.path.exists(checkpoint))
+                self.assertEqual(semantic_search.precompute_book_embeddings(force=True, batch_size=2), (5, 0))
+        self.assertEqual(model.encode.call_count, 2 + 3)
+        self.assertFalse(Book.objects.filter(semantic_embedding__isnull=True).exists())
+
+
+class VisualFeatureSearchTest(TestCase):
+    def _cover(self, color):
+        buffer = BytesIO()
+        Image.new('RGB', (80, 100), color).save(buffer, format='PNG')
+        buffer.seek(0)
+        return buffer
+
+    def test_enhanced_search_uses_feature_matrix(self):
+        from .visual_search import extract_features_from_image, find_similar_books_enhanced
+        seller = User.objects.create_user(username='visualseller', password='testpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            red = Book.objects.create(
+                title="Red Cover", author="A", genre="G", category="C", price=10,
+                image_features=extract_features_from_image(Image.open(self._cover((255, 0, 0))))
+            )
+            Book.objects.create(
+                title="Blue Cover", author="B", genre="G", category="C", price=10,
+                image_features=extract_features_from_image(Image.open(self._cover((0, 0, 255))))
+            )
+            listing = UserBook.objects.create(
+                seller=seller, title="Dark Red Cover", author="C", genre="G", category="C", price=5,
+                image_features=extract_features_from_image(Image.open(self._cover((200, 10, 10))))
+            )
+
+        results = find_similar_books_enhanced(self._cover((250, 0, 0)), top_n=5)
+        # The blue cover falls below the similarity threshold
+        self.assertEqual([(obj, kind) for obj, score, kind in results], [(red, 'book'), (listing, 'user_book')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.is_available = False
+            listing.save()
+        results = find_similar_books_enhanced(self._cover((250, 0, 0)), top_n=5)
+        self.assertEqual([obj for obj, score, kind in results], [red])
+
+
+class CoverHashSearchTest(TestCase):
+    def test_multi_index_hash_matches_brute_force(self):
+        import random
+        from .hamming_index import MultiIndexHash, hamming_distance
+        rng = random.Random(7)
+        base = rng.getrandbits(64)
+        hashes = {i: base ^ sum(1 << bit for bit in rng.sample(range(64), rng.randint(0, 20))) for i in range(300)}
+        index = MultiIndexHash()
+        for key, value in hashes.items():
+            index.add(key, value)
+        index.remove(0)
+        del hashes[0]
+
+        expected = sorted(hamming_distance(base, value) for value in hashes.values())
+        self.assertEqual([distance for distance, _ in index.search(base, 11)], [d for d in expected if d <= 11])
+        self.assertEqual([distance for distance, _ in index.nearest(base, 250)], expected[:250])
+
+    def test_two_stage_search_reranks_hash_candidates(self):
+        from .advanced_visual_search import cover_hash, extract_advanced_features, find_similar_books_advanced
+        covers = {}
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, colors in (('Stripes', ((255, 255, 0), (0, 0, 128))), ('Blocks', ((0, 128, 0), (255, 255, 255)))):
+                img = Image.new('RGB', (120, 160), colors[0])
+                for x in range(0, 120, 30):
+                    img.paste(colors[1], (x, 0, x + 15, 160) if name == 'Stripes' else (x, x, x + 20, x + 20))
+                covers[name] = img
+                Book.objects.create(
+                    title=name, author="A", genre="G", category="C", price=10,
+                    image_hash=cover_hash(img), cover_descriptor=extract_advanced_features(img)
+                )
+
+        results = find_similar_books_advanced(covers['Stripes'].resize((90, 120)), top_n=2, mode='two_stage')
+        self.assertEqual([book.title for book, score in results], ['Stripes', 'Blocks'])
+        self.assertGreater(results[0][1], results[1][1])
+
+        # A cover with the closest hash but no descriptor ranks after the descriptor matches
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title="Unprocessed", author="B", genre="G", category="C", price=10,
+                                image_hash=cover_hash(covers['Stripes'].resize((90, 120))))
+        results = find_similar_books_advanced(covers['Stripes'].resize((90, 120)), top_n=3, mode='two_stage')
+        self.assertEqual([book.title for book, score in results], ['Stripes', 'Blocks', 'Unprocessed'])
+
+
+class AdvancedVisualSearchCacheTest(TestCase):
+    def _cover_bytes(self, color):
+        img = Image.new('RGB', (120, 160), color)
+        img.paste((255, 255, 255), (20, 20, 60, 100))
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def test_exhaustive_search_is_cached_by_upload_content(self):
+        from django.core.cache import cache
+        from . import advanced_visual_search
+        from .advanced_visual_search import extract_advanced_features, find_similar_books_advanced
+        cache.clear()
+        data = self._cover_bytes((200, 30, 30))
+        # Index changes are applied once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            red = Book.objects.create(
+                title="Red", author="A", genre="G", category="C", price=10,
+                cover_descriptor=extract_advanced_features(Image.open(BytesIO(data)))
+            )
+
+        with patch.object(advanced_visual_search, '_rank_exhaustive', wraps=advanced_visual_search._rank_exhaustive) as rank:
+            first = find_similar_books_advanced(BytesIO(data), top_n=3, mode='exhaustive')
+            second = find_similar_books_advanced(BytesIO(data), top_n=3, mode='exhaustive')
+            self.assertEqual(rank.call_count, 1)
+            self.assertEqual(first, second)
+            self.assertEqual(first[0][0], red)
+
+            # A catalog change bumps the index version, so the cached result is not reused
+            with self.captureOnCommitCallbacks(execute=True):
+                green = Book.objects.create(
+                    title="Green", author="B", genre="G", category="C", price=10,
+                    cover_descriptor=extract_advanced_features(Image.open(BytesIO(self._cover_bytes((30, 200, 30)))))
+                )
+            third = find_similar_books_advanced(BytesIO(data), top_n=3, mode='exhaustive')
+            self.assertEqual(rank.call_count, 2)
+            self.assertEqual([book for book, score in third], [red, green])
+
+
+class ModelRegistryTest(TestCase):
+    def test_lazy_thread_safe_singleton(self):
+        import threading
+        from .model_registry import ModelRegistry
+        registry = ModelRegistry()
+        loads = []
+        registry.register('fake', lambda: loads.append(1) or object(), size_of=lambda model: 1024)
+        self.assertFalse(registry.is_loaded('fake'))
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.get('fake'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(len({id(model) for model in results}), 1)
+        report = registry.memory_report()
+        self.assertEqual(report[0]['name'], 'fake')
+        self.assertTrue(report[0]['loaded'])
+        self.assertEqual(report[0]['param_bytes'], 1024)
+
+    def test_failed_load_is_not_retried_immediately(self):
+        from .model_registry import ModelRegistry
+        registry = ModelRegistry()
+        attempts = []
+
+        def broken_loader():
+            attempts.append(1)
+            raise ImportError("missing package")
+
+        registry.register('broken', broken_loader)
+        self.assertIsNone(registry.get('broken'))
+        self.assertIsNone(registry.get('broken'))
+        self.assertEqual(len(attempts), 1)
+        with self.assertRaises(KeyError):
+            registry.get('unknown')
+
+
+class SemanticQueryCacheTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .query_cache import embedding_cache, result_stats
+        cache.clear()
+        embedding_cache.clear()
+        result_stats.reset()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book = Book.objects.create(
+                title="Dragons", author="A", genre="Fantasy", category="Novel", price=10,
+                semantic_embedding=[1.0, 0.0, 0.0]
+            )
+
+    def test_normalized_queries_share_cache_entries(self):
+        import numpy as np
+        from . import semantic_search
+        from .query_cache import get_stats, normalize_query, result_cache_key
+
+        self.assertEqual(normalize_query("  Fantasy\tBOOKS "), "fantasy books")
+        self.assertEqual(normalize_query("ｆａｎｔａｓｙ books"), "fantasy books")
+        self.assertEqual(result_cache_key("fantasy books", 5, "v1"), result_cache_key("fantasy books", 5, "v1"))
+        self.assertNotEqual(result_cache_key("fantasy books", 5, "v1"), result_cache_key("fantasy books", 5, "v2"))
+
+        model = MagicMock()
+        model.encode.return_value = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+        with patch.object(semantic_search, 'get_sentence_transformer_model', return_value=model):
+            first = semantic_search.semantic_search_books("Fantasy books", top_n=3)
+            second = semantic_search.semantic_search_books("  fantasy   BOOKS", top_n=3)
+        self.assertEqual([obj for obj, _ in first], [self.book])
+        self.assertEqual([obj for obj, _ in second], [self.book])
+        self.assertEqual(model.encode.call_count, 1)
+        stats = get_stats()
+        self.assertEqual((stats['results']['hits'], stats['results']['misses']), (1, 1))
+
+        # A catalog change moves the index version, so the result cache misses but the embedding LRU hits
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title="Elves", author="B", genre="Fantasy", category="Novel", price=10,
+                                semantic_embedding=[0.9, 0.1, 0.0])
+        with patch.object(semantic_search, 'get_sentence_transformer_model', return_value=model):
+            third = semantic_search.semantic_search_books("fantasy books", top_n=3)
+        self.assertEqual(len(third), 2)
+        self.assertEqual(model.encode.call_count, 1)
+        self.assertEqual(get_stats()['embeddings']['hits'], 1)
+
+
+class LazyImportTest(TestCase):
+    def test_lazy_import_defers_execution(self):
+        import sys
+        from .lazy_imports import lazy_import
+        sys.modules.pop('colorsys', None)
+        module = lazy_import('colorsys')
+        self.assertIs(sys.modules['colorsys'], module)
+        self.assertEqual(module.rgb_to_hsv(1.0, 0.0, 0.0)[2], 1.0)
+        with self.assertRaises(ImportError):
+            lazy_import('books_no_such_module')
+
+    def test_optional_feature_falls_back_once(self):
+        from .lazy_imports import optional_feature
+        with patch('books.lazy_imports.importlib.import_module', side_effect=ImportError("no torch")) as mock_import:
+            search = optional_feature('.semantic_search', 'semantic_search_books', lambda *args, **kwargs: [], 'books')
+            self.assertEqual(search("fantasy"), [])
+            self.assertEqual(search("fantasy"), [])
+        self.assertEqual(mock_import.call_count, 1)
+
+
+class ModerationQueueTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='poster', password='testpass')
+
+    def _fake_model(self):
+        import numpy as np
+        model = MagicMock()
+        model.predict_proba.side_effect = lambda texts: np.array(
+            [[0.1, 0.9] if 'stupid' in text else [0.95, 0.05] for text in texts]
+        )
+        return model
+
+    def test_posting_does_not_run_classifier(self):
+        self.client.login(username='poster', password='testpass')
+        with patch('books.moderation_utils.moderate_forum_batch') as mock_batch, \
+                patch('books.views.queue_moderation') as mock_queue:
+            self.client.post(reverse('create_post'), {'title': 'Stupid', 'content': 'stupid book'})
+        mock_batch.assert_not_called()
+        mock_queue.assert_called_once_with()
+        post = BookClubPost.objects.get(title='Stupid')
+        self.assertIsNone(post.moderated_at)
+
+    def test_worker_moderates_pending_rows_in_batches(self):
+        from .moderation_queue import drain_pending
+        from .moderation_utils import moderator
+
+        posts = [
+            BookClubPost.objects.create(author=self.user, title=f"Post {i}", content="stupid" if i == 2 else "lovely")
+            for i in range(5)
+        ]
+        BookClubComment.objects.create(author=self.user, post=posts[0], content="what a stupid take")
+        model = self._fake_model()
+        with patch.object(moderator, 'model', model), patch.object(moderator, 'is_trained', True):
+            self.assertEqual(drain_pending(batch_size=3), (6, 2))
+            self.assertEqual(drain_pending(batch_size=3), (0, 0))
+        # Two post batches and one comment batch, one predict_proba call each
+        self.assertEqual(model.predict_proba.call_count, 3)
+        self.assertFalse(BookClubPost.objects.filter(moderated_at__isnull=True).exists())
+        flagged = BookClubPost.objects.get(pk=posts[2].pk)
+        self.assertTrue(flagged.is_moderated)
+        self.assertEqual(flagged.moderation_reason, 'toxic_content')
+        self.assertEqual(BookClubComment.objects.filter(is_moderated=True).count(), 1)
+
+    def test_flagged_and_pending_posts_are_hidden_from_other_users(self):
+        from django.http import HttpResponse
+        flagged = BookClubPost.objects.create(author=self.user, title="Flagged", content="stupid",
+                                              is_moderated=True, moderated_at=timezone.now())
+        pending = BookClubPost.objects.create(author=self.user, title="Pending", content="lovely")
+        User.objects.create_user(username='reader', password='testpass')
+        User.objects.create_user(username='mod', password='testpass', is_staff=True)
+        with patch('books.views.render', return_value=HttpResponse()):
+            for post in (flagged, pending):
+                self.assertEqual(self.client.get(reverse('post_detail', args=[post.pk])).status_code, 404)
+                for username in ('reader', 'poster', 'mod'):
+                    self.client.login(username=username, password='testpass')
+                    expected = 404 if username == 'reader' else 200
+                    self.assertEqual(self.client.get(reverse('post_detail', args=[post.pk])).status_code, expected)
+                    self.client.logout()
+
+
+    def test_authors_keep_their_flagged_rows_in_lists_and_threads(self):
+        from django.http import HttpResponse
+        passed = BookClubPost.objects.create(author=self.user, title="Passed", content="lovely", moderated_at=timezone.now())
+        flagged = BookClubPost.objects.create(author=self.user, title="Flagged", content="stupid",
+                                              is_moderated=True, moderated_at=timezone.now())
+        comment = BookClubComment.objects.create(author=self.user, post=passed, content="stupid",
+                                                 is_moderated=True, moderated_at=timezone.now())
+        User.objects.create_user(username='reader', password='testpass')
+        for username, expected_posts, expected_comments in (('poster', {passed, flagged}, [comment]), ('reader', {passed}, [])):
+            self.client.login(username=username, password='testpass')
+            with patch('books.views.render', return_value=HttpResponse()) as mock_render:
+                self.client.get(reverse('book_club'))
+                self.assertEqual(set(mock_render.call_args[0][2]['posts']), expected_posts)
+                self.client.get(reverse('post_detail', args=[passed.pk]))
+                self.assertEqual(list(mock_render.call_args[0][2]['comments']), expected_comments)
+            self.client.logout()
+
+class OnlineModerationModelTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(MODERATION={'model_dir': self.directory.name, 'reload_interval': 0})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_partial_fit_publishes_versions_and_hot_swaps(self):
+        from .moderation_utils import ContentModerator, StreamingToxicityModel
+
+        writer = ContentModerator()
+        writer.train_model()
+        self.assertEqual(writer.version, 1)
+        self.assertIsInstance(writer.model, StreamingToxicityModel)
+
+        reader = ContentModerator()
+        self.assertTrue(reader.load_model())
+        self.assertEqual(reader.version, 1)
+        seed_model = reader.model
+
+        texts = ["the zorblax plot is a glorp"] * 20
+        _, before = reader.predict_toxicity(texts[0])
+        self.assertEqual(writer.learn(texts, [1] * len(texts)), 2)
+        # The reader picks up the new CURRENT version and swaps it in
+        is_toxic, after = reader.predict_toxicity(texts[0])
+        self.assertEqual(reader.version, 2)
+        self.assertIsNot(reader.model, seed_model)
+        self.assertGreater(after, before)
+        self.assertTrue(is_toxic)
+
+    def test_learners_build_on_the_current_version(self):
+        from .moderation_utils import ContentModerator
+
+        first, second = ContentModerator(), ContentModerator()
+        first.train_model()
+        self.assertTrue(second.load_model())
+        seed_samples = second.model.samples_seen
+
+        self.assertEqual(first.learn(["glorp"] * 4, [1] * 4), 2)
+        # second still holds version 1 in memory; its update must not drop first's
+        self.assertEqual(second.learn(["zorblax"] * 3, [1] * 3), 3)
+        self.assertEqual(second.model.samples_seen, seed_samples + 7)
+
+    def test_replay_publishes_one_version(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .moderation_utils import CONFIRMED_CLEAN, CONFIRMED_TOXIC, moderator
+
+        user = User.objects.create_user(username='mod', password='testpass')
+        for i, reason in enumerate([CONFIRMED_TOXIC, CONFIRMED_CLEAN, CONFIRMED_TOXIC]):
+            BookClubPost.objects.create(author=user, title=f"Post {i}", content="glorp" if i != 1 else "lovely",
+                                        moderation_reason=reason)
+        self.addCleanup(setattr, moderator, 'is_trained', False)
+        call_command('update_moderation_model', bootstrap=True, stdout=StringIO())
+        out = StringIO()
+        call_command('update_moderation_model', replay_confirmed=True, batch_size=2, stdout=out)
+        self.assertEqual(moderator.version, 2)
+        self.assertIn('(6 confirmed labels applied', out.getvalue())
+
+    def test_confirmed_labels_are_learned(self):
+        from .moderation_queue import confirm_labels
+        from .moderation_utils import CONFIRMED_CLEAN, moderator
+
+        user = User.objects.create_user(username='mod', password='testpass')
+        post = BookClubPost.objects.create(author=user, title="Hello", content="hello there")
+        with patch.object(moderator, 'learn', return_value=7) as mock_learn:
+            self.assertEqual(confirm_labels(BookClubPost, BookClubPost.objects.all(), False), 7)
+        mock_learn.assert_called_once_with(["Hello", "hello there"], [0, 0])
+        post.refresh_from_db()
+        self.assertEqual(post.moderation_reason, CONFIRMED_CLEAN)
+        self.assertIsNotNone(post.moderated_at)
+
+
+class CollaborativeFilteringTest(TestCase):
+    def setUp(self):
+        self.books = [
+            Book.objects.create(title=f"Book {i}", author="A", genre="G", category="C", price=10)
+            for i in range(4)
+        ]
+        purchases = {
+            'alice': [0, 1],
+            'bob': [0, 1, 2],
+            'carol': [0, 1, 2],
+            'dave': [3],
+        }
+        self.users = {}
+        for name, picks in purchases.items():
+            user = User.objects.create_user(username=name, password='testpass')
+            self.users[name] = user
+            for i in picks:
+                Order.objects.create(user=user, book=self.books[i], status='delivered')
+        # Repeat purchases and carts don't change the signal
+        Order.objects.create(user=self.users['alice'], book=self.books[0], status='confirmed')
+        Order.objects.create(user=self.users['alice'], book=self.books[3], status='cart')
+
+    def test_sparse_matrix_and_item_neighbours(self):
+        from .hybrid_recommendation import CollaborativeModel
+
+        model = CollaborativeModel.build(k=2)
+        self.assertEqual(model.matrix.shape, (4, 4))
+        self.assertEqual(model.matrix.nnz, 9)
+        self.assertTrue(all(n <= 2 for n in model.item_similarity.getnnz(axis=1)))
+        self.assertEqual(model.item_similarity.diagonal().sum(), 0)
+
+        recs = model.recommend(self.users['alice'].id, top_n=5)
+        self.assertEqual([item for item, _ in recs], [f"book_{self.books[2].id}"])
+        self.assertEqual(model.recommend(-1), [])
+
+    def test_blocked_similarity_matches_single_block(self):
+        from .hybrid_recommendation import CollaborativeModel, compute_item_similarity
+
+        matrix = CollaborativeModel.build(k=2).matrix
+        blocked = compute_item_similarity(matrix, k=2, block_size=2)
+        self.assertEqual(blocked.diagonal().sum(), 0)
+        self.assertEqual((blocked != compute_item_similarity(matrix, k=2, block_size=4)).nnz, 0)
+        self.assertGreater(blocked[2, 1], 0)
+
+    def test_hybrid_recommendation_uses_item_item_scores(self):
+        from .hybrid_recommendation import hybrid_recommendation, invalidate_recommendation_model
+
+        invalidate_recommendation_model()
+        self.assertEqual(hybrid_recommendation(self.users['alice'].id, top_n=4), [self.books[2]])
+
+
+class ContentNeighboursTest(TestCase):
+    def test_chunked_top_k_matches_dense_cosine(self):
+        import numpy as np
+        from scipy import sparse
+        from sklearn.preprocessing import normalize
+        from .hybrid_recommendation import top_k_neighbours
+
+        matrix = normalize(sparse.random(60, 40, density=0.2, random_state=0, format='csr'))
+        dense = (matrix @ matrix.T).toarray()
+        np.fill_diagonal(dense, -np.inf)
+
+        neighbours = top_k_neighbours(matrix, k=5, chunk_size=7)
+        self.assertEqual(neighbours.shape, (60, 60))
+        for row in range(60):
+            expected = {i for i in np.argsort(-dense[row])[:5] if dense[row, i] > 0}
+            lo, hi = neighbours.indptr[row], neighbours.indptr[row + 1]
+            self.assertEqual(set(neighbours.indices[lo:hi]), expected)
+            np.testing.assert_allclose(neighbours.data[lo:hi], dense[row, neighbours.indices[lo:hi]], rtol=1e-5)
+
+        pooled = top_k_neighbours(matrix, k=5, chunk_size=7, workers=2)
+        self.assertEqual((pooled != neighbours).nnz, 0)
+
+    def test_content_recommendations_for_book(self):
+        from .hybrid_recommendation import get_recommendations, invalidate_recommendation_model
+
+        dune = Book.objects.create(title="Dune", author="Herbert", genre="Science fiction", category="Novel", price=10, description="desert planet spice")
+        sequel = Book.objects.create(title="Dune Messiah", author="Herbert", genre="Science fiction", category="Novel", price=10, description="desert planet spice emperor")
+        Book.objects.create(title="Cookbook", author="Chef", genre="Cooking", category="Food", price=10, description="recipes")
+        invalidate_recommendation_model()
+        self.assertEqual(get_recommendations(dune.id, top_n=4), [sequel])
+
+
+class AIRecommendationModelTest(TestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'ai_models', 'model.pkl')
+        self.books = [
+            Book.objects.create(title="Emma", author="Austen", genre="Romance", category="Classic", price=10),
+            Book.objects.create(title="Persuasion", author="Austen", genre="Romance", category="Classic", price=10),
+            Book.objects.create(title="Sanditon", author="Austen", genre="Romance", category="Modern", price=10),
+            Book.objects.create(title="Dune", author="Herbert", genre="SciFi", category="Modern", price=10),
+        ]
+
+    def test_sparse_scoring_with_category_boost_and_mtime_reload(self):
+        import os
+        from . import ai_recommendation
+
+        with patch.object(ai_recommendation, 'MODEL_PATH', self.path):
+            recs = ai_recommendation.get_recommendations(self.books[0].id, top_n=2)
+            self.assertEqual(recs, [self.books[1], self.books[2]])
+            model = ai_recommendation.model_cache.get()
+            # Unchanged artifact: served from the process cache, not unpickled again
+            with patch.object(ai_recommendation.pickle, 'load') as mock_load:
+                ai_recommendation.get_recommendations(str(self.books[0].id), top_n=2)
+            mock_load.assert_not_called()
+
+            Book.objects.create(title="Mansfield Park", author="Austen", genre="Romance", category="Classic", price=10)
+            ai_recommendation.train_recommendation_model()
+            stat = os.stat(self.path)
+            os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+            self.assertIsNot(ai_recommendation.model_cache.get(), model)
+            self.assertEqual(len(ai_recommendation.model_cache.get()['book_ids']), 5)
+
+    def test_legacy_artifact_is_converted(self):
+        import os
+        import pickle
+        from . import ai_recommendation
+
+        os.makedirs(os.path.dirname(self.path))
+        legacy = {
+            'tfidf_vectors': [{'classic': 0.5, 'austen': 0.2}, {'classic': 0.5, 'austen': 0.2}, {'scifi': 0.9}],
+            'book_ids': [b.id for b in self.books[:3]],
+            'features': [], 'categories': ['Classic', 'Classic', 'Modern'], 'category_clusters': {},
+        }
+        with open(self.path, 'wb') as f:
+            pickle.dump(legacy, f)
+        with patch.object(ai_recommendation, 'MODEL_PATH', self.path):
+            ranked = ai_recommendation.score_similar_books(ai_recommendation.model_cache.get(), self.books[0].id, top_n=2)
+        self.assertEqual(ranked[0][0], self.books[1].id)
+        self.assertAlmostEqual(ranked[0][1], 1.5, places=5)
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='testpass')
+        self.books = [
+            Book.objects.create(title="Emma", author="Austen", genre="Romance", category="Classic", price=10, rating=3.0, total_sold=4),
+            Book.objects.create(title="Persuasion", author="Austen", genre="Romance", category="Classic", price=10, rating=4.0),
+            Book.objects.create(title="Dune", author="Herbert", genre="SciFi", category="Modern", price=10, rating=4.5),
+        ]
+
+    def test_events_update_rows_incrementally(self):
+        from django.core.cache import cache
+        from .leaderboard import current_score, rebuild_leaderboard, top_book_ids
+        from .models import BookPopularity
+
+        emma, persuasion, dune = self.books
+        order = Order.objects.create(user=self.user, book=persuasion, quantity=3)
+        self.assertEqual(BookPopularity.objects.get(book=persuasion).units_sold, 0)  # still in the cart
+        order.status = 'confirmed'
+        order.save()
+        Review.objects.create(user=self.user, book=dune, rating=1, comment="Slow")
+        Wishlist.objects.create(user=self.user, book=emma)
+
+        row = BookPopularity.objects.get(book=dune)
+        self.assertEqual((row.review_count, row.rating_sum), (1, 1.0))
+        self.assertAlmostEqual(row.rating_score, (1 + 4.5 * 5) / 6)
+        self.assertEqual(top_book_ids('popular'), [persuasion.id, dune.id, emma.id])
+        self.assertEqual(top_book_ids('best_sellers', limit=2), [emma.id, persuasion.id])
+        self.assertEqual(top_book_ids('top_rated', genre='Romance'), [persuasion.id, emma.id])
+
+        # Lists are cached; a cancelled order shows up once they expire
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(BookPopularity.objects.get(book=persuasion).units_sold, 0)
+        self.assertEqual(top_book_ids('popular')[0], persuasion.id)
+        cache.clear()
+        self.assertEqual(top_book_ids('popular')[0], dune.id)
+
+        # A rebuild from the event tables yields the same decayed scores, relative to a new landmark
+        now = timezone.now()
+        incremental = {row.book_id: current_score(row.score, now) for row in BookPopularity.objects.all()}
+        rebuild_leaderboard()
+        for row in BookPopularity.objects.all():
+            score = current_score(row.score, now)
+            self.assertAlmostEqual(score, incremental[row.book_id], delta=1e-6 * max(1.0, score))
+
+    def test_decay_and_api(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .leaderboard import current_score, decay_factor
+
+        now = timezone.now()
+        self.assertAlmostEqual(decay_factor(now - timedelta(days=7)) / decay_factor(now), 0.5)
+        self.assertAlmostEqual(current_score(decay_factor(now), now), 1.0)
+
+        response = self.client.get('/api/leaderboard/', {'board': 'top_rated', 'category': 'Classic', 'limit': 1})
+        self.assertEqual([book['title'] for book in response.json()], ["Persuasion"])
+        self.assertEqual(self.client.get('/api/leaderboard/', {'board': 'unknown'}).status_code, 400)
+
+    def test_short_half_life_does_not_overflow_and_rebuild_moves_landmark(self):
+        from datetime import timedelta
+        from django.test import override_settings
+        from .leaderboard import decay_landmark, rebuild_leaderboard
+        from .models import BookPopularity, LeaderboardState
+
+        LeaderboardState.objects.update_or_create(pk=1, defaults={'decay_landmark': timezone.now() - timedelta(days=3000)})
+        with override_settings(LEADERBOARD={'half_life_days': 1}):
+            Wishlist.objects.create(user=self.user, book=self.books[0])
+            self.assertLess(BookPopularity.objects.get(book=self.books[0]).score, float('inf'))
+
+            rebuild_leaderboard()
+            self.assertLess(timezone.now() - decay_landmark(), timedelta(minutes=1))
+            self.assertAlmostEqual(BookPopularity.objects.get(book=self.books[0]).score, 2.0, places=3)
+
+
+class BackgroundTaskTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='testpass')
+        self.book = Book.objects.create(title="Emma", author="Austen", genre="Romance", category="Classic", price=10)
+        self.shipping = {'first_name': 'A', 'last_name': 'B', 'address': '1 Road', 'city': 'C', 'state': 'S', 'zip': '1'}
+
+    @patch('books.views.send_order_confirmation_email')
+    def test_order_confirmation_runs_once_per_order_set(self, mock_send):
+        from .tasks import queue_order_confirmation
+
+        order = Order.objects.create(user=self.user, book=self.book, status='confirmed')
+        self.assertIsNotNone(queue_order_confirmation(self.user, [order.id], self.shipping))
+        # A repeated payment callback for the same orders is dropped
+        self.assertIsNone(queue_order_confirmation(self.user, [order.id], self.shipping))
+        mock_send.assert_called_once()
+        user, order_ids, _, pdf_buffer = mock_send.call_args.args
+        self.assertEqual((user, order_ids), (self.user, [order.id]))
+        self.assertTrue(pdf_buffer.getvalue().startswith(b'%PDF'))
+
+    def test_failures_are_retried_on_workers_only(self):
+        from celery.canvas import Signature
+        from celery.exceptions import Retry
+        from . import tasks
+
+        # Eager: the task fails once instead of re-running inside the request
+        with patch('books.moderation_queue.drain_pending', side_effect=RuntimeError('database busy')) as drain:
+            result = tasks.enqueue(tasks.moderate_pending)
+        self.assertEqual(drain.call_count, 1)
+        self.assertTrue(result.failed())
+
+        # On a worker the failure is published again with a backoff
+        tasks.moderate_pending.push_request(id='worker-task', is_eager=False, called_directly=False, retries=0)
+        self.addCleanup(tasks.moderate_pending.pop_request)
+        with patch('books.moderation_queue.drain_pending', side_effect=RuntimeError('database busy')), \
+                patch.object(Signature, 'apply_async') as publish:
+            with self.assertRaises(Retry):
+                tasks.moderate_pending.run()
+        publish.assert_called_once()
+
+    def test_tasks_are_published_to_named_queues(self):
+        from bookstore.celery import app
+        from . import tasks
+
+        # Not eager: messages go to the in-memory broker instead of running
+        app.conf.CELERY_TASK_ALWAYS_EAGER = False
+        self.addCleanup(setattr, app.conf, 'CELERY_TASK_ALWAYS_EAGER', True)
+        with patch.object(tasks.moderate_pending, 'run') as run:
+            with self.captureOnCommitCallbacks(execute=True):
+                tasks.queue_moderation()
+                tasks.queue_moderation()
+            tasks.queue_order_confirmation(self.user, [1, 2], self.shipping)
+        run.assert_not_called()
+
+        with app.connection_for_write() as connection:
+            with connection.SimpleQueue('ml') as queue:
+                message = queue.get(timeout=1)
+                message.ack()
+                self.assertEqual(message.headers['task'], 'books.tasks.moderate_pending')
+                self.assertEqual(queue.qsize(), 0)  # the second call was coalesced
+            with connection.SimpleQueue('pdf') as queue:
+                message = queue.get(timeout=1)
+                message.ack()
+                self.assertEqual(message.headers['task'], 'books.tasks.render_invoice')
+
+
+class PricingTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(username='shopper', password='testpass')
+        self.books = [
+            Book.objects.create(title=f"Book {i}", author="Author", genre="Fiction", category="Novel", price=20)
+            for i in range(3)
+        ]
+
+    def test_prices_come_from_active_deal_index(self):
+        from datetime import timedelta
+        from decimal import Decimal
+        from django.utils import timezone
+        from .models import Deal
+        from . import pricing
+
+        now = timezone.now()
+        Deal.objects.create(book=self.books[0], discount_percentage=25,
+                            start_date=now - timedelta(days=1), end_date=now + timedelta(hours=1))
+        Deal.objects.create(book=self.books[1], discount_percentage=50,
+                            start_date=now + timedelta(hours=2), end_date=now + timedelta(hours=3))
+
+        self.assertEqual(self.books[0].current_price, Decimal('15'))
+        with self.assertNumQueries(0):
+            prices = [book.current_price for book in self.books]
+            self.assertEqual(self.books[0].get_active_deal().discount_percentage, 25)
+        self.assertEqual(prices, [Decimal('15'), Decimal('20'), Decimal('20')])
+
+        # The index rolls over at deal boundaries without any save
+        with patch('books.pricing.timezone.now', return_value=now + timedelta(hours=2, minutes=30)):
+            self.assertEqual(self.books[0].current_price, Decimal('20'))
+            self.assertEqual(self.books[1].current_price, Decimal('10'))
+
+        # Deleting a deal reloads the index
+        Deal.objects.filter(book=self.books[0]).first().delete()
+        self.assertIsNone(pricing.get_active_deal(self.books[0].id))
+
+    def test_deal_changes_from_other_processes_are_noticed(self):
+        from datetime import timedelta
+        from decimal import Decimal
+        from django.utils import timezone
+        from .models import Deal
+        from . import pricing
+
+        now = timezone.now()
+        deal = Deal.objects.create(book=self.books[0], discount_percentage=25,
+                                   start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+        self.assertEqual(self.books[0].current_price, Decimal('15'))
+
+        # Another process edits the deal: no local signal, no shared cache
+        with patch('books.pricing.invalidate_deals'):
+            deal.discount_percentage = 50
+            deal.save()
+        self.assertEqual(self.books[0].current_price, Decimal('15'))
+        with patch.object(pricing, 'CHANGE_CHECK_INTERVAL', 0):
+            with self.assertNumQueries(3):
+                self.assertEqual(self.books[0].current_price, Decimal('10'))
+            with self.assertNumQueries(1):
+                self.assertEqual(self.books[1].current_price, Decimal('20'))
+
+    def test_orders_and_cart_use_deal_prices(self):
+        from datetime import timedelta
+        from decimal import Decimal
+        from django.utils import timezone
+        from .models import Deal
+
+        now = timezone.now()
+        Deal.objects.create(book=self.books[2], discount_percentage=10,
+                            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+        order = Order.objects.create(user=self.user, book=self.books[2], quantity=2)
+        self.assertEqual(order.total_price, Decimal('36'))
+        Order.objects.create(user=self.user, book=self.books[0], quantity=1)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['total'], Decimal('56'))
+
+
+class FacetCountsTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.seller = User.objects.create_user(username='seller', password='testpass')
+        self.books = [
+            Book.objects.create(title="Emma", author="Austen", genre="Romance", category="Classic", price=10),
+            Book.objects.create(title="Persuasion", author="Austen", genre="Romance", category="Classic", price=10),
+            Book.objects.create(title="Dune", author="Herbert", genre="SciFi", category="Modern", price=10),
+        ]
+
+    def test_counts_are_maintained_from_signals(self):
+        from . import facets
+
+        self.assertEqual(facets.counts('book_author'), {'Austen': 2, 'Herbert': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            dune = self.books[2]
+            dune.category = 'Classic'
+            dune.save()
+            self.books[0].delete()
+            listing = UserBook.objects.create(seller=self.seller, title="Used Dune", author="Herbert", genre="SciFi",
+                                              category="Modern", price=5, condition='like_new')
+
+        # Applied in place: reading the lists costs no query
+        with self.assertNumQueries(0):
+            self.assertEqual(facets.counts('book_category'), {'Classic': 2})
+            self.assertEqual(facets.counts('book_author'), {'Austen': 1, 'Herbert': 1})
+            self.assertEqual(facets.choices('listing_condition', UserBook.CONDITION_CHOICES),
+                             [('like_new', 'Like New', 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.is_available = False
+            listing.save()
+        self.assertEqual(facets.counts('listing_category'), {})
+
+        # Another process changed the catalog: this one rebuilds
+        facets.invalidate_facets()
+        Book.objects.filter(pk=dune.pk).update(genre='Classics')
+        self.assertEqual(facets.values('book_genre'), ['Classics', 'Romance'])
+
+    def test_views_render_facets_with_counts(self):
+        UserBook.objects.create(seller=self.seller, title="Used Emma", author="Austen", genre="Romance",
+                                category="Classic", price=5)
+        response = self.client.get(reverse('book_list'))
+        self.assertContains(response, 'Classic (2)')
+        self.assertContains(response, 'SciFi (1)')
+
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('marketplace'))
+        self.assertEqual(response.context['conditions'], [('good', 'Good', 1)])
+        self.assertContains(response, 'Classic (1)')
+
+
+class TextSearchTest(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='testpass')
+        self.hobbit = Book.objects.create(title="The Hobbit", author="J.R.R. Tolkien", genre="Fantasy",
+                                          category="Classic", price=10, description="A journey to the Lonely Mountain")
+        self.silmarillion = Book.objects.create(title="The Silmarillion", author="J.R.R. Tolkien", genre="Fantasy",
+                                                category="Classic", price=10, description="Tales of hobbits' ancestors")
+        Book.objects.create(title="Dune", author="Frank Herbert", genre="SciFi", category="Modern", price=10)
+
+    def test_prefix_queries_ranked_by_bm25(self):
+        from . import text_search
+
+        # Title matches outweigh description matches
+        self.assertEqual(list(text_search.search(Book.objects.all(), 'hobb')), [self.hobbit, self.silmarillion])
+        self.assertEqual(list(text_search.search(Book.objects.all(), 'tolk mount')), [self.hobbit])
+        self.assertEqual(text_search.search(Book.objects.all(), 'tolkien herbert').count(), 0)
+        self.assertEqual(text_search.search(Book.objects.all(), 'tolkien herbert', match_any=True).count(), 3)
+        # FTS operators in user input are ignored
+        self.assertEqual(list(text_search.search(Book.objects.all(), '"hobbit" -*')), [self.hobbit, self.silmarillion])
+
+        # Triggers keep the index in sync with updates and deletes
+        self.hobbit.title = "There and Back Again"
+        self.hobbit.save()
+        self.assertEqual(list(text_search.search(Book.objects.all(), 'back again')), [self.hobbit])
+        self.silmarillion.delete()
+        self.assertEqual(list(text_search.search(Book.objects.all(), 'hobb')), [])
+
+    def test_ranking_and_paging_run_in_the_database(self):
+        from . import text_search
+
+        Book.objects.bulk_create([
+            Book(title=f"The Tale {i}", author="Anon", genre="Fantasy", category="Classic", price=10)
+            for i in range(500)
+        ])
+        matches = text_search.search(Book.objects.all(), 'the')
+        # The query does not grow with the number of matches
+        self.assertEqual(len(matches.query.sql_with_params()[1]), 2)
+        self.assertEqual(matches.count(), 502)
+        ranked = [row_id for row_id, _ in text_search.search_ids(Book, 'the', limit=3)]
+        self.assertEqual([book.id for book in matches[:3]], ranked)
+        self.assertEqual(len(text_search.search(Book.objects.all(), 'tale', limit=10)), 10)
+
+    def test_book_list_and_marketplace_use_index(self):
+        UserBook.objects.create(seller=self.seller, title="Used Hobbit", author="Tolkien", genre="Fantasy",
+                                category="Classic", price=5)
+        UserBook.objects.create(seller=self.seller, title="Sold Hobbit", author="Tolkien", genre="Fantasy",
+                                category="Classic", price=5, is_available=False)
+
+        with patch('books.views.semantic_search_books', return_value=[]):
+            response = self.client.get(reverse('book_list'), {'q': 'hobbit'})
+        self.assertEqual(list(response.context['books']), [self.hobbit, self.silmarillion])
+
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('marketplace'), {'q': 'hobb'})
+        self.assertEqual([listing.title for listing in response.context['books']], ["Used Hobbit"])
@@ -39,6 +39,8 @@ urlpatterns = [
     path('api/process-payment/', views.api_process_payment, name='api_process_payment'),
     path('api/payment/webhook/', views.api_payment_webhook, name='api_payment_webhook'),
     path('api/welcome/', views.api_welcome, name='api_welcome'),
+    path('api/leaderboard/', views.api_leaderboard, name='api_leaderboard'),
+    path('api/search-cache/stats/', views.api_search_cache_stats, name='api_search_cache_stats'),
 
     # User book selling URLs
     path('sell-book/', views.sell_book, name='sell_book'),
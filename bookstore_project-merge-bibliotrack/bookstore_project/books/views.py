@@ -12,51 +12,27 @@ from django.conf import settings
 from django.http import JsonResponse, HttpResponse
 from django.template.loader import get_template
 from django.core.mail import send_mail
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from .models import Book, Review, Order, Wishlist, UserBook, ChatMessage, BookClubPost, BookClubComment, BookClubPostLike, BookClubCommentLike, RecentlyViewed, Deal, SellerRating, UserProfile
 from .serializers import BookSerializer
 from django.conf import settings
-import razorpay
 import random
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
 from io import BytesIO
 from datetime import datetime
-import imagehash
-from PIL import Image
-try:
-    import numpy as np
-except Exception:
-    np = None
-
-# Optional AI/ML features: provide safe fallbacks when heavy libraries are missing
-try:
-    from .ai_recommendation import get_recommendations
-except Exception:
-    def get_recommendations(*args, **kwargs):
-        return []
-
-try:
-    from .visual_search import find_similar_books_enhanced
-except Exception:
-    def find_similar_books_enhanced(*args, **kwargs):
-        return []
-
-try:
-    from .semantic_search import semantic_search_books
-except Exception:
-    def semantic_search_books(*args, **kwargs):
-        return []
-
-try:
-    from .advanced_visual_search import find_similar_books_advanced
-except Exception:
-    def find_similar_books_advanced(*args, **kwargs):
-        return []
+from .lazy_imports import lazy_import, optional_feature
+from . import facets, leaderboard, pricing, text_search
+from .tasks import queue_listing_index, queue_moderation, queue_order_confirmation
+
+# Payment SDK and the optional AI/ML features are imported on first use, not at
+# worker start; the ML features fall back to empty results when their libraries are missing
+razorpay = lazy_import('razorpay')
+get_recommendations = optional_feature('.ai_recommendation', 'get_recommendations', lambda *args, **kwargs: [], __package__)
+find_similar_books_enhanced = optional_feature('.visual_search', 'find_similar_books_enhanced', lambda *args, **kwargs: [], __package__)
+semantic_search_books = optional_feature('.semantic_search', 'semantic_search_books', lambda *args, **kwargs: [], __package__)
+find_similar_books_advanced = optional_feature('.advanced_visual_search', 'find_similar_books_advanced', lambda *args, **kwargs: [], __package__)
+
 from .models import PaymentEvent
 
 import logging
@@ -68,22 +44,50 @@ def api_welcome(request):
     logger.info(f"Request: {request.method} {request.path}")
     return Response({'message': 'Welcome to the API'})
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def api_search_cache_stats(request):
+    """Hit/miss counters of the semantic search query cache in this worker."""
+    from .query_cache import get_stats
+    return Response(get_stats())
+
+@api_view(['GET'])
+def api_leaderboard(request):
+    """Top books of a leaderboard (popular, best_sellers, top_rated), optionally per genre or category."""
+    board = request.GET.get('board', 'popular')
+    if board not in leaderboard.BOARDS:
+        return Response({'error': f'Unknown leaderboard: {board}'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    books = leaderboard.top_books(
+        board,
+        genre=request.GET.get('genre') or None,
+        category=request.GET.get('category') or None,
+        limit=limit,
+    )
+    return Response(BookSerializer(books, many=True).data)
+
 def home(request):
     featured_books = Book.objects.filter(is_featured=True)[:6]
     recent_books = Book.objects.order_by('-created_at')[:6]
-    best_sellers = Book.objects.order_by('-total_sold')[:6]
-    # Top trending books: sort by rating, then by total_sold for tie-breaks — show top 10
-    top_books = Book.objects.order_by('-rating', '-total_sold')[:10]
-    # dynamic lists for navbar/sections
-    all_categories = list(Book.objects.values_list('category', flat=True).distinct())
-    all_genres = list(Book.objects.values_list('genre', flat=True).distinct())
-    all_authors = list(Book.objects.values_list('author', flat=True).distinct())
+    best_sellers = leaderboard.top_books('best_sellers', limit=6)
+    # Top trending books: highest rated, from the materialized leaderboard — show top 10
+    top_books = leaderboard.top_books('top_rated', limit=10)
+    # Deals running right now, from the in-memory active-deal index
+    active_deals = pricing.deals_on_sale(limit=3)
+    # dynamic lists for navbar/sections, from the in-memory facet counts
+    all_categories = facets.values('book_category')
+    all_genres = facets.values('book_genre')
+    all_authors = facets.values('book_author')
 
     context = {
         'featured_books': featured_books,
         'recent_books': recent_books,
         'best_sellers': best_sellers,
         'top_books': top_books,
+        'active_deals': active_deals,
         'all_categories': all_categories,
         'all_genres': all_genres,
         'all_authors': all_authors,
@@ -93,9 +97,8 @@ def home(request):
 
 def authors_list(request):
     """List authors and basic stats."""
-    # Get authors and count of books per author
-    from django.db.models import Count
-    authors = Book.objects.values('author').annotate(count=Count('id')).order_by('-count')
+    # Authors and count of books per author, most books first
+    authors = [{'author': author, 'count': count} for author, count in facets.counts('book_author').items()]
     return render(request, 'books/authors.html', {'authors': authors})
 
 @cache_page(60 * 15)  # Cache for 15 minutes
@@ -119,12 +122,8 @@ def book_list(request):
             preserved_order = Case(*[When(id=id_val, then=pos) for pos, id_val in enumerate(book_ids)])
             books = books.order_by(preserved_order)
         else:
-            # Fallback to basic text search
-            books = books.filter(
-                Q(title__icontains=query) |
-                Q(author__icontains=query) |
-                Q(description__icontains=query)
-            )
+            # Fallback to the full-text index, best matches first
+            books = text_search.search(books, query)
 
     # Apply filters
     if category:
@@ -144,9 +143,9 @@ def book_list(request):
     else:
         books = books.order_by('title')
 
-    # Get unique categories and genres for filter dropdowns
-    categories = Book.objects.values_list('category', flat=True).distinct()
-    genres = Book.objects.values_list('genre', flat=True).distinct()
+    # (value, label, count) for the filter dropdowns
+    categories = facets.choices('book_category')
+    genres = facets.choices('book_genre')
 
     context = {
         'books': books,
@@ -190,9 +189,9 @@ def book_detail(request, pk):
         'similar_books': similar_books,
         'average_rating': reviews.aggregate(Avg('rating'))['rating__avg'] if reviews else 0,
         # Add top lists for sidebar/footer display
-        'top_books': list(Book.objects.order_by('-rating', '-total_sold')[:10]),
-        'all_categories': list(Book.objects.values_list('category', flat=True).distinct()),
-        'all_genres': list(Book.objects.values_list('genre', flat=True).distinct()),
+        'top_books': leaderboard.top_books('top_rated', limit=10),
+        'all_categories': facets.values('book_category'),
+        'all_genres': facets.values('book_genre'),
     }
     return render(request, 'books/book_detail.html', context)
 
@@ -218,6 +217,18 @@ def add_review(request, pk):
 
     return redirect('book_detail', pk=pk)
 
+def _visible_forum_rows(queryset, user):
+    """
+    Forum posts or comments a user may see: those the moderation worker passed.
+    Authors also see their own pending or flagged rows, staff see everything.
+    """
+    if user.is_staff:
+        return queryset
+    visible = Q(is_moderated=False, moderated_at__isnull=False)
+    if user.is_authenticated:
+        visible |= Q(author=user)
+    return queryset.filter(visible)
+
 def book_club(request):
     """Display book club forum posts."""
     query = request.GET.get('q', '')
@@ -225,7 +236,8 @@ def book_club(request):
     sort_by = request.GET.get('sort', 'recent')
     page = request.GET.get('page', 1)
 
-    posts = BookClubPost.objects.all()
+    # Hide posts the moderation worker flagged or has not classified yet
+    posts = _visible_forum_rows(BookClubPost.objects.all(), request.user)
 
     # Apply search filters
     if query:
@@ -273,9 +285,9 @@ def book_club(request):
     from django.utils import timezone
     from datetime import timedelta
     week_ago = timezone.now() - timedelta(days=7)
-    trending_posts = BookClubPost.objects.filter(
+    trending_posts = _visible_forum_rows(BookClubPost.objects.filter(
         created_at__gte=week_ago
-    ).annotate(
+    ), request.user).annotate(
         recent_comments=Count('comments', filter=Q(comments__created_at__gte=week_ago))
     ).order_by('-recent_comments')[:5]
 
@@ -290,9 +302,9 @@ def book_club(request):
                 post__in=user_posts
             ).values_list('author', flat=True).distinct()
 
-            recommendations = BookClubPost.objects.filter(
+            recommendations = _visible_forum_rows(BookClubPost.objects.filter(
                 author__in=commenter_ids
-            ).exclude(author=request.user).order_by('-created_at')[:3]
+            ), request.user).exclude(author=request.user).order_by('-created_at')[:3]
 
     # Calculate total comments
     total_comments = sum(post.comment_count for post in posts)
@@ -312,8 +324,9 @@ def book_club(request):
 
 def post_detail(request, pk):
     """Display individual forum post with comments."""
-    post = get_object_or_404(BookClubPost, pk=pk)
-    comments = post.comments.all().order_by('created_at')
+    # Flagged and pending posts are 404 to anyone but their author and staff
+    post = get_object_or_404(_visible_forum_rows(BookClubPost.objects.all(), request.user), pk=pk)
+    comments = _visible_forum_rows(post.comments.all(), request.user).order_by('created_at')
 
     # Check if user liked the post
     post_liked = False
@@ -344,24 +357,13 @@ def create_post(request):
         content = request.POST.get('content')
 
         if title and content:
-            # Moderate content
-            from .moderation_utils import moderate_forum_content
-            title_moderation = moderate_forum_content(title)
-            content_moderation = moderate_forum_content(content)
-
-            # Check if content is flagged
-            if title_moderation['is_flagged'] or content_moderation['is_flagged']:
-                messages.error(request, 'Your post contains inappropriate content and cannot be posted.')
-                return render(request, 'books/create_post.html', {
-                    'title': title,
-                    'content': content
-                })
-
+            # Saved as pending; the ml workers classify it in their next batch
             post = BookClubPost.objects.create(
                 author=request.user,
                 title=title,
                 content=content
             )
+            queue_moderation()
             messages.success(request, 'Post created successfully!')
             return redirect('post_detail', pk=post.pk)
         else:
@@ -372,26 +374,19 @@ def create_post(request):
 @login_required
 def create_comment(request, post_id):
     """Create a comment on a forum post."""
-    post = get_object_or_404(BookClubPost, pk=post_id)
+    post = get_object_or_404(_visible_forum_rows(BookClubPost.objects.all(), request.user), pk=post_id)
 
     if request.method == 'POST':
         content = request.POST.get('content')
 
         if content:
-            # Moderate content
-            from .moderation_utils import moderate_forum_content
-            content_moderation = moderate_forum_content(content)
-
-            # Check if content is flagged
-            if content_moderation['is_flagged']:
-                messages.error(request, 'Your comment contains inappropriate content and cannot be posted.')
-                return redirect('post_detail', pk=post_id)
-
+            # Saved as pending; the ml workers classify it in their next batch
             BookClubComment.objects.create(
                 author=request.user,
                 post=post,
                 content=content
             )
+            queue_moderation()
             messages.success(request, 'Comment added successfully!')
         else:
             messages.error(request, 'Please provide comment content.')
@@ -401,7 +396,7 @@ def create_comment(request, post_id):
 @login_required
 def like_post(request, post_id):
     """Like or unlike a forum post."""
-    post = get_object_or_404(BookClubPost, pk=post_id)
+    post = get_object_or_404(_visible_forum_rows(BookClubPost.objects.all(), request.user), pk=post_id)
 
     like, created = BookClubPostLike.objects.get_or_create(
         user=request.user,
@@ -433,7 +428,7 @@ def like_post(request, post_id):
 @login_required
 def like_comment(request, comment_id):
     """Like or unlike a forum comment."""
-    comment = get_object_or_404(BookClubComment, pk=comment_id)
+    comment = get_object_or_404(_visible_forum_rows(BookClubComment.objects.all(), request.user), pk=comment_id)
 
     like, created = BookClubCommentLike.objects.get_or_create(
         user=request.user,
@@ -581,8 +576,9 @@ def user_dashboard(request):
 @login_required
 def cart(request):
     """Display user's shopping cart."""
-    cart_items = Order.objects.filter(user=request.user, status='cart')
-    total = sum(item.total_price for item in cart_items)
+    cart_items = Order.objects.filter(user=request.user, status='cart').select_related('book', 'user_book')
+    # Repriced with today's deals (no Deal queries, see pricing.py)
+    total = pricing.order_total(cart_items)
 
     context = {
         'cart_items': cart_items,
@@ -593,12 +589,12 @@ def cart(request):
 @login_required
 def checkout(request):
     """Handle checkout process."""
-    cart_items = Order.objects.filter(user=request.user, status='cart')
+    cart_items = Order.objects.filter(user=request.user, status='cart').select_related('book', 'user_book')
     if not cart_items:
         messages.error(request, 'Your cart is empty.')
         return redirect('cart')
 
-    total = sum(item.total_price for item in cart_items)
+    total = pricing.order_total(cart_items)
 
     if request.method == 'POST':
         # Process payment and create order
@@ -645,12 +641,8 @@ def checkout(request):
             except Exception:
                 pass
 
-            # Send confirmation email
-            try:
-                pdf_buffer = generate_invoice_pdf(order_ids, shipping_info)
-                send_order_confirmation_email(request.user, order_ids, shipping_info, pdf_buffer)
-            except Exception:
-                pass
+            # Invoice and confirmation email are rendered and sent by the pdf/email workers
+            queue_order_confirmation(request.user, order_ids, shipping_info)
 
             # Return JSON for AJAX caller
             return JsonResponse({'success': True, 'order_id': order_ids[0] if order_ids else None})
@@ -670,9 +662,8 @@ def checkout(request):
             item.save()
             order_ids.append(item.id)
 
-        # Send confirmation email
-        pdf_buffer = generate_invoice_pdf(order_ids, shipping_info)
-        send_order_confirmation_email(request.user, order_ids, shipping_info, pdf_buffer)
+        # Invoice and confirmation email are rendered and sent by the pdf/email workers
+        queue_order_confirmation(request.user, order_ids, shipping_info)
 
         messages.success(request, 'Order placed successfully!')
         return redirect('order_confirmation', order_id=order_ids[0])
@@ -799,7 +790,7 @@ def sell_book(request):
         condition = request.POST.get('condition')
         cover_image = request.FILES.get('cover_image')
 
-        UserBook.objects.create(
+        listing = UserBook.objects.create(
             seller=request.user,
             title=title,
             author=author,
@@ -811,6 +802,8 @@ def sell_book(request):
             cover_image=cover_image,
             is_available=True
         )
+        # Embedding and cover signatures are computed by the ml workers
+        queue_listing_index(listing)
 
         messages.success(request, 'Book listed for sale successfully!')
         return redirect('my_listings')
@@ -843,6 +836,7 @@ def edit_listing(request, pk):
             listing.cover_image = request.FILES.get('cover_image')
 
         listing.save()
+        queue_listing_index(listing)
         messages.success(request, 'Listing updated successfully!')
         return redirect('my_listings')
 
@@ -895,11 +889,7 @@ def marketplace(request):
     books = UserBook.objects.filter(is_available=True)
 
     if query:
-        books = books.filter(
-            Q(title__icontains=query) |
-            Q(author__icontains=query) |
-            Q(description__icontains=query)
-        )
+        books = text_search.search(books, query)
 
     if category:
         books = books.filter(category__iexact=category)
@@ -916,17 +906,20 @@ def marketplace(request):
         books = books.order_by('-created_at')
     elif sort_by == 'oldest':
         books = books.order_by('created_at')
-    else:
-        # Default ordering
+    elif not query:
+        # Default ordering (searches keep their relevance order)
         books = books.order_by('-created_at')
 
-    categories = UserBook.objects.values_list('category', flat=True).distinct()
+    # (value, label, count) of available listings for the filter dropdowns
+    categories = facets.choices('listing_category')
+    conditions = facets.choices('listing_condition', UserBook.CONDITION_CHOICES)
 
     context = {
         'books': books,
         'query': query,
         'selected_category': category,
         'categories': categories,
+        'conditions': conditions,
         # Provide 'user_books' for compatibility with template
         'user_books': books,
         'selected_condition': condition,
@@ -1098,44 +1091,24 @@ def api_rag_chat(request):
     # If OpenAI embedding not available, try local sentence-transformers
     if query_embedding is None:
         try:
-            from sentence_transformers import SentenceTransformer
-            model = SentenceTransformer('all-MiniLM-L6-v2')
-            emb = model.encode([message], convert_to_numpy=False)[0]
-            query_embedding = list(emb)
+            from .model_registry import get_sentence_transformer
+            model = get_sentence_transformer()
+            if model is not None:
+                query_embedding = model.encode([message], convert_to_numpy=True)[0]
         except Exception:
             query_embedding = None
 
-    # If we have an embedding, find top-K by cosine similarity
+    # If we have an embedding, find top-K through the shared embedding index
     context_items = []
     if query_embedding is not None:
-        import numpy as np
-        from .models import Book, UserBook
-
-        def cosine(a, b):
-            a = np.array(a)
-            b = np.array(b)
-            denom = (np.linalg.norm(a) * np.linalg.norm(b))
-            return float(np.dot(a, b) / denom) if denom != 0 else 0.0
-
-        candidates = []
-        books = Book.objects.exclude(semantic_embedding__isnull=True).exclude(semantic_embedding__exact=[])
-        for b in books:
-            try:
-                score = cosine(query_embedding, b.semantic_embedding)
-                candidates.append((b, score))
-            except Exception:
-                continue
+        from .embedding_index import get_embedding_index, hydrate
 
-        ubooks = UserBook.objects.filter(is_available=True).exclude(semantic_embedding__isnull=True).exclude(semantic_embedding__exact=[])
-        for ub in ubooks:
-            try:
-                score = cosine(query_embedding, ub.semantic_embedding)
-                candidates.append((ub, score))
-            except Exception:
-                continue
-
-        candidates.sort(key=lambda x: x[1], reverse=True)
-        top = candidates[:top_k]
+        try:
+            index = get_embedding_index()
+            index.ensure_built()
+            top = hydrate(index.search(query_embedding, top_n=top_k))
+        except Exception:
+            top = []
         for obj, score in top:
             title = getattr(obj, 'title', '')
             author = getattr(obj, 'author', '')
@@ -1217,7 +1190,10 @@ def api_visual_search(request):
 
     try:
         # Use advanced visual search
-        similar_books = find_similar_books_advanced(image_file, top_n=10)
+        mode = request.data.get('mode')
+        if mode not in ('two_stage', 'exhaustive'):
+            mode = None
+        similar_books = find_similar_books_advanced(image_file, top_n=10, mode=mode)
         results = []
         for book, score in similar_books:
             # Resolve cover image URL safely across different Book model variations
@@ -1313,10 +1289,10 @@ def api_process_payment(request):
             }
         )
 
-        # Send confirmation email (send_mail is patched in tests as books.views.send_mail)
-        if processed_order_ids and request.user and request.user.email:
-            pdf_buffer = generate_invoice_pdf(processed_order_ids, shipping_info)
-            send_order_confirmation_email(request.user, processed_order_ids, shipping_info, pdf_buffer)
+        # Send confirmation email in the background (send_mail is patched in tests as books.views.send_mail);
+        # keyed by the order ids, so a repeated callback never mails twice
+        if processed_order_ids and request.user and request.user.is_authenticated:
+            queue_order_confirmation(request.user, processed_order_ids, shipping_info)
 
         return Response({'success': True})
 
@@ -1369,6 +1345,11 @@ def api_payment_webhook(request):
 # Helper Functions
 def generate_invoice_pdf(order_ids, shipping_info):
     """Generate PDF invoice for orders."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib import colors
+
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
     styles = getSampleStyleSheet()
@@ -4,6 +4,7 @@ import requests
 from io import BytesIO
 from PIL import Image
 from .models import Book, UserBook
+from .embedding_index import get_visual_feature_index, hydrate
 
 def cosine_similarity_manual(a, b):
     """Compute cosine similarity between two vectors."""
@@ -12,16 +13,18 @@ def cosine_similarity_manual(a, b):
     norm_b = np.linalg.norm(b)
     return dot_product / (norm_a * norm_b) if norm_a != 0 and norm_b != 0 else 0
 
-def extract_features_from_image(img):
-    """Extract features from PIL Image using simple color histogram."""
+def _image_feature_array(img):
     # Convert to RGB if necessary to ensure consistent feature dimensions
     if img.mode != 'RGB':
         img = img.convert('RGB')
     img = img.resize((64, 64))
-    img_array = np.array(img)
+    img_array = np.asarray(img, dtype=np.float32)
     # Simple feature extraction: flatten and normalize
-    features = img_array.flatten() / 255.0
-    return features.tolist()
+    return img_array.ravel() / 255.0
+
+def extract_features_from_image(img):
+    """Extract features from PIL Image using simple color histogram."""
+    return _image_feature_array(img).tolist()
 
 def extract_features_from_url(image_url):
     """Extract features from image URL."""
@@ -45,7 +48,6 @@ def extract_features_from_path(img_path):
 
 def find_similar_books_enhanced(uploaded_image, top_n=5):
     """Find visually similar books using simple features and cosine similarity."""
-    from django.core.cache import cache
     import logging
     logger = logging.getLogger(__name__)
 
@@ -53,7 +55,7 @@ def find_similar_books_enhanced(uploaded_image, top_n=5):
         # Extract features from uploaded image
         if hasattr(uploaded_image, 'read'):  # File-like object
             img = Image.open(uploaded_image)
-            uploaded_features = extract_features_from_image(img)
+            uploaded_features = _image_feature_array(img)
         else:  # Assume it's a path
             uploaded_features = extract_features_from_path(uploaded_image)
 
@@ -61,59 +63,21 @@ def find_similar_books_enhanced(uploaded_image, top_n=5):
             logger.warning("Could not extract features from uploaded image")
             return Book.objects.all()[:top_n]
 
-        uploaded_features = np.array(uploaded_features).reshape(1, -1)
+        # Score against the cached, pre-normalized catalog feature matrix in one matmul;
+        # only reasonably similar items (> 0.5) are kept, via a NumPy mask
+        index = get_visual_feature_index()
+        index.ensure_built()
+        ranked = index.search(uploaded_features, top_n=top_n, min_score=0.5)
 
-        # Use caching for book features
-        cache_key = 'book_features'
-        cached_features = cache.get(cache_key)
-
-        if cached_features is None:
-            # Get all books with features using select_related for optimization
-            books_with_features = Book.objects.exclude(image_features__isnull=True).select_related()
-            user_books_with_features = UserBook.objects.filter(
-                is_available=True
-            ).exclude(
-                image_features__isnull=True
-            ).select_related('seller')
-
-            # Pre-process all features
-            book_features = []
-            for book in books_with_features:
-                try:
-                    features = np.array(book.image_features).reshape(1, -1)
-                    book_features.append((book, features, 'book'))
-                except (ValueError, TypeError) as e:
-                    logger.error(f"Error processing book {book.id}: {e}")
-                    continue
-
-            for user_book in user_books_with_features:
-                try:
-                    features = np.array(user_book.image_features).reshape(1, -1)
-                    book_features.append((user_book, features, 'user_book'))
-                except (ValueError, TypeError) as e:
-                    logger.error(f"Error processing user_book {user_book.id}: {e}")
-                    continue
-
-            cache.set(cache_key, book_features, 60 * 15)  # Cache for 15 minutes
-            cached_features = book_features
-
-        # Calculate similarities using vectorized operations
-        similarities = []
-        for book, features, book_type in cached_features:
-            try:
-                similarity = cosine_similarity_manual(uploaded_features.flatten(), features.flatten())
-                if similarity > 0.5:  # Only include reasonably similar items
-                    similarities.append((book, similarity, book_type))
-            except (ValueError, TypeError) as e:
-                logger.error(f"Error calculating similarity for {book_type} {book.id}: {e}")
-                continue
-
-        # Sort by similarity (higher is better)
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        # Hydrate only the final top-k, one in_bulk query per model
+        similarities = [
+            (obj, score, 'user_book' if isinstance(obj, UserBook) else 'book')
+            for obj, score in hydrate(ranked)
+        ]
 
         # Log the results
         logger.info(f"Found {len(similarities)} similar books")
-        return similarities[:top_n]
+        return similarities
 
     except Exception as e:
         logger.error(f"Error in enhanced visual search: {e}")
@@ -142,7 +106,7 @@ def find_similar_books(uploaded_image_path, top_n=5):
         # Compare with Book model
         for book in books_with_features:
             try:
-                book_features = np.array(book.image_features).reshape(1, -1)
+                book_features = np.asarray(book.image_features).reshape(1, -1)
                 similarity = cosine_similarity_manual(uploaded_features.flatten(), book_features.flatten())
                 similarities.append((book, similarity))
             except (ValueError, TypeError) as e:
@@ -152,7 +116,7 @@ def find_similar_books(uploaded_image_path, top_n=5):
         # Compare with UserBook model
         for user_book in user_books_with_features:
             try:
-                book_features = np.array(user_book.image_features).reshape(1, -1)
+                book_features = np.asarray(user_book.image_features).reshape(1, -1)
                 similarity = cosine_similarity_manual(uploaded_features.flatten(), book_features.flatten())
                 similarities.append((user_book, similarity))
             except (ValueError, TypeError) as e:
@@ -0,0 +1,17 @@
+"""
+Celery application for the background tasks in books/tasks.py.
+
+Run a worker per queue (or one worker for all of them):
+
+    celery -A bookstore worker -Q ml,email,pdf
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookstore.settings')
+
+app = Celery('bookstore')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
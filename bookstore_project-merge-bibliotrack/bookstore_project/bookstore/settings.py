@@ -143,6 +143,81 @@ PAYMENT_CANCEL_URL = 'payment_cancel'
 # Order expiry time in minutes
 ORDER_EXPIRY_MINUTES = 30
 
+# Semantic search index (books/embedding_index.py)
+# backend: 'flat' = exact search, 'ivf' = approximate k-means inverted lists.
+# nprobe is the IVF recall/latency knob; nlist=None picks ~4*sqrt(N) lists.
+SEMANTIC_INDEX = {
+    'backend': os.environ.get('SEMANTIC_INDEX_BACKEND', 'flat'),
+    'nlist': None,
+    'nprobe': int(os.environ.get('SEMANTIC_INDEX_NPROBE', 8)),
+}
+
+# Visual search: 'two_stage' picks candidates by perceptual-hash Hamming distance and
+# re-ranks them with the cover descriptor; 'exhaustive' scores the whole catalog
+VISUAL_SEARCH = {
+    'mode': os.environ.get('VISUAL_SEARCH_MODE', 'two_stage'),
+    'candidates': int(os.environ.get('VISUAL_SEARCH_CANDIDATES', 200)),
+}
+
+# Recommendations (books/hybrid_recommendation.py): processes used for the chunked
+# content-similarity computation in train_recommendation_model()
+RECOMMENDATIONS = {
+    'similarity_workers': int(os.environ.get('RECOMMENDATION_SIMILARITY_WORKERS', 1)),
+}
+
+# Forum moderation model (books/moderation_utils.py): versioned online-learning artifacts
+# live in model_dir (CURRENT names the active one); running processes check for a newer
+# version every reload_interval seconds
+MODERATION = {
+    'model_dir': BASE_DIR / 'books' / 'models' / 'moderation',
+    'reload_interval': int(os.environ.get('MODERATION_RELOAD_INTERVAL', 30)),
+}
+
+# Popularity leaderboards (books/leaderboard.py): event weights decay with the given
+# half-life; the top list_size ids of each list are cached for list_timeout seconds
+LEADERBOARD = {
+    'half_life_days': float(os.environ.get('LEADERBOARD_HALF_LIFE_DAYS', 7)),
+    'list_size': 50,
+    'list_timeout': int(os.environ.get('LEADERBOARD_LIST_TIMEOUT', 300)),
+}
+
+# The default cache carries the stamps and version counters that tell every web and
+# worker process to reload its in-memory indexes (search, facets, leaderboard,
+# recommendations) and the task idempotency keys, so deployments with more than one
+# process must point CACHE_URL at a shared Redis (e.g. redis://localhost:6379/1).
+# Without it each process gets a private local-memory cache (fine for development
+# and tests; `manage.py check --deploy` warns about it).
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Background tasks (books/tasks.py) run on Celery workers with one queue per kind of
+# work (ml, email, pdf). Eager mode (tasks run inside the request that queues them,
+# without retries) is the default only with DEBUG and no CELERY_BROKER_URL, which is
+# what the tests rely on; elsewhere it must be asked for with CELERY_TASK_ALWAYS_EAGER.
+# books.tasks logs at startup when tasks won't reach workers outside DEBUG.
+# Idempotency keys are claimed in the default cache (see CACHE_URL above).
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'memory://')
+CELERY_TASK_ALWAYS_EAGER = os.environ.get(
+    'CELERY_TASK_ALWAYS_EAGER', str(DEBUG and CELERY_BROKER_URL == 'memory://')
+).lower() in ('1', 'true', 'yes')
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 # Email settings for invoice delivery
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'  # Use your email provider's SMTP server
@@ -156,3 +231,7 @@ DEFAULT_FROM_EMAIL = 'your-email@gmail.com'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Models loaded at worker start by books.model_registry.warm_up_from_settings()
+# (comma-separated names, e.g. "all-MiniLM-L6-v2"); others load on first use
+MODEL_WARMUP = [name for name in os.environ.get('MODEL_WARMUP', '').split(',') if name]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bookstore.settings")
 
 application = get_wsgi_application()
+
+# Load the models named in settings.MODEL_WARMUP now, so no request pays for it
+from books.model_registry import warm_up_from_settings  # noqa: E402
+
+warm_up_from_settings()
@@ -182,8 +182,10 @@ class BiblioBot:
         return Book.objects.filter(author__icontains=author)[:limit]
 
     def _get_top_rated_books(self, limit=5):
-        """Get top-rated books"""
-        return Book.objects.filter(average_rating__gte=4.0).order_by('-average_rating')[:limit]
+        """Get top-rated books (from the materialized leaderboard)"""
+        from recommendations.leaderboard import top_books
+
+        return top_books('top_rated', limit=limit, min_rating=4.0)
 
     def process_message(self, message, user, session):
         """Process user message and return bot response"""
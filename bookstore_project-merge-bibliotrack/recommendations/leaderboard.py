@@ -0,0 +1,193 @@
+"""
+Materialized popularity leaderboards.
+
+Each book has one BookPopularity row, adjusted with a single UPDATE whenever a
+user interaction (view, wishlist, cart, review, purchase) is recorded or the
+book's rating changes (see signals.py). "Popular" and "top rated" lists are an
+indexed ORDER BY ... LIMIT on that table, and their top ids are cached for
+LEADERBOARD["list_timeout"] seconds.
+
+Popularity uses forward decay: an interaction of weight w at time t adds
+w * 2 ** ((t - landmark) / half_life) to the stored score, so ordering by the
+stored score is the same as ordering by the decayed score at any moment. The
+landmark is kept in the LeaderboardState row; `python manage.py
+rebuild_leaderboard` recomputes every row relative to a new landmark (now) and
+should run regularly (e.g. daily) to keep the stored scores small. The exponent
+is clamped to MAX_DECAY_EXPONENT, so a stale landmark never overflows.
+"""
+
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Landmark of the scores stored before LeaderboardState existed (see migration 0003)
+DECAY_EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+MAX_DECAY_EXPONENT = 512  # 2 ** 512 is about 1e154, well inside float range
+LEADERBOARD_STAMP_CACHE_KEY = "leaderboard_stamp"
+
+BOARDS = {
+    'popular': ('-score', 'book_id'),
+    'top_rated': ('-average_rating', '-total_ratings', 'book_id'),
+}
+
+DEFAULTS = {
+    'half_life_days': 7.0,
+    'list_size': 50,
+    'list_timeout': 300,
+}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'LEADERBOARD', {})}
+
+
+def decay_landmark():
+    """The time the stored scores are relative to"""
+    from .models import LeaderboardState
+
+    state, _ = LeaderboardState.objects.get_or_create(pk=1, defaults={'decay_landmark': timezone.now()})
+    return state.decay_landmark
+
+
+def decay_factor(when=None, landmark=None):
+    """Forward-decay multiplier for an event at `when` (default: now), relative to the landmark"""
+    when = when or timezone.now()
+    landmark = landmark or decay_landmark()
+    half_life = _config()['half_life_days'] * 86400
+    exponent = (when - landmark).total_seconds() / half_life
+    return 2.0 ** max(-MAX_DECAY_EXPONENT, min(MAX_DECAY_EXPONENT, exponent))
+
+
+def current_score(stored_score, now=None):
+    """The decayed popularity, as of now, of a stored (forward-decayed) score"""
+    return stored_score / decay_factor(now)
+
+
+def _row_for(book):
+    from .models import BookPopularity
+
+    return BookPopularity(
+        book_id=book.id,
+        genre=book.genre,
+        average_rating=book.average_rating,
+        total_ratings=book.total_ratings,
+    )
+
+
+def record_interaction(book_id, weight, count=1, when=None):
+    """
+    Add an interaction's weight to a book's row with a single UPDATE.
+
+    count is +1 for a new interaction and 0 when an existing one is reinforced;
+    a negative weight and count with the original time undo an interaction.
+    """
+    from books.models import Book
+    from .models import BookPopularity
+
+    changes = {
+        'score': F('score') + weight * decay_factor(when),
+        'interaction_count': F('interaction_count') + count,
+    }
+    rows = BookPopularity.objects.filter(book_id=book_id)
+    if not rows.update(**changes):
+        book = Book.objects.filter(pk=book_id).only('id', 'genre', 'average_rating', 'total_ratings').first()
+        if book is not None:
+            BookPopularity.objects.bulk_create([_row_for(book)], ignore_conflicts=True)
+            rows.update(**changes)
+
+
+def sync_book(book):
+    """Copy the list-relevant Book columns onto its leaderboard row"""
+    from .models import BookPopularity
+
+    updated = BookPopularity.objects.filter(book_id=book.pk).update(
+        genre=book.genre, average_rating=book.average_rating, total_ratings=book.total_ratings,
+    )
+    if not updated:
+        BookPopularity.objects.bulk_create([_row_for(book)], ignore_conflicts=True)
+
+
+def top_book_ids(board='popular', genre=None, limit=10, min_rating=None):
+    """
+    Ids of the top books of a leaderboard, best first, optionally within one genre
+    and only books with an average rating of at least min_rating
+    """
+    from .models import BookPopularity
+
+    if board not in BOARDS:
+        raise ValueError(f"Unknown leaderboard: {board}")
+    config = _config()
+    stamp = cache.get(LEADERBOARD_STAMP_CACHE_KEY) or 'initial'
+    key = f"leaderboard:{stamp}:{board}:{genre or ''}:{'' if min_rating is None else min_rating}"
+    ids = cache.get(key)
+    if ids is None or (len(ids) < limit and len(ids) == config['list_size']):
+        rows = BookPopularity.objects.all()
+        if genre:
+            rows = rows.filter(genre=genre)
+        if min_rating is not None:
+            rows = rows.filter(average_rating__gte=min_rating)
+        ids = list(rows.order_by(*BOARDS[board]).values_list('book_id', flat=True)[:max(limit, config['list_size'])])
+        cache.set(key, ids, config['list_timeout'])
+    return ids[:limit]
+
+
+def top_books(board='popular', genre=None, limit=10, min_rating=None):
+    """Top books of a leaderboard as Book instances (one in_bulk query)"""
+    from books.models import Book
+
+    ids = top_book_ids(board, genre=genre, limit=limit, min_rating=min_rating)
+    books = Book.objects.in_bulk(ids)
+    return [books[book_id] for book_id in ids if book_id in books]
+
+
+def interaction_counts():
+    """{book_id: number of user interactions} for the whole catalog, from the leaderboard table"""
+    from .models import BookPopularity
+
+    return dict(BookPopularity.objects.filter(interaction_count__gt=0).values_list('book_id', 'interaction_count'))
+
+
+def invalidate_lists():
+    """Make every process re-read the top lists from the table"""
+    cache.set(LEADERBOARD_STAMP_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def rebuild_leaderboard(chunk_size=2000):
+    """
+    Recompute every leaderboard row from the books and user interactions, relative
+    to a new decay landmark (now); returns the row count
+    """
+    from books.models import Book
+    from .models import BookPopularity, LeaderboardState, UserInteraction
+
+    landmark = timezone.now()
+    scores = defaultdict(float)
+    counts = defaultdict(int)
+    interactions = UserInteraction.objects.values_list('book_id', 'weight', 'timestamp')
+    for book_id, weight, timestamp in interactions.iterator(chunk_size=chunk_size):
+        scores[book_id] += weight * decay_factor(timestamp, landmark)
+        counts[book_id] += 1
+
+    rows = []
+    for book in Book.objects.only('id', 'genre', 'average_rating', 'total_ratings').iterator(chunk_size=chunk_size):
+        row = _row_for(book)
+        row.score = scores.get(book.id, 0.0)
+        row.interaction_count = counts.get(book.id, 0)
+        rows.append(row)
+
+    with transaction.atomic():
+        LeaderboardState.objects.update_or_create(pk=1, defaults={'decay_landmark': landmark})
+        BookPopularity.objects.all().delete()
+        BookPopularity.objects.bulk_create(rows, batch_size=chunk_size)
+    invalidate_lists()
+    logger.info(f"Rebuilt leaderboard for {len(rows)} books")
+    return len(rows)
@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F, OuterRef, Q, Subquery
+from recommendations.models import Recommendation, UserInteraction
+from recommendations.recommendation_engine import recompute_users
+from recommendations.user_index import get_user_index, invalidate_user_index
+
+
+class Command(BaseCommand):
+    help = 'Recompute and store the top-K recommendations of every active user, in parallel shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes computing shards (default: 1, in-process)',
+        )
+        parser.add_argument(
+            '--shard-size',
+            type=int,
+            default=200,
+            help='Users per shard; each shard is written in one transaction (default: 200)',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=12,
+            help='Recommendations stored per user (default: 12)',
+        )
+        parser.add_argument(
+            '--changed-only',
+            action='store_true',
+            help='Only users with new interactions since their recommendations were computed, or none stored yet',
+        )
+
+    def _user_ids(self, changed_only):
+        users = User.objects.filter(is_active=True)
+        if changed_only:
+            latest_recommendation = Recommendation.objects.filter(user=OuterRef('pk'))\
+                .order_by('-created_at').values('created_at')[:1]
+            latest_interaction = UserInteraction.objects.filter(user=OuterRef('pk'))\
+                .order_by('-timestamp').values('timestamp')[:1]
+            users = users.annotate(
+                computed_at=Subquery(latest_recommendation),
+                interacted_at=Subquery(latest_interaction),
+            ).filter(Q(computed_at__isnull=True) | Q(interacted_at__gt=F('computed_at')))
+        return list(users.order_by('id').values_list('id', flat=True))
+
+    def handle(self, *args, **options):
+        shard_size = max(1, options['shard_size'])
+        top_k = max(1, options['top_k'])
+        user_ids = self._user_ids(options['changed_only'])
+        shards = [user_ids[i:i + shard_size] for i in range(0, len(user_ids), shard_size)]
+        self.stdout.write(f'Recomputing recommendations for {len(user_ids)} users in {len(shards)} shards')
+
+        started = time.perf_counter()
+        # Start from the current interactions; forked workers inherit the parent's index
+        invalidate_user_index()
+        get_user_index()
+        users = rows = 0
+        if options['workers'] > 1 and len(shards) > 1:
+            # Forked workers must not share the parent's database connection
+            connections.close_all()
+            # Workers run django.setup() so the pool also works with the 'spawn' start method
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+                results = pool.map(recompute_users, shards, [top_k] * len(shards))
+                for shard, (shard_users, shard_rows) in zip(shards, results):
+                    users += shard_users
+                    rows += shard_rows
+                    self.stdout.write(f'Shard up to user {shard[-1]}: {shard_users} users, {shard_rows} rows')
+        else:
+            for shard in shards:
+                shard_users, shard_rows = recompute_users(shard, top_k)
+                users += shard_users
+                rows += shard_rows
+                self.stdout.write(f'Shard up to user {shard[-1]}: {shard_users} users, {shard_rows} rows')
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Stored {rows} recommendations for {users} users in {elapsed:.1f}s '
+                f'({users / elapsed if elapsed else 0:.1f} users/sec)'
+            )
+        )
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:52
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def create_baseline_rows(apps, schema_editor):
+    """One leaderboard row per existing book; rebuild_leaderboard adds the decayed scores."""
+    Book = apps.get_model("books", "Book")
+    BookPopularity = apps.get_model("recommendations", "BookPopularity")
+    UserInteraction = apps.get_model("recommendations", "UserInteraction")
+    counts = dict(UserInteraction.objects.values("book_id").annotate(count=Count("id")).values_list("book_id", "count"))
+    BookPopularity.objects.bulk_create(
+        [
+            BookPopularity(
+                book_id=book["id"],
+                genre=book["genre"],
+                interaction_count=counts.get(book["id"], 0),
+                average_rating=book["average_rating"],
+                total_ratings=book["total_ratings"],
+            )
+            for book in Book.objects.values("id", "genre", "average_rating", "total_ratings").iterator()
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0001_initial"),
+        ("recommendations", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookPopularity",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="popularity",
+                        serialize=False,
+                        to="books.book",
+                    ),
+                ),
+                ("genre", models.CharField(max_length=50)),
+                ("score", models.FloatField(default=0.0)),
+                ("interaction_count", models.IntegerField(default=0)),
+                ("average_rating", models.FloatField(default=0.0)),
+                ("total_ratings", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["-score"], name="rec_popularity_score_idx"),
+                    models.Index(fields=["-average_rating", "-total_ratings"], name="rec_popularity_rating_idx"),
+                    models.Index(fields=["genre", "-score"], name="rec_popularity_genre_idx"),
+                ],
+            },
+        ),
+        migrations.RunPython(create_baseline_rows, migrations.RunPython.noop),
+    ]
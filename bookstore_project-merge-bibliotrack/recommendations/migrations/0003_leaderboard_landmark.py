@@ -0,0 +1,35 @@
+# Generated by Django 4.2.1 on 2026-10-17 04:10
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def rebase_scores(apps, schema_editor):
+    """Move the stored scores from the fixed 2024-01-01 epoch to a landmark of now."""
+    from recommendations import leaderboard
+
+    BookPopularity = apps.get_model("recommendations", "BookPopularity")
+    LeaderboardState = apps.get_model("recommendations", "LeaderboardState")
+    now = timezone.now()
+    factor = leaderboard.decay_factor(now, landmark=leaderboard.DECAY_EPOCH)
+    BookPopularity.objects.update(score=F("score") / factor)
+    LeaderboardState.objects.create(pk=1, decay_landmark=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommendations", "0002_leaderboard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaderboardState",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("decay_landmark", models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(rebase_scores, migrations.RunPython.noop),
+    ]
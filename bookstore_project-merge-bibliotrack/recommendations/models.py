@@ -36,3 +36,31 @@ class Recommendation(models.Model):
 
     def __str__(self):
         return f"Recommendation for {self.user.username}: {self.book.title} ({self.score})"
+
+class BookPopularity(models.Model):
+    """Materialized leaderboard row per book, kept up to date by recommendations/leaderboard.py"""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+    genre = models.CharField(max_length=50)  # copied from Book for per-genre lists
+    score = models.FloatField(default=0.0)  # forward-decayed interaction weight
+    interaction_count = models.IntegerField(default=0)
+    average_rating = models.FloatField(default=0.0)  # copied from Book
+    total_ratings = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], name='rec_popularity_score_idx'),
+            models.Index(fields=['-average_rating', '-total_ratings'], name='rec_popularity_rating_idx'),
+            models.Index(fields=['genre', '-score'], name='rec_popularity_genre_idx'),
+        ]
+
+    def __str__(self):
+        return f"Popularity of book {self.book_id}: {self.score:.3f}"
+
+
+class LeaderboardState(models.Model):
+    """Single row: the landmark the forward-decayed BookPopularity scores are relative to"""
+    decay_landmark = models.DateTimeField()
+
+    def __str__(self):
+        return f"Leaderboard landmark {self.decay_landmark.isoformat()}"
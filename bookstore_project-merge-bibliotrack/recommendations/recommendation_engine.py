@@ -1,118 +1,104 @@
 import numpy as np
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
-from sentence_transformers import SentenceTransformer
-from django.db.models import Avg, Count, Q
-from django.contrib.auth.models import User
-from books.models import Book, Review
+from django.db import transaction
+from books.models import Book
+from books.model_registry import get_sentence_transformer
+from books.embedding_snapshot import book_text, normalize_rows
+from books.semantic_search import semantic_search_engine
 from .models import UserInteraction, Recommendation
+from . import leaderboard
+from .user_index import get_user_index
 from collections import defaultdict
 import logging
 
 logger = logging.getLogger(__name__)
 
 class HybridRecommendationEngine:
-    def __init__(self):
-        self.sentence_model = None
+    @property
+    def sentence_model(self):
+        """The shared SentenceTransformer (loaded on first use by the model registry)"""
+        return get_sentence_transformer()
+
+    def _catalog_embeddings(self, books):
+        """
+        L2-normalized embeddings for books, row-aligned, or None if unavailable.
+
+        Rows come from the shared catalog snapshot; only books missing from it
+        (added since it was built) are encoded, in a single batch.
+        """
+        snapshot = semantic_search_engine.get_snapshot()
+        if snapshot is None or not len(snapshot):
+            return None
+        rows = snapshot.rows_for([book.id for book in books])
+        embeddings = np.zeros((len(books), snapshot.embeddings.shape[1]), dtype=np.float32)
+        found = rows >= 0
+        embeddings[found] = snapshot.embeddings[rows[found]]
+
+        missing = np.flatnonzero(~found)
+        if len(missing):
+            if not self.sentence_model:
+                return embeddings
+            encoded = self.sentence_model.encode([book_text(books[i]) for i in missing], show_progress_bar=False)
+            embeddings[missing] = normalize_rows(encoded)
+        return embeddings
+
+    def _get_content_scores(self, reference_book, all_books):
+        """Cosine similarity of every book to reference_book, as one matrix-vector product"""
         try:
-            self.sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
+            embeddings = self._catalog_embeddings(list(all_books) + [reference_book])
         except Exception as e:
-            logger.warning(f"Could not load SentenceTransformer: {e}")
+            logger.error(f"Error calculating content similarity: {e}")
+            return None
+        if embeddings is None:
+            return None
+        return embeddings[:-1] @ embeddings[-1]
 
     def _get_content_similarity(self, target_book, all_books):
         """Calculate content-based similarity using book features"""
-        if not self.sentence_model:
+        all_books = list(all_books)
+        scores = self._get_content_scores(target_book, all_books)
+        if scores is None:
             return {}
+        return dict(zip([b.id for b in all_books], scores.tolist()))
 
-        # Create text representations
-        book_texts = []
-        for book in all_books:
-            text = f"{book.title} {book.author} {book.description} {book.genre}"
-            book_texts.append(text)
-
-        target_text = f"{target_book.title} {target_book.author} {target_book.description} {target_book.genre}"
-
-        # Get embeddings
-        try:
-            embeddings = self.sentence_model.encode(book_texts + [target_text])
-            target_embedding = embeddings[-1]
-            book_embeddings = embeddings[:-1]
-
-            # Calculate similarities
-            similarities = cosine_similarity([target_embedding], book_embeddings)[0]
-            return dict(zip([b.id for b in all_books], similarities))
-        except Exception as e:
-            logger.error(f"Error calculating content similarity: {e}")
-            return {}
-
-    def _get_collaborative_filtering(self, user, all_books):
+    def _get_collaborative_filtering(self, user, all_books, interactions=None):
         """Calculate collaborative filtering scores"""
         # Get user's interactions
-        user_interactions = UserInteraction.objects.filter(user=user)
-        if not user_interactions.exists():
+        user_interactions = self._get_user_vector(user) if interactions is None else interactions
+        if not user_interactions:
             return {}
 
         # Get similar users based on interaction patterns
-        similar_users = self._find_similar_users(user)
+        similar_users = self._find_similar_users(user, interactions=user_interactions)
         if not similar_users:
             return {}
 
-        # Calculate scores based on similar users' preferences
-        scores = defaultdict(float)
-        user_weights = {u['user_id']: u['similarity'] for u in similar_users}
-
-        for interaction in UserInteraction.objects.filter(user_id__in=user_weights.keys()):
-            if interaction.book_id not in [i.book_id for i in user_interactions]:
-                weight = user_weights[interaction.user_id] * interaction.weight
-                scores[interaction.book_id] += weight
-
-        return dict(scores)
-
-    def _find_similar_users(self, user, top_k=10):
-        """Find users with similar interaction patterns"""
-        # Get all users with interactions
-        all_users = User.objects.filter(
-            userinteraction__isnull=False
-        ).exclude(id=user.id).distinct()
-
-        user_interactions = {i.book_id: i.weight for i in
-                           UserInteraction.objects.filter(user=user)}
-
-        similar_users = []
-
-        for other_user in all_users[:50]:  # Limit for performance
-            other_interactions = {i.book_id: i.weight for i in
-                                UserInteraction.objects.filter(user=other_user)}
-
-            # Calculate cosine similarity between interaction vectors
-            common_books = set(user_interactions.keys()) & set(other_interactions.keys())
+        # Calculate scores based on similar users' preferences (one sparse product)
+        scores = get_user_index().score_books(similar_users)
+        return {book_id: score for book_id, score in scores.items() if book_id not in user_interactions}
 
-            if len(common_books) < 3:  # Need minimum overlap
-                continue
-
-            user_vector = [user_interactions[book] for book in common_books]
-            other_vector = [other_interactions[book] for book in common_books]
+    def _get_user_vector(self, user):
+        """The user's current interactions as {book_id: summed weight}"""
+        vector = defaultdict(float)
+        for book_id, weight in UserInteraction.objects.filter(user=user).values_list('book_id', 'weight'):
+            vector[book_id] += weight
+        return dict(vector)
 
-            similarity = np.dot(user_vector, other_vector) / (
-                np.linalg.norm(user_vector) * np.linalg.norm(other_vector)
-            )
-
-            if similarity > 0.1:  # Minimum similarity threshold
-                similar_users.append({
-                    'user_id': other_user.id,
-                    'similarity': similarity
-                })
-
-        return sorted(similar_users, key=lambda x: x['similarity'], reverse=True)[:top_k]
+    def _find_similar_users(self, user, top_k=10, interactions=None):
+        """Find users with similar interaction patterns across the whole user base"""
+        if interactions is None:
+            interactions = self._get_user_vector(user)
+        # Cosine similarity over common books (at least 3), against every user in the index
+        return get_user_index().similar_users(interactions, exclude_user_id=user.id, top_k=top_k)
 
     def _get_popularity_scores(self, all_books):
         """Calculate popularity-based scores"""
+        # Interaction counts are maintained incrementally in the leaderboard table
+        interaction_counts = leaderboard.interaction_counts()
         scores = {}
         for book in all_books:
             # Combine multiple popularity metrics
             review_score = book.average_rating * book.total_ratings * 0.4
-            interaction_score = UserInteraction.objects.filter(book=book).count() * 0.6
+            interaction_score = interaction_counts.get(book.id, 0) * 0.6
             scores[book.id] = review_score + interaction_score
         return scores
 
@@ -120,8 +106,8 @@ class HybridRecommendationEngine:
         """Get user's genre preferences based on interactions"""
         genre_weights = defaultdict(float)
 
-        for interaction in UserInteraction.objects.filter(user=user):
-            genre_weights[interaction.book.genre] += interaction.weight
+        for genre, weight in UserInteraction.objects.filter(user=user).values_list('book__genre', 'weight'):
+            genre_weights[genre] += weight
 
         # Normalize
         total = sum(genre_weights.values())
@@ -130,23 +116,56 @@ class HybridRecommendationEngine:
 
         return genre_weights
 
-    def generate_recommendations(self, user, top_k=10):
+    def catalog_context(self):
+        """Catalog-wide inputs of generate_recommendations, computed once and shared by a batch of users"""
+        all_books = list(Book.objects.all())
+        popularity_scores = self._get_popularity_scores(all_books)
+        return {
+            'books': all_books,
+            'book_rows': {book.id: row for row, book in enumerate(all_books)},
+            'popularity': popularity_scores,
+            'max_popularity': max(popularity_scores.values()) if popularity_scores else 1,
+        }
+
+    def _context_embeddings(self, context):
+        """Catalog embeddings for the context's books, loaded on first use"""
+        if 'embeddings' not in context:
+            try:
+                context['embeddings'] = self._catalog_embeddings(context['books'])
+            except Exception as e:
+                logger.error(f"Error calculating content similarity: {e}")
+                context['embeddings'] = None
+        return context['embeddings']
+
+    def generate_recommendations(self, user, top_k=10, context=None):
         """Generate hybrid recommendations for a user"""
         # Get all books
-        all_books = list(Book.objects.all())
+        context = context or self.catalog_context()
+        all_books = context['books']
         if not all_books:
             return []
 
         # Get user's existing interactions to exclude
-        user_interactions = set(UserInteraction.objects.filter(user=user)
-                              .values_list('book_id', flat=True))
+        user_vector = self._get_user_vector(user)
+        user_interactions = set(user_vector)
 
         # Calculate different recommendation scores
-        content_scores = {}
-        cf_scores = self._get_collaborative_filtering(user, all_books)
-        popularity_scores = self._get_popularity_scores(all_books)
+        cf_scores = self._get_collaborative_filtering(user, all_books, interactions=user_vector)
+        popularity_scores = context['popularity']
         genre_preferences = self._get_genre_preferences(user)
 
+        # Content similarity (if user has interactions): every book against the user's
+        # most interacted book, from the cached catalog embeddings
+        content_scores = {}
+        if user_interactions:
+            reference_row = context['book_rows'].get(max(user_vector, key=user_vector.get))
+            embeddings = self._context_embeddings(context)
+            if embeddings is not None and reference_row is not None:
+                scores = embeddings @ embeddings[reference_row]
+                content_scores = dict(zip(context['book_rows'], scores.tolist()))
+
+        max_pop = context['max_popularity']
+
         # Hybrid scoring
         recommendations = []
 
@@ -154,21 +173,13 @@ class HybridRecommendationEngine:
             if book.id in user_interactions:
                 continue
 
-            # Content similarity (if user has interactions)
-            content_score = 0
-            if user_interactions:
-                # Use most interacted book as reference
-                reference_book = UserInteraction.objects.filter(user=user)\
-                    .order_by('-weight').first().book
-                content_similarities = self._get_content_similarity(reference_book, [book])
-                content_score = content_similarities.get(book.id, 0)
+            content_score = content_scores.get(book.id, 0)
 
             # Collaborative filtering score
             cf_score = cf_scores.get(book.id, 0)
 
             # Popularity score (normalized)
             pop_score = popularity_scores.get(book.id, 0)
-            max_pop = max(popularity_scores.values()) if popularity_scores else 1
             normalized_pop = pop_score / max_pop if max_pop > 0 else 0
 
             # Genre preference score
@@ -237,20 +248,38 @@ class HybridRecommendationEngine:
 
     def refresh_recommendations(self, user):
         """Refresh recommendations for a user"""
-        # Clear old recommendations
-        Recommendation.objects.filter(user=user).delete()
-
-        # Generate new recommendations
-        recommendations = self.generate_recommendations(user)
-
-        # Save to database
-        for rec in recommendations:
-            Recommendation.objects.create(
-                user=user,
-                book=rec['book'],
-                score=rec['score'],
-                reason=rec['reason']
-            )
+        self.save_recommendations({user.id: self.generate_recommendations(user)})
+
+    def save_recommendations(self, recommendations_by_user):
+        """Replace the stored recommendations of several users ({user_id: recs}) in one transaction"""
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=list(recommendations_by_user)).delete()
+            Recommendation.objects.bulk_create([
+                Recommendation(user_id=user_id, book=rec['book'], score=rec['score'], reason=rec['reason'])
+                for user_id, recs in recommendations_by_user.items()
+                for rec in recs
+            ])
+
+
+def recompute_users(user_ids, top_k=12):
+    """
+    Recompute and store the recommendations of a shard of users.
+
+    Top-level so it can run in a process pool; the catalog-wide inputs are
+    computed once per shard.
+
+    Returns:
+        tuple: (users processed, recommendation rows written)
+    """
+    from django.contrib.auth.models import User
+
+    context = recommendation_engine.catalog_context()
+    batch = {
+        user.id: recommendation_engine.generate_recommendations(user, top_k=top_k, context=context)
+        for user in User.objects.filter(id__in=user_ids).only('id')
+    }
+    recommendation_engine.save_recommendations(batch)
+    return len(batch), sum(len(recs) for recs in batch.values())
 
 # Global instance
 recommendation_engine = HybridRecommendationEngine()
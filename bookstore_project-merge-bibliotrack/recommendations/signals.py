@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from books.models import Book
+from . import leaderboard
+from .models import UserInteraction
+from .tasks import queue_user_index_refresh
+
+
+@receiver(post_save, sender=Book)
+def sync_book_popularity(sender, instance, created=False, update_fields=None, **kwargs):
+    """Keep the book's leaderboard row (genre, rating) in sync with Book saves"""
+    if created or update_fields is None or {'genre', 'average_rating', 'total_ratings'} & set(update_fields):
+        leaderboard.sync_book(instance)
+
+
+@receiver(pre_save, sender=UserInteraction)
+def remember_interaction_weight(sender, instance, **kwargs):
+    """Note the stored weight so a reinforced interaction only adds the difference"""
+    instance._previous_weight = 0.0
+    if instance.pk:
+        instance._previous_weight = UserInteraction.objects.filter(pk=instance.pk).values_list('weight', flat=True).first() or 0.0
+
+
+@receiver(post_save, sender=UserInteraction)
+def record_interaction(sender, instance, created=False, **kwargs):
+    delta = instance.weight - getattr(instance, '_previous_weight', 0.0)
+    if created or delta:
+        leaderboard.record_interaction(instance.book_id, delta, count=1 if created else 0,
+                                       when=instance.timestamp if created else None)
+        transaction.on_commit(queue_user_index_refresh)
+
+
+@receiver(post_delete, sender=UserInteraction)
+def remove_interaction(sender, instance, **kwargs):
+    leaderboard.record_interaction(instance.book_id, -instance.weight, count=-1, when=instance.timestamp)
+    transaction.on_commit(queue_user_index_refresh)
@@ -0,0 +1,111 @@
+"""
+Background recommendation work, run on Celery workers listening on the "recs" queue.
+
+A refresh requested while one is already queued for the same user is dropped,
+so repeated clicks on "refresh" cost one recomputation. Interaction changes
+queue one user-index refresh per USER_INDEX_COALESCE_SECONDS, so every process
+rebuilds its user-vector index from them on next use. On a worker failures are
+retried with exponential backoff and jitter; an eager task fails once instead of
+re-running inside the request.
+"""
+
+import logging
+
+from celery import Task, shared_task
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+REFRESH_DEDUPE_SECONDS = 60
+USER_INDEX_COALESCE_SECONDS = 30
+USER_INDEX_CLAIM_KEY = "recommendations-user-index-refresh"
+
+
+class RecommendationTask(Task):
+    def retry(self, *args, **kwargs):
+        if self.request.is_eager and kwargs.get("exc") is not None:
+            # Eager retries would run again right away inside the request, ignoring the backoff
+            raise kwargs["exc"]
+        return super().retry(*args, **kwargs)
+
+
+def check_eager_mode():
+    """Log at startup when, outside DEBUG, tasks would not run on the workers"""
+    if settings.DEBUG:
+        return
+    if settings.CELERY_TASK_ALWAYS_EAGER:
+        logger.warning("CELERY_TASK_ALWAYS_EAGER is on: background tasks run inside the requests that queue them")
+    elif settings.CELERY_BROKER_URL.startswith("memory://"):
+        logger.error("CELERY_BROKER_URL is not set: background tasks are queued in process memory and never run")
+
+
+def _refresh_claim_key(user_id):
+    return f"recommendations-refresh:{user_id}"
+
+
+@shared_task(
+    base=RecommendationTask,
+    queue="recs",
+    autoretry_for=(Exception,),
+    dont_autoretry_for=(ImportError,),
+    max_retries=5,
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_jitter=True,
+)
+def refresh_user_recommendations(user_id, top_k=12):
+    """Recompute and store one user's recommendations"""
+    from .recommendation_engine import recompute_users
+
+    try:
+        return recompute_users([user_id], top_k=top_k)
+    finally:
+        cache.delete(_refresh_claim_key(user_id))
+
+
+@shared_task(
+    base=RecommendationTask,
+    queue="recs",
+    autoretry_for=(Exception,),
+    max_retries=5,
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_jitter=True,
+)
+def refresh_user_index():
+    """Make every process rebuild its user-vector index from the interactions committed so far"""
+    from .user_index import invalidate_user_index
+
+    # Released first, so interactions committed from now on queue the next refresh
+    cache.delete(USER_INDEX_CLAIM_KEY)
+    invalidate_user_index()
+
+
+def queue_user_index_refresh():
+    """
+    Queue a user-index refresh USER_INDEX_COALESCE_SECONDS from now (right away in
+    eager mode), unless one is already queued.
+
+    Returns:
+        bool: False if a refresh is already queued
+    """
+    # The claim outlives the countdown, in case the task is lost
+    if not cache.add(USER_INDEX_CLAIM_KEY, 1, USER_INDEX_COALESCE_SECONDS * 4):
+        return False
+    refresh_user_index.apply_async(countdown=USER_INDEX_COALESCE_SECONDS)
+    return True
+
+
+def queue_recommendation_refresh(user):
+    """
+    Queue a refresh of the user's recommendations (or run it now in eager mode).
+
+    Returns:
+        bool: False if a refresh for this user is already queued
+    """
+    if not cache.add(_refresh_claim_key(user.id), 1, REFRESH_DEDUPE_SECONDS):
+        logger.info(f"Recommendation refresh already queued for user {user.id}")
+        return False
+    refresh_user_recommendations.delay(user.id)
+    return True
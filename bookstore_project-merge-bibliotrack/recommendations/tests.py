@@ -1,3 +1,264 @@
-from django.test import TestCase
+import tempfile
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from books.models import Book
+from .models import UserInteraction
+
+
+class HybridRecommendationEngineTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='testpass')
+        self.books = [
+            Book.objects.create(title=f"Book {i}", author="Author", isbn=f"97800000000{i:02d}", price=10)
+            for i in range(4)
+        ]
+        UserInteraction.objects.create(user=self.user, book=self.books[0], interaction_type='purchase', weight=5.0)
+
+    def test_content_scores_come_from_catalog_embeddings(self):
+        """Test that candidates are scored against the snapshot without per-book encode calls"""
+        from books.embedding_snapshot import write_snapshot
+        from books.semantic_search import SemanticSearchEngine
+        from . import recommendation_engine as engine_module
+
+        embeddings = [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]]
+        model = MagicMock()
+        model.encode.side_effect = lambda texts, **kwargs: np.array([[0.6, 0.8]] * len(texts))
+        with tempfile.TemporaryDirectory() as directory, override_settings(SEMANTIC_SNAPSHOT_DIR=directory):
+            # The last book was added after the snapshot was built
+            write_snapshot([book.id for book in self.books[:3]], embeddings, directory=directory)
+            with patch.object(engine_module, 'semantic_search_engine', SemanticSearchEngine()), \
+                    patch.object(engine_module, 'get_sentence_transformer', return_value=model):
+                scores = engine_module.recommendation_engine._get_content_similarity(self.books[0], self.books[1:])
+                recommendations = engine_module.recommendation_engine.generate_recommendations(self.user, top_k=3)
+
+        self.assertAlmostEqual(scores[self.books[1].id], 0.9 / np.hypot(0.9, 0.1), places=5)
+        self.assertAlmostEqual(scores[self.books[2].id], 0.0, places=5)
+        self.assertAlmostEqual(scores[self.books[3].id], 0.6, places=5)
+        # Only the book missing from the snapshot is encoded, once per scoring pass
+        self.assertEqual(model.encode.call_count, 2)
+        self.assertEqual(recommendations[0]['book'], self.books[1])
+        self.assertNotIn(self.books[0], [rec['book'] for rec in recommendations])
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(username='fan', password='testpass')
+        self.books = [
+            Book.objects.create(title=f"Book {i}", author="Author", isbn=f"97811111111{i:02d}", price=10,
+                                genre='mystery', average_rating=rating, total_ratings=10)
+            for i, rating in enumerate([3.5, 4.8, 4.2])
+        ]
+
+    def test_interactions_update_rows_incrementally(self):
+        from . import leaderboard
+        from .models import BookPopularity
+        from .recommendation_engine import recommendation_engine
+
+        recommendation_engine.update_user_interactions(self.user, self.books[2], 'purchase')
+        recommendation_engine.update_user_interactions(self.user, self.books[0], 'view')
+        interaction = UserInteraction.objects.create(user=self.user, book=self.books[0], interaction_type='wishlist', weight=2.0)
+
+        self.assertEqual(leaderboard.interaction_counts(), {self.books[0].id: 2, self.books[2].id: 1})
+        self.assertEqual(leaderboard.top_book_ids('popular'), [self.books[2].id, self.books[0].id, self.books[1].id])
+        self.assertEqual(leaderboard.top_book_ids('top_rated', genre='mystery', limit=2), [self.books[1].id, self.books[2].id])
+
+        interaction.delete()
+        row = BookPopularity.objects.get(book=self.books[0])
+        self.assertEqual(row.interaction_count, 1)
+        self.assertAlmostEqual(leaderboard.current_score(row.score, interaction.timestamp), 1.0)
+
+        # The rebuild moves the landmark to now; the decayed scores stay the same
+        now = timezone.now()
+        incremental = {book_id: leaderboard.current_score(score, now)
+                       for book_id, score in BookPopularity.objects.values_list('book_id', 'score')}
+        leaderboard.rebuild_leaderboard()
+        for book_id, score in BookPopularity.objects.values_list('book_id', 'score'):
+            score = leaderboard.current_score(score, now)
+            self.assertAlmostEqual(score, incremental[book_id], delta=1e-6 * max(1.0, score))
+
+    def test_short_half_life_does_not_overflow(self):
+        from datetime import timedelta
+        from . import leaderboard
+        from .models import BookPopularity, LeaderboardState
+
+        LeaderboardState.objects.update_or_create(pk=1, defaults={'decay_landmark': timezone.now() - timedelta(days=3000)})
+        with override_settings(LEADERBOARD={'half_life_days': 1}):
+            UserInteraction.objects.create(user=self.user, book=self.books[0], interaction_type='view', weight=1.0)
+            self.assertLess(BookPopularity.objects.get(book=self.books[0]).score, float('inf'))
+            leaderboard.rebuild_leaderboard()
+            self.assertAlmostEqual(BookPopularity.objects.get(book=self.books[0]).score, 1.0, places=3)
+
+    def test_min_rating_is_applied_in_the_query(self):
+        from . import leaderboard
+
+        self.assertEqual(leaderboard.top_book_ids('top_rated', limit=2, min_rating=4.0), [self.books[1].id, self.books[2].id])
+        self.assertEqual(leaderboard.top_book_ids('top_rated', limit=5, min_rating=4.5), [self.books[1].id])
+        # Each threshold is cached separately from the unfiltered list
+        self.assertEqual(len(leaderboard.top_book_ids('top_rated', limit=5)), 3)
+
+    def test_chatbot_top_rated_reads_leaderboard(self):
+        from chatbot.chatbot_engine import BiblioBot
+
+        bot = BiblioBot()
+        self.assertEqual(bot._get_top_rated_books(limit=3), [self.books[1], self.books[2]])
+        # The list itself comes from the cache; only the books are fetched
+        with self.assertNumQueries(1):
+            bot._get_top_rated_books(limit=3)
+
+
+class UserVectorIndexTest(TestCase):
+    def setUp(self):
+        from .user_index import invalidate_user_index
+
+        invalidate_user_index()
+        self.books = [
+            Book.objects.create(title=f"Book {i}", author="Author", isbn=f"97822222222{i:02d}", price=10)
+            for i in range(6)
+        ]
+        self.user = User.objects.create_user(username='target', password='testpass')
+        for book, weight in zip(self.books[:3], [5.0, 3.0, 1.0]):
+            UserInteraction.objects.create(user=self.user, book=book, interaction_type='purchase', weight=weight)
+
+    def _add_user(self, name, weights, extra_book=None):
+        other = User.objects.create(username=name)
+        UserInteraction.objects.bulk_create([
+            UserInteraction(user=other, book=book, interaction_type='purchase', weight=weight)
+            for book, weight in zip(self.books[:3], weights)
+        ])
+        if extra_book is not None:
+            UserInteraction.objects.create(user=other, book=extra_book, interaction_type='view', weight=1.0)
+        return other
+
+    def test_whole_user_base_is_searched(self):
+        from .recommendation_engine import recommendation_engine
+
+        # 60 dissimilar users registered first; the closest match would be past the old 50-user cap
+        for i in range(60):
+            self._add_user(f"other{i}", [1.0, 1.0, 5.0])
+        twin = self._add_user('twin', [5.0, 3.0, 1.0], extra_book=self.books[4])
+        partial = User.objects.create(username='partial')
+        UserInteraction.objects.create(user=partial, book=self.books[0], interaction_type='purchase', weight=5.0)
+
+        similar = recommendation_engine._find_similar_users(self.user, top_k=3)
+        self.assertEqual(similar[0]['user_id'], twin.id)
+        self.assertAlmostEqual(similar[0]['similarity'], 1.0)
+        # Cosine over the common books, as before
+        expected = (5 + 3 + 5) / (np.sqrt(35) * np.sqrt(27))
+        self.assertAlmostEqual(similar[1]['similarity'], expected)
+        self.assertNotIn(partial.id, [u['user_id'] for u in similar])  # fewer than 3 books in common
+
+        scores = recommendation_engine._get_collaborative_filtering(self.user, self.books)
+        self.assertEqual(set(scores), {self.books[4].id})
+        self.assertAlmostEqual(scores[self.books[4].id], 1.0)
+
+    def test_interaction_changes_refresh_the_index(self):
+        from .recommendation_engine import recommendation_engine
+        from . import tasks
+
+        late = User.objects.create(username='late')
+        self.assertEqual(recommendation_engine._find_similar_users(self.user, top_k=3), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            for book, weight in zip(self.books[:3], [5.0, 3.0, 1.0]):
+                UserInteraction.objects.create(user=late, book=book, interaction_type='purchase', weight=weight)
+        self.assertEqual(recommendation_engine._find_similar_users(self.user, top_k=3)[0]['user_id'], late.id)
+
+        # A burst of interactions queues a single delayed refresh
+        self.addCleanup(tasks.cache.delete, tasks.USER_INDEX_CLAIM_KEY)
+        with patch.object(tasks.refresh_user_index, 'apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                for book in self.books[3:]:
+                    UserInteraction.objects.create(user=late, book=book, interaction_type='view', weight=1.0)
+        apply_async.assert_called_once_with(countdown=tasks.USER_INDEX_COALESCE_SECONDS)
+
+
+class PrecomputeRecommendationsTest(TestCase):
+    def setUp(self):
+        self.books = [
+            Book.objects.create(title=f"Book {i}", author="Author", isbn=f"97833333333{i:02d}", price=10,
+                                genre='mystery', average_rating=4.0, total_ratings=10 + i)
+            for i in range(4)
+        ]
+        self.users = [User.objects.create(username=f"reader{i}") for i in range(3)]
+        UserInteraction.objects.create(user=self.users[0], book=self.books[0], interaction_type='purchase', weight=5.0)
+
+    def test_command_writes_rows_per_shard_and_view_reads_them(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import Recommendation
+        from . import recommendation_engine as engine_module
+
+        out = StringIO()
+        with patch.object(engine_module.semantic_search_engine, 'get_snapshot', return_value=None):
+            call_command('precompute_recommendations', shard_size=2, top_k=2, stdout=out)
+        self.assertIn('3 users', out.getvalue())
+        self.assertIn('users/sec', out.getvalue())
+        self.assertEqual(Recommendation.objects.filter(user=self.users[1]).count(), 2)
+        self.assertFalse(Recommendation.objects.filter(user=self.users[0], book=self.books[0]).exists())
+
+        # Only users with newer interactions are recomputed
+        out = StringIO()
+        call_command('precompute_recommendations', changed_only=True, stdout=out)
+        self.assertIn('for 0 users', out.getvalue())
+
+        self.client.force_login(self.users[1])
+        with patch.object(engine_module.HybridRecommendationEngine, 'generate_recommendations') as generate:
+            response = self.client.get('/recommendations/')
+        generate.assert_not_called()
+        self.assertEqual(len(response.context['recommendations']), 2)
+
+
+class RefreshRecommendationsTaskTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="refresher")
+        self.client.force_login(self.user)
+
+    def test_refresh_runs_on_recs_queue_once_per_user(self):
+        from bibliotrack.celery import app
+        from . import tasks
+
+        self.addCleanup(tasks.cache.delete, tasks._refresh_claim_key(self.user.id))
+        with patch('recommendations.recommendation_engine.recompute_users', return_value=(1, 0)) as recompute:
+            # Eager mode (no broker configured): computed inside the request
+            response = self.client.post('/recommendations/refresh/')
+            self.assertTrue(response.json()['success'])
+            recompute.assert_called_once_with([self.user.id], top_k=12)
+
+            app.conf.CELERY_TASK_ALWAYS_EAGER = False
+            self.addCleanup(setattr, app.conf, 'CELERY_TASK_ALWAYS_EAGER', True)
+            with patch.object(tasks.refresh_user_recommendations, 'apply_async') as apply_async:
+                self.client.post('/recommendations/refresh/')
+                self.client.post('/recommendations/refresh/')
+            apply_async.assert_called_once()
+        self.assertEqual(tasks.refresh_user_recommendations.queue, 'recs')
+
+    def test_first_visit_queues_a_refresh_instead_of_computing(self):
+        from bibliotrack.celery import app
+        from . import tasks
+
+        self.addCleanup(tasks.cache.delete, tasks._refresh_claim_key(self.user.id))
+        app.conf.CELERY_TASK_ALWAYS_EAGER = False
+        self.addCleanup(setattr, app.conf, 'CELERY_TASK_ALWAYS_EAGER', True)
+        with patch('recommendations.recommendation_engine.recompute_users') as recompute, \
+                patch.object(tasks.refresh_user_recommendations, 'apply_async') as apply_async:
+            response = self.client.get('/recommendations/')
+        recompute.assert_not_called()
+        apply_async.assert_called_once()
+        self.assertTrue(response.context['pending'])
+        self.assertContains(response, 'Preparing your recommendations')
+
+    def test_eager_failures_are_not_retried_inside_the_request(self):
+        from . import tasks
+
+        self.addCleanup(tasks.cache.delete, tasks._refresh_claim_key(self.user.id))
+        with patch('recommendations.recommendation_engine.recompute_users', side_effect=RuntimeError('busy')) as recompute:
+            result = tasks.refresh_user_recommendations.delay(self.user.id)
+        self.assertEqual(recompute.call_count, 1)
+        self.assertTrue(result.failed())
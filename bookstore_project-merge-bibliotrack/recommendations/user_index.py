@@ -0,0 +1,154 @@
+"""
+Sparse user-vector index for collaborative filtering.
+
+All UserInteraction rows are loaded once into a users x books CSR matrix
+(weights of a user's interactions with the same book are summed). Finding the
+users similar to someone is then a handful of sparse products over the columns
+of the books that person interacted with, so every user is considered and the
+cost is bounded by the interactions on those books rather than by the size of
+the user base.
+
+Similarity is the cosine over the books two users have in common, with at
+least MIN_OVERLAP of them, as the engine has always computed it.
+
+The matrix is kept in process memory and rebuilt after INDEX_TIMEOUT seconds,
+or when invalidate_user_index() publishes a new stamp: UserInteraction signals
+queue that (coalesced) on the "recs" queue, see tasks.refresh_user_index, and
+precompute_recommendations does it before a run.
+"""
+
+import threading
+import time
+import uuid
+import logging
+
+import numpy as np
+from scipy import sparse
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+INDEX_TIMEOUT = 60 * 10
+INDEX_STAMP_CACHE_KEY = "user_vector_index_stamp"
+MIN_OVERLAP = 3  # books in common needed before two users are compared
+MIN_SIMILARITY = 0.1
+
+
+class UserVectorIndex:
+    def __init__(self, matrix, user_ids, book_ids):
+        matrix = sparse.csr_matrix(matrix, dtype=np.float64)
+        matrix.eliminate_zeros()
+        self.matrix = matrix
+        self.by_book = matrix.tocsc()
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.book_ids = np.asarray(book_ids, dtype=np.int64)
+        self.book_index = {int(book_id): col for col, book_id in enumerate(self.book_ids)}
+
+    @classmethod
+    def build(cls, chunk_size=10000):
+        """Load every user interaction into the index"""
+        from .models import UserInteraction
+
+        rows = UserInteraction.objects.values_list('user_id', 'book_id', 'weight')
+        users, books, weights = [], [], []
+        for user_id, book_id, weight in rows.iterator(chunk_size=chunk_size):
+            users.append(user_id)
+            books.append(book_id)
+            weights.append(weight)
+
+        user_ids, user_rows = np.unique(np.asarray(users, dtype=np.int64), return_inverse=True)
+        book_ids, book_cols = np.unique(np.asarray(books, dtype=np.int64), return_inverse=True)
+        # Duplicate (user, book) entries are summed by the COO -> CSR conversion
+        matrix = sparse.coo_matrix(
+            (np.asarray(weights, dtype=np.float64), (user_rows, book_cols)),
+            shape=(len(user_ids), len(book_ids)),
+        )
+        return cls(matrix, user_ids, book_ids)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def similar_users(self, interactions, exclude_user_id=None, top_k=10,
+                      min_overlap=MIN_OVERLAP, min_similarity=MIN_SIMILARITY):
+        """
+        Users whose interactions resemble `interactions` ({book_id: weight}).
+
+        Returns:
+            list: {'user_id', 'similarity'} dicts, most similar first
+        """
+        known = [(self.book_index[book_id], weight) for book_id, weight in interactions.items()
+                 if book_id in self.book_index and weight]
+        if len(known) < min_overlap or not len(self):
+            return []
+        cols = np.fromiter((col for col, _ in known), dtype=np.int64, count=len(known))
+        weights = np.fromiter((weight for _, weight in known), dtype=np.float64, count=len(known))
+
+        # Only the columns of the target's books matter: users x |target books|
+        sub = self.by_book[:, cols].tocsr()
+        overlap = np.diff(sub.indptr)
+        pattern = sub.copy()
+        pattern.data[:] = 1.0
+
+        dot = sub @ weights
+        # Both norms are taken over the books in common only
+        target_norms = np.sqrt(pattern @ (weights ** 2))
+        other_norms = np.sqrt(np.asarray(sub.multiply(sub).sum(axis=1)).ravel())
+
+        candidates = overlap >= min_overlap
+        if exclude_user_id is not None:
+            candidates &= self.user_ids != exclude_user_id
+        similarity = np.zeros(len(self), dtype=np.float64)
+        denominators = target_norms[candidates] * other_norms[candidates]
+        similarity[candidates] = np.divide(dot[candidates], denominators,
+                                           out=np.zeros_like(denominators), where=denominators > 0)
+
+        matches = np.flatnonzero(similarity > min_similarity)
+        if len(matches) > top_k:
+            matches = matches[np.argpartition(-similarity[matches], top_k - 1)[:top_k]]
+        matches = matches[np.argsort(-similarity[matches], kind='stable')]
+        return [{'user_id': int(self.user_ids[row]), 'similarity': float(similarity[row])} for row in matches]
+
+    def score_books(self, similar_users):
+        """
+        Sum of each similar user's interaction weights, scaled by their similarity.
+
+        Returns:
+            dict: {book_id: score} for every book those users interacted with
+        """
+        if not similar_users:
+            return {}
+        rows = np.searchsorted(self.user_ids, [u['user_id'] for u in similar_users])
+        user_weights = sparse.csr_matrix(
+            ([u['similarity'] for u in similar_users], (np.zeros(len(rows), dtype=np.int64), rows)),
+            shape=(1, len(self)),
+        )
+        scores = (user_weights @ self.matrix).tocoo()
+        return {int(self.book_ids[col]): float(score) for col, score in zip(scores.col, scores.data)}
+
+
+_index_lock = threading.Lock()
+_index_state = {'index': None, 'built_at': 0.0, 'stamp': None}
+
+
+def _is_fresh(state, stamp):
+    return state['index'] is not None and state['stamp'] == stamp and time.monotonic() - state['built_at'] < INDEX_TIMEOUT
+
+
+def get_user_index():
+    """The process-level user-vector index, rebuilt when stale"""
+    stamp = cache.get(INDEX_STAMP_CACHE_KEY)
+    if _is_fresh(_index_state, stamp):
+        return _index_state['index']
+    with _index_lock:
+        if not _is_fresh(_index_state, stamp):
+            started = time.perf_counter()
+            index = UserVectorIndex.build()
+            _index_state.update(index=index, built_at=time.monotonic(), stamp=stamp)
+            logger.info(f"Built user vector index ({len(index)} users) in {time.perf_counter() - started:.2f}s")
+        return _index_state['index']
+
+
+def invalidate_user_index():
+    """Make every process rebuild its user-vector index on next use"""
+    cache.set(INDEX_STAMP_CACHE_KEY, uuid.uuid4().hex, None)
+    _index_state['index'] = None
@@ -8,25 +8,20 @@ from .recommendation_engine import recommendation_engine
 @login_required
 def recommendations_view(request):
     """Display personalized recommendations for the user"""
-    # Get cached recommendations or generate new ones
+    # Recommendations are precomputed by `manage.py precompute_recommendations`
     recommendations = Recommendation.objects.filter(user=request.user)\
         .select_related('book')[:12]  # Limit to 12 for display
 
-    if not recommendations.exists():
-        # Generate recommendations if none exist
-        recs = recommendation_engine.generate_recommendations(request.user, top_k=12)
-        recommendations = []
-        for rec in recs:
-            # Create temporary objects for display
-            class TempRec:
-                def __init__(self, book, score, reason):
-                    self.book = book
-                    self.score = score
-                    self.reason = reason
-            recommendations.append(TempRec(rec['book'], rec['score'], rec['reason']))
+    pending = not recommendations.exists()
+    if pending:
+        # First visit before the next batch run: computed on the "recs" queue, shown on a later visit
+        from .tasks import queue_recommendation_refresh
+
+        queue_recommendation_refresh(request.user)
 
     context = {
         'recommendations': recommendations,
+        'pending': pending,
     }
     return render(request, 'recommendations/recommendations.html', context)
 
@@ -35,7 +30,10 @@ def recommendations_view(request):
 def refresh_recommendations(request):
     """Refresh recommendations for the user"""
     try:
-        recommendation_engine.refresh_recommendations(request.user)
+        # Recomputed on the "recs" queue; the page picks the new rows up on reload
+        from .tasks import queue_recommendation_refresh
+
+        queue_recommendation_refresh(request.user)
         return JsonResponse({'success': True, 'message': 'Recommendations refreshed!'})
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)})
@@ -47,11 +45,13 @@ def similar_books(request, book_id):
 
     try:
         target_book = Book.objects.get(id=book_id)
-        all_books = Book.objects.exclude(id=book_id)[:20]  # Limit for performance
+        all_books = list(Book.objects.exclude(id=book_id))
+        books_by_id = {book.id: book for book in all_books}
 
+        # One matrix-vector product over the cached catalog embeddings
         similarities = recommendation_engine._get_content_similarity(target_book, all_books)
         similar_books = sorted(
-            [(book, score) for book, score in similarities.items() if score > 0.3],
+            [(books_by_id[pk], score) for pk, score in similarities.items() if score > 0.3],
             key=lambda x: x[1],
             reverse=True
         )[:6]  # Top 6 similar books